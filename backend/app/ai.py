@@ -5,39 +5,22 @@ Hanterar konversationer och bokningar med dedupliceringssystem
 
 import os
 import json
+import asyncio
 from datetime import datetime, timedelta
-from pathlib import Path
-from typing import List, Dict, Any, Optional
+from types import SimpleNamespace
+from typing import AsyncIterator, BinaryIO, List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
-from groq import Groq
 from sqlalchemy.orm import Session
 
-from . import crud, schemas
+from . import crud, dedup, llm, prompts, schemas
+from .database import api_session, run_db
+from .transcriptions import transcription_cache, transcription_key
 
 # Ladda environment variables från .env
 load_dotenv()
 
-# Dedupliceringssystem: Håller koll på vilka bokningar som redan skapats
-# Key: session_id + event_hash, Value: event_id
-_CREATED_EVENTS_CACHE: Dict[str, int] = {}
-
-# Timeout för cache-entries (10 minuter)
-_CACHE_TIMEOUT = 600
-_CACHE_TIMESTAMPS: Dict[str, float] = {}
-
-
-def _clean_old_cache_entries():
-    """Rensa gamla cache-entries för att undvika minnesläckor"""
-    current_time = datetime.now().timestamp()
-    keys_to_remove = [
-        key for key, timestamp in _CACHE_TIMESTAMPS.items()
-        if current_time - timestamp > _CACHE_TIMEOUT
-    ]
-    for key in keys_to_remove:
-        _CREATED_EVENTS_CACHE.pop(key, None)
-        _CACHE_TIMESTAMPS.pop(key, None)
-
 
+# Dedupliceringssystem: se dedup.py (bokningar reserveras per session + hash)
 def _create_event_hash(event_data: Dict[str, Any]) -> str:
     """
     Skapa en unik hash för en händelse baserat på dess attribut
@@ -63,60 +46,75 @@ def _create_event_hash(event_data: Dict[str, Any]) -> str:
     return hash_str
 
 
-def _check_duplicate_event(session_id: str, event_data: Dict[str, Any]) -> Optional[int]:
-    """
-    Kontrollera om denna händelse redan har skapats i denna session
-    Returnerar event_id om den redan finns, None annars
-    """
-    _clean_old_cache_entries()
-    event_hash = _create_event_hash(event_data)
-    cache_key = f"{session_id}:{event_hash}"
-    return _CREATED_EVENTS_CACHE.get(cache_key)
+# Tidsgränser och samtidighet för AI-chatten
+AI_REQUEST_TIMEOUT_SECONDS = float(os.getenv("AI_REQUEST_TIMEOUT_SECONDS", "20"))
+AI_CHAT_TIMEOUT_SECONDS = float(os.getenv("AI_CHAT_TIMEOUT_SECONDS", "45"))
+AI_MAX_CONCURRENT_CHATS = int(os.getenv("AI_MAX_CONCURRENT_CHATS", "4"))
+# Hur länge en chatt får vänta på en ledig plats innan den avvisas
+AI_QUEUE_TIMEOUT_SECONDS = float(os.getenv("AI_QUEUE_TIMEOUT_SECONDS", "10"))
+
+# LLM-leverantör (Groq eller fake, se llm.py). Groq-klienten skapas vid första anropet
+provider = llm.create_provider(timeout=AI_REQUEST_TIMEOUT_SECONDS)
+
+# Max antal händelser per get_events-anrop, och sidstorlek för en gemensam
+# hämtning när flera get_events-anrop i samma tur har överlappande fönster
+TOOL_EVENTS_LIMIT = 100
+TOOL_EVENTS_BATCH_LIMIT = 2000
 
+# Begränsar antalet samtidiga chattar så att AI-trafiken inte tar alla
+# databasanslutningar och trådar från kalender-API:t
+_chat_slots = asyncio.Semaphore(AI_MAX_CONCURRENT_CHATS)
 
-def _mark_event_created(session_id: str, event_data: Dict[str, Any], event_id: int):
-    """Markera att en händelse har skapats för att förhindra dubletter"""
-    event_hash = _create_event_hash(event_data)
-    cache_key = f"{session_id}:{event_hash}"
-    _CREATED_EVENTS_CACHE[cache_key] = event_id
-    _CACHE_TIMESTAMPS[cache_key] = datetime.now().timestamp()
+# Verktygsfaser som körs klart även om chatturen avbryts (se _run_tools)
+_tool_tasks = set()
 
 
-# Groq client
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# Whisper-modell och språk för transkribering (ingår i cachenyckeln)
+TRANSCRIBE_MODEL = "whisper-large-v3-turbo"
+TRANSCRIBE_LANGUAGE = "sv"  # Svenska
 
 
-def transcribe_audio(audio_file_path: str) -> str:
+def transcribe_audio(audio_file: BinaryIO, filename: str) -> str:
     """
-    Transkribera ljudfil till text med Groq Whisper API
+    Transkribera ljud till text med Groq Whisper API
 
     Args:
-        audio_file_path: Sökväg till ljudfilen
+        audio_file: Öppen binär fil (t.ex. UploadFile.file), läses i bitar av Groq-klienten
+        filename: Filnamnet, Groq avgör formatet från filändelsen
 
     Returns:
         Transkriberad text
     """
     try:
-        # Kontrollera att filen existerar och har innehåll
-        if not os.path.exists(audio_file_path):
-            raise Exception("Ljudfilen hittades inte")
-
-        file_size = os.path.getsize(audio_file_path)
+        # Kontrollera att filen har innehåll
+        audio_file.seek(0, os.SEEK_END)
+        file_size = audio_file.tell()
+        audio_file.seek(0)
         if file_size == 0:
             raise Exception("Ljudfilen är tom")
 
-        print(f"Transcribing audio file: {audio_file_path} ({file_size} bytes)")
+        # Samma klipp igen (t.ex. ett nytt försök) ger cachad text utan API-anrop
+        cache_key = transcription_key(audio_file, TRANSCRIBE_MODEL, TRANSCRIBE_LANGUAGE)
+        cached = transcription_cache.get(cache_key)
+        if cached is not None:
+            print(f"Transcription cache hit: {filename} ({file_size} bytes)")
+            return cached
+
+        print(f"Transcribing audio file: {filename} ({file_size} bytes)")
 
-        # Groq Whisper API call - använd Path objekt enligt officiell dokumentation
-        transcription = client.audio.transcriptions.create(
-            file=Path(audio_file_path),
-            model="whisper-large-v3-turbo",
-            language="sv",  # Svenska
+        # Filobjektet skickas vidare som det är (en Path skulle läsas in helt i minnet)
+        transcription = provider.transcribe(
+            file=(filename, audio_file),
+            model=TRANSCRIBE_MODEL,
+            language=TRANSCRIBE_LANGUAGE,
             response_format="text",
             temperature=0.0  # Mer deterministisk transkribering
         )
 
         print(f"Transcription result: {transcription[:100] if len(transcription) > 100 else transcription}")
+        # Tomma resultat cachas inte, de kan bero på ett tillfälligt fel
+        if transcription and transcription.strip():
+            transcription_cache.put(cache_key, transcription)
         return transcription
 
     except Exception as e:
@@ -182,7 +180,7 @@ TOOLS = [
                     },
                     "user_id": {
                         "type": "integer",
-                        "description": "Användarens ID (1=albin, 2=maria, 3=olle, 4=ellen, 5=familj)"
+                        "description": "Användarens ID (se användarlistan i systemprompten)"
                     },
                     "all_day": {
                         "type": "boolean",
@@ -207,41 +205,64 @@ TOOLS = [
 ]
 
 
+def _events_window(start_date: Optional[str], end_date: Optional[str]) -> Tuple[datetime, datetime]:
+    """Tidsfönster för get_events (standard: från nu och en vecka framåt)"""
+    # Default värden
+    if not start_date:
+        start_dt = datetime.now()
+    else:
+        start_dt = datetime.fromisoformat(start_date)
+
+    if not end_date:
+        end_dt = start_dt + timedelta(days=7)
+    else:
+        end_dt = datetime.fromisoformat(end_date)
+
+    return start_dt, end_dt
+
+
 def get_events_tool(db: Session, start_date: Optional[str] = None, end_date: Optional[str] = None) -> str:
     """Verktyg: Hämta händelser från databasen"""
     try:
-        # Default värden
-        if not start_date:
-            start_dt = datetime.now()
-        else:
-            start_dt = datetime.fromisoformat(start_date)
-
-        if not end_date:
-            end_dt = start_dt + timedelta(days=7)
-        else:
-            end_dt = datetime.fromisoformat(end_date)
+        start_dt, end_dt = _events_window(start_date, end_date)
+        events = crud.get_events(db, start_date=start_dt, end_date=end_dt, limit=TOOL_EVENTS_LIMIT)
+        return prompts.encode_events(events)
 
-        events = crud.get_events(db, start_date=start_dt, end_date=end_dt, limit=100)
-
-        if not events:
-            return "Inga händelser hittades för den valda tidsperioden."
+    except Exception as e:
+        return f"Fel vid hämtning av händelser: {str(e)}"
 
-        result = []
-        for event in events:
-            result.append({
-                "id": event.id,
-                "title": event.title,
-                "description": event.description,
-                "start_time": event.start_time.isoformat(),
-                "end_time": event.end_time.isoformat(),
-                "user": event.owner.name,
-                "user_id": event.user_id
-            })
 
-        return json.dumps(result, ensure_ascii=False)
+def get_events_for_windows(db: Session, windows: List[Tuple[datetime, datetime]]) -> List[str]:
+    """
+    Verktyg: get_events för flera fönster med en gemensam hämtning
 
+    Hämtar (och expanderar återkommande händelser för) unionen av fönstren en
+    gång, sida för sida tills det inte finns någon next_cursor, och filtrerar
+    sedan fram varje fönsters händelser med crud.event_in_window. Resultatet
+    blir detsamma som separata get_events-anrop.
+    """
+    try:
+        events = []
+        cursor = None
+        while True:
+            page, cursor = crud.get_events_page(
+                db,
+                limit=TOOL_EVENTS_BATCH_LIMIT,
+                start_date=min(start for start, _ in windows),
+                end_date=max(end for _, end in windows),
+                cursor=cursor
+            )
+            events.extend(page)
+            if not cursor:
+                break
     except Exception as e:
-        return f"Fel vid hämtning av händelser: {str(e)}"
+        return [f"Fel vid hämtning av händelser: {str(e)}"] * len(windows)
+
+    results = []
+    for start, end in windows:
+        matching = [event for event in events if crud.event_in_window(event, start, end)]
+        results.append(prompts.encode_events(matching[:TOOL_EVENTS_LIMIT]))
+    return results
 
 
 def create_event_tool(
@@ -269,16 +290,6 @@ def create_event_tool(
             "all_day": all_day
         }
 
-        # DEDUPLICERINGSKONTROLL
-        existing_event_id = _check_duplicate_event(session_id, event_data)
-        if existing_event_id:
-            return json.dumps({
-                "success": True,
-                "message": "Händelsen är redan skapad (dublettskydd aktivt)",
-                "event_id": existing_event_id,
-                "duplicate": True
-            }, ensure_ascii=False)
-
         # Verifiera användare
         user = crud.get_user(db, user_id=user_id)
         if not user:
@@ -291,6 +302,18 @@ def create_event_tool(
         start_dt = datetime.fromisoformat(start_time)
         end_dt = datetime.fromisoformat(end_time)
 
+        # DEDUPLICERINGSKONTROLL: reservera bokningen innan den skapas, så
+        # att bara ett anrop (i någon worker) kan skapa den
+        event_hash = _create_event_hash(event_data)
+        claimed, existing_event_id = dedup.store.claim(db, session_id, event_hash)
+        if not claimed:
+            return json.dumps({
+                "success": True,
+                "message": "Händelsen är redan skapad (dublettskydd aktivt)",
+                "event_id": existing_event_id,
+                "duplicate": True
+            }, ensure_ascii=False)
+
         # Skapa händelsen
         event_create = schemas.EventCreate(
             title=title,
@@ -303,10 +326,14 @@ def create_event_tool(
             reminder_minutes=30
         )
 
-        db_event = crud.create_event(db=db, event=event_create)
+        try:
+            db_event = crud.create_event(db=db, event=event_create)
+        except Exception:
+            # Släpp reservationen så att ett nytt försök kan skapa händelsen
+            dedup.store.release(db, session_id, event_hash)
+            raise
 
-        # Markera som skapad i cache
-        _mark_event_created(session_id, event_data, db_event.id)
+        dedup.store.complete(db, session_id, event_hash, db_event.id)
 
         return json.dumps({
             "success": True,
@@ -339,21 +366,27 @@ def get_users_tool(db: Session) -> str:
         return f"Fel vid hämtning av användare: {str(e)}"
 
 
-def handle_tool_call(tool_call: Any, db: Session, session_id: str) -> str:
-    """Hantera verktygsanrop från AI:n"""
+async def handle_tool_call(tool_call: Any, db, session_id: str) -> str:
+    """
+    Hantera verktygsanrop från AI:n
+
+    Verktygen är synkrona och körs via run_db, så event-loopen inte blockeras
+    """
     function_name = tool_call.function.name
     arguments = json.loads(tool_call.function.arguments)
 
     if function_name == "get_events":
-        return get_events_tool(
+        return await run_db(
             db,
+            get_events_tool,
             start_date=arguments.get("start_date"),
             end_date=arguments.get("end_date")
         )
 
     elif function_name == "create_event":
-        return create_event_tool(
+        return await run_db(
             db,
+            create_event_tool,
             session_id=session_id,
             title=arguments["title"],
             start_time=arguments["start_time"],
@@ -364,73 +397,242 @@ def handle_tool_call(tool_call: Any, db: Session, session_id: str) -> str:
         )
 
     elif function_name == "get_users":
-        return get_users_tool(db)
+        return await run_db(db, get_users_tool)
 
     else:
         return f"Okänt verktyg: {function_name}"
 
 
-def chat_with_ai(
+# Verktyg som bara läser och därför kan köras samtidigt
+_READ_ONLY_TOOLS = {"get_events", "get_users"}
+
+
+async def execute_tool_calls(tool_calls: List[Any], db, session_id: str) -> List[str]:
+    """
+    Kör alla verktygsanrop från en AI-tur och returnera resultaten i samma ordning
+
+    Läsande anrop i följd körs samtidigt, var och en i en egen session, och
+    get_events-anrop med överlappande fönster delar en hämtning. Skrivande
+    anrop (create_event) körs ett i taget i sessionen db och i den ordning
+    AI:n angav, så dublettskyddet och läsningar efter en bokning fungerar
+    som när anropen kördes i tur och ordning.
+    """
+    results: List[Optional[str]] = [None] * len(tool_calls)
+    reads: List[int] = []
+
+    for index, tool_call in enumerate(tool_calls):
+        if tool_call.function.name in _READ_ONLY_TOOLS:
+            reads.append(index)
+            continue
+        await _run_read_tools(tool_calls, reads, results)
+        reads = []
+        results[index] = await handle_tool_call(tool_call, db, session_id)
+
+    await _run_read_tools(tool_calls, reads, results)
+    return results
+
+
+async def _run_read_tools(tool_calls: List[Any], indexes: List[int], results: List[Optional[str]]):
+    if not indexes:
+        return
+
+    # (index i tool_calls, funktion som ger ett resultat per index)
+    jobs = []
+    user_indexes = []
+    windows = []
+    for index in indexes:
+        tool_call = tool_calls[index]
+        if tool_call.function.name == "get_users":
+            user_indexes.append(index)
+            continue
+        try:
+            arguments = json.loads(tool_call.function.arguments or "{}")
+            windows.append((_events_window(arguments.get("start_date"), arguments.get("end_date")), index))
+        except (ValueError, TypeError, AttributeError) as e:
+            results[index] = f"Fel vid hämtning av händelser: {str(e)}"
+
+    # Flera get_users i samma tur ger samma svar
+    if user_indexes:
+        jobs.append((user_indexes, lambda session: [get_users_tool(session)] * len(user_indexes)))
+
+    for group in _overlapping_windows(windows):
+        group_windows = [window for window, _ in group]
+        jobs.append((
+            [index for _, index in group],
+            lambda session, group_windows=group_windows: get_events_for_windows(session, group_windows)
+        ))
+
+    outputs = await asyncio.gather(*(_run_in_own_session(fn) for _, fn in jobs))
+    for (job_indexes, _), output in zip(jobs, outputs):
+        for index, result in zip(job_indexes, output):
+            results[index] = result
+
+
+def _overlapping_windows(windows: List[Tuple[Tuple[datetime, datetime], int]]) -> List[List[Tuple[Tuple[datetime, datetime], int]]]:
+    """Gruppera fönster som överlappar varandra (direkt eller via ett tredje)"""
+    groups = []
+    group_end = None
+    for window, index in sorted(windows, key=lambda item: item[0]):
+        if groups and window[0] <= group_end:
+            groups[-1].append((window, index))
+            group_end = max(group_end, window[1])
+        else:
+            groups.append([(window, index)])
+            group_end = window[1]
+    return groups
+
+
+async def _run_tools(tool_calls: List[Any], session_id: str) -> List[str]:
+    """
+    Kör verktygsanropen i en egen session som inte avbryts med chatturen
+
+    Tidsgränsen gäller bara AI-anropen. Avbryts turen ändå (t.ex. när
+    klienten kopplar ner) körs pågående skrivningar klart och sessionen
+    stängs först därefter, i stället för att requestens session stängs
+    mitt i en commit.
+    """
+    async def run():
+        async with api_session() as session:
+            return await execute_tool_calls(tool_calls, session, session_id)
+
+    task = asyncio.ensure_future(run())
+    _tool_tasks.add(task)
+    task.add_done_callback(_tool_tasks.discard)
+    return await asyncio.shield(task)
+
+
+async def _run_in_own_session(fn):
+    # En session per jobb: en session kan inte köra flera frågor samtidigt
+    async with api_session() as session:
+        return await run_db(session, fn)
+
+
+async def _build_messages(db, message: str, conversation_history: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """Systemprompt + tidigare konversation + användarens nya meddelande"""
+    system_message = await prompts.system_message(db)
+    return [system_message] + conversation_history + [{"role": "user", "content": message}]
+
+
+def _add_usage(usage: Dict[str, int], completion_usage: Any):
+    """Summera tokenförbrukningen från ett Groq-svar (usage kan saknas)"""
+    usage["calls"] = usage.get("calls", 0) + 1
+    if completion_usage is None:
+        return
+    usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + (completion_usage.prompt_tokens or 0)
+    usage["completion_tokens"] = usage.get("completion_tokens", 0) + (completion_usage.completion_tokens or 0)
+
+
+def _assistant_tool_message(content: Optional[str], tool_calls: List[Any]) -> Dict[str, Any]:
+    """AI:ns svar med verktygsanrop, i formatet som skickas tillbaka till Groq"""
+    return {
+        "role": "assistant",
+        "content": content or "",
+        "tool_calls": [
+            {
+                "id": tc.id,
+                "type": "function",
+                "function": {
+                    "name": tc.function.name,
+                    "arguments": tc.function.arguments
+                }
+            }
+            for tc in tool_calls
+        ]
+    }
+
+
+def _updated_history(
+    conversation_history: List[Dict[str, str]],
     message: str,
-    db: Session,
+    final_message: str
+) -> List[Dict[str, str]]:
+    """Uppdatera konversationshistorik (spara bara user/assistant, inte system/tool)"""
+    updated_history = conversation_history + [
+        {"role": "user", "content": message},
+        {"role": "assistant", "content": final_message}
+    ]
+
+    # Begränsa historik till senaste 10 meddelandena för att spara tokens
+    if len(updated_history) > 10:
+        updated_history = updated_history[-10:]
+
+    return updated_history
+
+
+async def chat_with_ai(
+    message: str,
+    db,
     session_id: str,
     conversation_history: Optional[List[Dict[str, str]]] = None
 ) -> Dict[str, Any]:
     """
     Huvudfunktion för att chatta med AI:n
 
+    Högst AI_MAX_CONCURRENT_CHATS chattar körs samtidigt; en chatt som inte
+    får plats inom AI_QUEUE_TIMEOUT_SECONDS avvisas direkt. Varje Groq-anrop
+    har en egen timeout och AI-anropen i turen har en gemensam deadline på
+    AI_CHAT_TIMEOUT_SECONDS; verktygen (som kan skriva) körs alltid klart.
+
     Args:
         message: Användarens meddelande
-        db: Databassession
+        db: Databassession från get_api_db (AsyncSession eller Session)
         session_id: Unik session ID för dedupliceringskontroll
         conversation_history: Tidigare konversation (valfritt)
 
     Returns:
         Dict med AI:ns svar och uppdaterad konversationshistorik
     """
+    try:
+        await asyncio.wait_for(_chat_slots.acquire(), timeout=AI_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        return {
+            "success": False,
+            "error": "AI-assistenten är upptagen",
+            "message": "Många använder assistenten just nu. Försök igen om en stund."
+        }
+
+    usage: Dict[str, int] = {}
+    try:
+        deadline = asyncio.get_running_loop().time() + AI_CHAT_TIMEOUT_SECONDS
+        return await _chat_turn(message, db, session_id, conversation_history, deadline, usage)
+    except (asyncio.TimeoutError, llm.LLMTimeoutError):
+        return {
+            "success": False,
+            "error": "Tidsgränsen för AI-chatten överskreds",
+            "message": "Det tog för lång tid att få svar. Försök igen."
+        }
+    finally:
+        _chat_slots.release()
+        if usage:
+            prompts.log_token_usage(session_id, usage)
+
+
+async def _chat_turn(
+    message: str,
+    db,
+    session_id: str,
+    conversation_history: Optional[List[Dict[str, str]]],
+    deadline: float,
+    usage: Dict[str, int]
+) -> Dict[str, Any]:
+    """En chattur: första AI-anropet, eventuella verktyg och andra anropet"""
     try:
         # Bygg konversation
         if conversation_history is None:
             conversation_history = []
 
-        # System prompt
-        system_message = {
-            "role": "system",
-            "content": f"""Du är en AI-assistent för familjekalender.
-Idag är {datetime.now().strftime('%Y-%m-%d')}.
-
-Användare i systemet:
-- albin (ID: 1, blå)
-- maria (ID: 2, röd)
-- olle (ID: 3, gul)
-- ellen (ID: 4, lila)
-- familj (ID: 5, grön)
-
-Du kan:
-1. Svara på frågor om vad som är bokat
-2. Skapa nya bokningar
-
-VIKTIGT REGLER FÖR BOKNINGAR:
-- När du skapar en bokning, anropa create_event ENDAST EN GÅNG
-- Om användaren säger "boka", skapa bara EN händelse
-- Bekräfta alltid vilken användare bokningen är för
-- Använd svenskt datumformat när du pratar med användaren
-- Var kortfattad och trevlig
-
-Dedupliceringssystem är aktivt - om du försöker skapa samma händelse flera gånger kommer den bara skapas en gång."""
-        }
-
-        messages = [system_message] + conversation_history + [{"role": "user", "content": message}]
+        messages = await _build_messages(db, message, conversation_history)
 
         # Första AI-anropet
-        response = client.chat.completions.create(
+        response = await _with_deadline(provider.complete(
             model="llama-3.3-70b-versatile",
             messages=messages,
             tools=TOOLS,
             tool_choice="auto",
             max_tokens=1000,
             temperature=0.1  # Lägre temperatur för mer konsekventa function calls
-        )
+        ), deadline)
+        _add_usage(usage, getattr(response, "usage", None))
 
         assistant_message = response.choices[0].message
         tool_calls = getattr(assistant_message, 'tool_calls', None)
@@ -438,25 +640,11 @@ Dedupliceringssystem är aktivt - om du försöker skapa samma händelse flera g
         # Om AI:n vill använda verktyg
         if tool_calls:
             # Lägg till AI:ns svar i historiken
-            messages.append({
-                "role": "assistant",
-                "content": assistant_message.content or "",
-                "tool_calls": [
-                    {
-                        "id": tc.id,
-                        "type": "function",
-                        "function": {
-                            "name": tc.function.name,
-                            "arguments": tc.function.arguments
-                        }
-                    }
-                    for tc in tool_calls
-                ]
-            })
+            messages.append(_assistant_tool_message(assistant_message.content, tool_calls))
 
-            # Exekvera verktygsanrop
-            for tool_call in tool_calls:
-                tool_result = handle_tool_call(tool_call, db, session_id)
+            # Exekvera verktygsanrop (läsande samtidigt, skrivande i tur och ordning)
+            tool_results = await _run_tools(tool_calls, session_id)
+            for tool_call, tool_result in zip(tool_calls, tool_results):
                 messages.append({
                     "role": "tool",
                     "tool_call_id": tool_call.id,
@@ -465,36 +653,201 @@ Dedupliceringssystem är aktivt - om du försöker skapa samma händelse flera g
                 })
 
             # Andra AI-anropet med verktygsresultat
-            second_response = client.chat.completions.create(
+            second_response = await _with_deadline(provider.complete(
                 model="llama-3.3-70b-versatile",
                 messages=messages,
                 max_tokens=1000
-            )
+            ), deadline)
+            _add_usage(usage, getattr(second_response, "usage", None))
 
             final_message = second_response.choices[0].message.content
         else:
             # Inget verktygsanrop, använd direktsvaret
             final_message = assistant_message.content
 
-        # Uppdatera konversationshistorik (spara bara user/assistant, inte system/tool)
-        updated_history = conversation_history + [
-            {"role": "user", "content": message},
-            {"role": "assistant", "content": final_message}
-        ]
-
-        # Begränsa historik till senaste 10 meddelandena för att spara tokens
-        if len(updated_history) > 10:
-            updated_history = updated_history[-10:]
-
         return {
             "success": True,
             "message": final_message,
-            "conversation_history": updated_history
+            "conversation_history": _updated_history(conversation_history, message, final_message)
         }
 
+    except (asyncio.TimeoutError, llm.LLMTimeoutError):
+        raise
     except Exception as e:
         return {
             "success": False,
             "error": f"Fel i AI-chat: {str(e)}",
             "message": "Tyvärr uppstod ett fel. Försök igen senare."
         }
+
+
+# Streaming (SSE)
+# stream_chat_with_ai ger samma resultat som chat_with_ai men som en ström
+# av händelser: status när verktyg körs, token för varje textbit från Groq
+# och till sist done med samma fält som ChatResponse.
+
+_TOOL_STATUS = {
+    "get_events": "Kollar kalendern…",
+    "create_event": "Skapar händelsen…",
+    "get_users": "Hämtar familjemedlemmar…",
+}
+
+
+async def _with_deadline(awaitable, deadline: float):
+    remaining = deadline - asyncio.get_running_loop().time()
+    if remaining <= 0:
+        raise asyncio.TimeoutError()
+    return await asyncio.wait_for(awaitable, timeout=remaining)
+
+
+async def _stream_completion(deadline: float, usage: Dict[str, int], **kwargs) -> AsyncIterator[Any]:
+    """Strömma ett Groq-anrop och ge delta-objekten, med gemensam deadline"""
+    stream = await _with_deadline(provider.complete(stream=True, **kwargs), deadline)
+    completion_usage = None
+    try:
+        while True:
+            try:
+                chunk = await _with_deadline(stream.__anext__(), deadline)
+            except StopAsyncIteration:
+                return
+            # Groq skickar förbrukningen i sista chunken (x_groq.usage)
+            x_groq = getattr(chunk, "x_groq", None)
+            completion_usage = getattr(x_groq, "usage", None) or getattr(chunk, "usage", None) or completion_usage
+            if chunk.choices:
+                yield chunk.choices[0].delta
+    finally:
+        _add_usage(usage, completion_usage)
+        await stream.close()
+
+
+def _done(success: bool, message: str, conversation_history: List[Dict[str, str]], error: Optional[str] = None):
+    return {
+        "type": "done",
+        "success": success,
+        "message": message,
+        "conversation_history": conversation_history,
+        "error": error
+    }
+
+
+async def stream_chat_with_ai(
+    message: str,
+    db,
+    session_id: str,
+    conversation_history: Optional[List[Dict[str, str]]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Strömmande variant av chat_with_ai (samma begränsning och tidsgränser)
+
+    Yields:
+        {"type": "status", "message": ...}, {"type": "token", "content": ...}
+        och sist {"type": "done", ...} med fälten i ChatResponse
+    """
+    if conversation_history is None:
+        conversation_history = []
+
+    try:
+        await asyncio.wait_for(_chat_slots.acquire(), timeout=AI_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        yield _done(
+            False,
+            "Många använder assistenten just nu. Försök igen om en stund.",
+            conversation_history,
+            "AI-assistenten är upptagen"
+        )
+        return
+
+    usage: Dict[str, int] = {}
+    try:
+        yield {"type": "status", "message": "Tänker…"}
+        deadline = asyncio.get_running_loop().time() + AI_CHAT_TIMEOUT_SECONDS
+        async for event in _stream_chat_turn(message, db, session_id, conversation_history, deadline, usage):
+            yield event
+    except (asyncio.TimeoutError, llm.LLMTimeoutError):
+        yield _done(
+            False,
+            "Det tog för lång tid att få svar. Försök igen.",
+            conversation_history,
+            "Tidsgränsen för AI-chatten överskreds"
+        )
+    except Exception as e:
+        yield _done(
+            False,
+            "Tyvärr uppstod ett fel. Försök igen senare.",
+            conversation_history,
+            f"Fel i AI-chat: {str(e)}"
+        )
+    finally:
+        _chat_slots.release()
+        if usage:
+            prompts.log_token_usage(session_id, usage)
+
+
+async def _stream_chat_turn(
+    message: str,
+    db,
+    session_id: str,
+    conversation_history: List[Dict[str, str]],
+    deadline: float,
+    usage: Dict[str, int]
+) -> AsyncIterator[Dict[str, Any]]:
+    messages = await _build_messages(db, message, conversation_history)
+
+    # Första AI-anropet: text strömmas direkt, verktygsanrop samlas ihop
+    content_parts: List[str] = []
+    partial_calls: Dict[int, Dict[str, str]] = {}
+    async for delta in _stream_completion(
+        deadline,
+        usage,
+        model="llama-3.3-70b-versatile",
+        messages=messages,
+        tools=TOOLS,
+        tool_choice="auto",
+        max_tokens=1000,
+        temperature=0.1
+    ):
+        if delta.content:
+            content_parts.append(delta.content)
+            yield {"type": "token", "content": delta.content}
+        for tc in delta.tool_calls or []:
+            call = partial_calls.setdefault(tc.index, {"id": "", "name": "", "arguments": ""})
+            if tc.id:
+                call["id"] = tc.id
+            if tc.function:
+                call["name"] += tc.function.name or ""
+                call["arguments"] += tc.function.arguments or ""
+
+    if partial_calls:
+        tool_calls = [
+            SimpleNamespace(id=call["id"], function=SimpleNamespace(name=call["name"], arguments=call["arguments"]))
+            for _, call in sorted(partial_calls.items())
+        ]
+        messages.append(_assistant_tool_message("".join(content_parts), tool_calls))
+
+        # Klienten ersätter eventuell text från första anropet med statusen
+        statuses = dict.fromkeys(_TOOL_STATUS.get(tc.function.name, "Arbetar…") for tc in tool_calls)
+        yield {"type": "status", "message": " ".join(statuses)}
+        tool_results = await _run_tools(tool_calls, session_id)
+        for tool_call, tool_result in zip(tool_calls, tool_results):
+            messages.append({
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "name": tool_call.function.name,
+                "content": tool_result
+            })
+
+        # Andra AI-anropet med verktygsresultat
+        content_parts = []
+        async for delta in _stream_completion(
+            deadline,
+            usage,
+            model="llama-3.3-70b-versatile",
+            messages=messages,
+            max_tokens=1000
+        ):
+            if delta.content:
+                content_parts.append(delta.content)
+                yield {"type": "token", "content": delta.content}
+
+    final_message = "".join(content_parts)
+    yield _done(True, final_message, _updated_history(conversation_history, message, final_message))
@@ -0,0 +1,93 @@
+"""
+In-process cache för expanderade event-fönster
+
+crud.get_events_page sparar färdiga sidor här, nycklade på fönster och
+filter. Skrivningar (create/update/delete) invaliderar bara de fönster som
+den ändrade händelsen, eller dess serie, kan synas i. Cachen är LRU med
+tak både på antal fönster och totalt antal cachade events, och har en TTL.
+
+Varje post sparas med fönstrets validator från databasen (antal rader och
+senaste updated_at). En post används bara om validatorn fortfarande är
+densamma, så ändringar från andra processer (flera uvicorn-workers) och
+skrivningar som hinner före en pågående läsning aldrig ger ett gammalt svar.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Hashable, Optional, Tuple
+
+EVENT_CACHE_MAX_ENTRIES = int(os.getenv("EVENT_CACHE_MAX_ENTRIES", "256"))
+EVENT_CACHE_MAX_ITEMS = int(os.getenv("EVENT_CACHE_MAX_ITEMS", "50000"))
+EVENT_CACHE_TTL_SECONDS = float(os.getenv("EVENT_CACHE_TTL_SECONDS", "300"))
+
+
+class EventWindowCache:
+    """
+    LRU-cache för fönster [start, end]
+
+    Varje post har en storlek (antal events) och summan av storlekarna
+    hålls under max_items. Poster äldre än ttl, eller med en annan
+    validator än den som efterfrågas, räknas som missar.
+    """
+
+    def __init__(self, max_entries: int, max_items: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_items = max_items
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[datetime, datetime, int, float, Hashable, Any]]" = OrderedDict()
+        self._items = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, validator: Hashable = None) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[3] > self.ttl or entry[4] != validator:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[5]
+
+    def put(self, key: Hashable, start: datetime, end: datetime, value: Any, size: int, validator: Hashable = None):
+        # Fönster som ensamt är större än taket cachas inte
+        if size > self.max_items or self.max_entries <= 0:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (start, end, size, time.monotonic(), validator, value)
+            self._items += size
+            while len(self._entries) > self.max_entries or self._items > self.max_items:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_span(self, span_start: datetime, span_end: Optional[datetime]):
+        """
+        Ta bort alla fönster som överlappar [span_start, span_end]
+        span_end = None betyder en serie utan slutdatum
+        """
+        with self._lock:
+            stale = [
+                key for key, (start, end, _, _, _, _) in self._entries.items()
+                if span_start <= end and (span_end is None or span_end >= start)
+            ]
+            for key in stale:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._items = 0
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self._items -= entry[2]
+
+
+event_windows = EventWindowCache(
+    max_entries=EVENT_CACHE_MAX_ENTRIES,
+    max_items=EVENT_CACHE_MAX_ITEMS,
+    ttl=EVENT_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,77 @@
+"""
+Villkorliga GET-anrop (ETag / If-None-Match och Last-Modified / If-Modified-Since)
+
+Endpoints räknar fram en billig validator (t.ex. antal rader och senaste
+ändringstid) innan de gör det dyra arbetet. Om klientens kopia fortfarande
+stämmer svarar de 304 Not Modified utan att hämta eller serialisera data.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+
+# Klienter får cacha svaret men måste alltid validera det mot servern
+CACHE_CONTROL = "no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Stark ETag från validatorns delar (fönster, antal, senaste ändring, ...)"""
+    raw = "|".join("" if part is None else str(part) for part in parts)
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+
+def _http_date(value: datetime) -> str:
+    # Databasens tider är naiva UTC-tider
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime] = None) -> Dict[str, str]:
+    """Headers som ska skickas med både 200- och 304-svar"""
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Svaga jämförelser räcker för GET (RFC 7232 avsnitt 3.2)
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag in candidates
+
+
+def not_modified(
+    request: Request,
+    etag: str,
+    last_modified: Optional[datetime] = None,
+    use_if_modified_since: bool = True
+) -> Optional[Response]:
+    """
+    Returnera ett 304-svar om klientens kopia är aktuell, annars None
+
+    If-None-Match har företräde; If-Modified-Since används bara när den saknas
+    och när endpointens Last-Modified fångar alla ändringar (use_if_modified_since).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        matches = _etag_matches(if_none_match, etag)
+    elif use_if_modified_since and last_modified is not None and "if-modified-since" in request.headers:
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"])
+        except (TypeError, ValueError):
+            return None
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        modified = last_modified.replace(tzinfo=timezone.utc) if last_modified.tzinfo is None else last_modified
+        matches = modified.replace(microsecond=0) <= since
+    else:
+        return None
+
+    if not matches:
+        return None
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
@@ -1,8 +1,18 @@
-from sqlalchemy.orm import Session
-from . import models, schemas
-from .recurrence import generate_recurrence_instances
-from datetime import datetime, timedelta
-from typing import Optional, List
+from sqlalchemy import and_, or_, func, delete, insert, select, true
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, joinedload
+from . import models, schemas, notifications
+from .recurrence import expand_recurrences_batch
+from .cache import event_windows
+from .reminders import compute_next_reminder, scheduler as reminder_scheduler
+from datetime import datetime, timedelta, timezone
+from collections import Counter
+from itertools import islice
+from types import SimpleNamespace
+from typing import Optional, List, Tuple
+import base64
+import heapq
+import os
 
 # User CRUD operations
 def get_user(db: Session, user_id: int):
@@ -14,6 +24,10 @@ def get_user_by_name(db: Session, name: str):
 def get_users(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.User).offset(skip).limit(limit).all()
 
+def get_users_validator(db: Session) -> Tuple[int, Optional[datetime]]:
+    """Antal användare och senaste created_at - ändras när användarlistan ändras"""
+    return db.query(func.count(models.User.id), func.max(models.User.created_at)).one()
+
 def create_user(db: Session, user: schemas.UserCreate):
     db_user = models.User(name=user.name, color=user.color)
     db.add(db_user)
@@ -22,50 +36,230 @@ def create_user(db: Session, user: schemas.UserCreate):
     return db_user
 
 # Event CRUD operations
+def _event_query(db: Session):
+    """
+    Bas-query för events där ägaren laddas i samma SQL-fråga (JOIN)
+    Undviker en extra fråga per händelse när owner läses vid serialisering
+    """
+    return db.query(models.Event).options(joinedload(models.Event.owner))
+
 def get_event(db: Session, event_id: int):
-    return db.query(models.Event).filter(models.Event.id == event_id).first()
+    return _event_query(db).filter(models.Event.id == event_id).first()
+
+def _single_events_in_window(start_date: datetime, end_date: datetime):
+    """Enstaka händelser som överlappar fönstret (använder ix_events_start_end)"""
+    return and_(
+        models.Event.recurrence_type == "none",
+        models.Event.start_time <= end_date,
+        models.Event.end_time >= start_date,
+    )
+
+def _recurring_events_in_window(start_date: datetime, end_date: datetime):
+    """Återkommande serier som kan ha instanser i fönstret (använder ix_events_recurrence)"""
+    return and_(
+        models.Event.recurrence_type != "none",
+        models.Event.start_time <= end_date,
+        or_(
+            models.Event.recurrence_end_date.is_(None),
+            models.Event.recurrence_end_date >= start_date,
+        ),
+    )
+
+def event_in_window(event, start_date: datetime, end_date: datetime) -> bool:
+    """
+    Samma fönsterregler som get_events_page, för redan hämtade events
+
+    Enstaka händelser tas med om de överlappar fönstret. Återkommande
+    originalhändelser och genererade instanser tas bara med om de startar
+    i fönstret.
+    """
+    if event.recurrence_type == "none":
+        return event.start_time <= end_date and event.end_time >= start_date
+    return start_date <= event.start_time <= end_date
+
+def encode_cursor(start_time: datetime, event_id: int) -> str:
+    """Bygg en opak cursor från den sista händelsen på en sida"""
+    raw = f"{start_time.isoformat()}|{event_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Tolka en cursor från encode_cursor. Kastar ValueError om den är ogiltig"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        start_str, id_str = raw.rsplit("|", 1)
+        return datetime.fromisoformat(start_str), int(id_str)
+    except Exception:
+        raise ValueError("Ogiltig cursor")
+
+def _event_sort_key(event) -> Tuple[datetime, int]:
+    """Sorteringsnyckel (start_time, id) för både databasrader och recurring-instanser"""
+    return event.start_time, event.id
 
 def get_events(db: Session, skip: int = 0, limit: int = 1000, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
     """
     Hämta events inklusive återkommande instanser
     """
-    # Om inget datumintervall är angivet, använd de senaste 3 månaderna till 6 månader framåt
-    if not start_date:
-        start_date = datetime.utcnow() - timedelta(days=90)
-    if not end_date:
-        end_date = datetime.utcnow() + timedelta(days=180)
+    events, _ = get_events_page(db, skip=skip, limit=limit, start_date=start_date, end_date=end_date)
+    return events
+
+def resolve_event_window(
+    start_date: Optional[datetime] = None, end_date: Optional[datetime] = None
+) -> Tuple[datetime, datetime]:
+    """
+    Fyll i standardintervall: 3 månader bakåt till 6 månader framåt
+
+    Räknas från början av dagens datum så att anrop utan datum under samma
+    dag får samma fönster (och därmed samma cache-nyckel och ETag).
+    """
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return start_date or today - timedelta(days=90), end_date or today + timedelta(days=181)
+
+def _event_span(event: models.Event) -> Tuple[datetime, Optional[datetime]]:
+    """
+    Tidsspannet där en händelse (eller dess serie) kan synas
+    Slut = None för återkommande serier utan slutdatum
+    """
+    if event.recurrence_type == "none":
+        return event.start_time, event.end_time
+    if event.recurrence_end_date is None:
+        return event.start_time, None
+    return event.start_time, max(event.end_time, event.recurrence_end_date)
+
+def _invalidate_event_windows(event: models.Event):
+    """Ta bort cachade fönster som händelsen kan synas i"""
+    event_windows.invalidate_span(*_event_span(event))
+
+def _detach_for_cache(db: Session, events: List[models.Event]):
+    """
+    Koppla loss rader (och deras ägare) från sessionen innan de cachas
 
-    # Hämta alla events som potentiellt kan visa sig i intervallet
-    # Inkludera recurring events som startade innan end_date
-    query = db.query(models.Event).filter(
-        models.Event.start_time <= end_date
+    Annars skulle en senare commit i samma session expire:a objekten
+    medan andra requests läser dem från cachen.
+    """
+    for obj in {*events, *(event.owner for event in events)}:
+        if obj in db:
+            db.expunge(obj)
+
+def get_events_page(
+    db: Session,
+    skip: int = 0,
+    limit: int = 1000,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    validator: Optional[Tuple[int, Optional[datetime]]] = None
+):
+    """
+    Hämta en sida events (inklusive återkommande instanser) sorterade på (start_time, id)
+
+    Sparade händelser och genererade instanser slås ihop som sorterade strömmar,
+    så bara skip + limit + 1 element materialiseras per sida. Med cursor fortsätter
+    sidan direkt efter den händelse cursorn pekar på. Färdiga sidor cachas i
+    cache.event_windows tillsammans med fönstrets validator och används bara
+    så länge validatorn i databasen är oförändrad. Anropare som redan har
+    hämtat validatorn (för ETag) skickar med den så att den inte läses två gånger.
+
+    Returns:
+        (lista med events, next_cursor eller None om det inte finns fler)
+    """
+    start_date, end_date = resolve_event_window(start_date, end_date)
+
+    after = decode_cursor(cursor) if cursor else None
+
+    if validator is None:
+        validator = get_events_validator(db, start_date, end_date)
+    validator = tuple(validator)
+
+    cache_key = (start_date, end_date, skip, limit, cursor)
+    cached = event_windows.get(cache_key, validator)
+    if cached is not None:
+        return cached
+
+    page_size = skip + limit + 1
+
+    # Sparade rader: enstaka händelser som överlappar intervallet
+    # plus återkommande originalhändelser som startar i intervallet
+    stored_query = _event_query(db).filter(
+        or_(
+            _single_events_in_window(start_date, end_date),
+            and_(
+                models.Event.recurrence_type != "none",
+                models.Event.start_time >= start_date,
+                models.Event.start_time <= end_date,
+            ),
+        )
     )
+    if after:
+        stored_query = stored_query.filter(
+            or_(
+                models.Event.start_time > after[0],
+                and_(models.Event.start_time == after[0], models.Event.id > after[1]),
+            )
+        )
+    stored_events = stored_query.order_by(
+        models.Event.start_time, models.Event.id
+    ).limit(page_size).all()
+
+    # Återkommande serier hämtas bara om de fortfarande är aktiva i intervallet
+    recurring_events = _event_query(db).filter(
+        _recurring_events_in_window(start_date, end_date)
+    ).all()
 
-    all_events = query.all()
+    # Alla serier expanderas i ett svep; instanser före cursorn genereras inte
+    instances_from = max(start_date, after[0]) if after else start_date
+    instances = expand_recurrences_batch(recurring_events, instances_from, end_date, after=after)
 
-    # Samla alla event-instanser (original + recurring)
-    result_events = []
+    merged = heapq.merge(stored_events, instances, key=_event_sort_key)
+    page = list(islice(merged, skip, page_size))
 
-    for event in all_events:
-        # Lägg till original händelsen om den är inom intervallet
-        if event.start_time >= start_date and event.start_time <= end_date:
-            result_events.append(event)
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(*_event_sort_key(page[-1]))
 
-        # Om händelsen är återkommande, generera instanser
-        if event.recurrence_type != "none":
-            recurring_instances = generate_recurrence_instances(event, start_date, end_date)
-            result_events.extend(recurring_instances)
+    _detach_for_cache(db, stored_events + recurring_events)
+    result = (page, next_cursor)
+    # Validatorn lästes före raderna: har något ändrats under tiden matchar
+    # posten aldrig nästa validator och räknas som en miss
+    event_windows.put(cache_key, start_date, end_date, result, size=len(page), validator=validator)
+    return result
 
-    return result_events
+def get_events_validator(db: Session, start_date: datetime, end_date: datetime) -> Tuple[int, Optional[datetime]]:
+    """
+    Billig validator för ett fönster: antal rader och senaste updated_at
+
+    Räknar samma rader som get_events_page läser (enstaka händelser i fönstret
+    och aktiva serier). Uppdateringar ändrar updated_at och borttagningar
+    ändrar antalet, så validatorn ändras när fönstrets innehåll kan ha ändrats.
+    """
+    return db.query(func.count(models.Event.id), func.max(models.Event.updated_at)).filter(
+        or_(
+            _single_events_in_window(start_date, end_date),
+            _recurring_events_in_window(start_date, end_date),
+        )
+    ).one()
 
 def get_events_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100):
-    return db.query(models.Event).filter(models.Event.user_id == user_id).offset(skip).limit(limit).all()
+    return _event_query(db).filter(models.Event.user_id == user_id).offset(skip).limit(limit).all()
+
+def _naive_utc(value):
+    """Tider lagras som naiva UTC-tider; frontend skickar dem med Z-suffix"""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _event_values(event, **dump_options) -> dict:
+    """Fälten från ett event-schema med tider som naiv UTC"""
+    return {field: _naive_utc(value) for field, value in event.model_dump(**dump_options).items()}
 
 def create_event(db: Session, event: schemas.EventCreate):
-    db_event = models.Event(**event.model_dump())
+    db_event = models.Event(**_event_values(event))
+    db_event.next_reminder_at = compute_next_reminder(db_event, datetime.utcnow())
     db.add(db_event)
     db.commit()
     db.refresh(db_event)
+    _invalidate_event_windows(db_event)
+    reminder_scheduler.schedule(db_event.id, db_event.next_reminder_at)
     return db_event
 
 def update_event(db: Session, event_id: int, event_update: schemas.EventUpdate):
@@ -73,19 +267,345 @@ def update_event(db: Session, event_id: int, event_update: schemas.EventUpdate):
     if not db_event:
         return None
 
-    update_data = event_update.model_dump(exclude_unset=True)
+    # Både fönstren där händelsen syntes och där den syns nu blir inaktuella
+    old_span = _event_span(db_event)
+
+    update_data = _event_values(event_update, exclude_unset=True)
     for field, value in update_data.items():
         setattr(db_event, field, value)
 
     db_event.updated_at = datetime.utcnow()
+    db_event.next_reminder_at = compute_next_reminder(db_event, datetime.utcnow())
     db.commit()
     db.refresh(db_event)
+    event_windows.invalidate_span(*old_span)
+    _invalidate_event_windows(db_event)
+    reminder_scheduler.schedule(db_event.id, db_event.next_reminder_at)
     return db_event
 
 def delete_event(db: Session, event_id: int):
     db_event = get_event(db, event_id)
     if db_event:
+        span = _event_span(db_event)
         db.delete(db_event)
+        # Tombstone i samma transaktion så att synkande klienter ser borttagningen
+        now = datetime.utcnow()
+        db.add(models.EventDeletion(event_id=event_id, deleted_at=now))
+        _prune_tombstones(db, now)
         db.commit()
+        event_windows.invalidate_span(*span)
         return True
     return False
+
+# Bulk-operationer
+# Hela batchen valideras först och skrivs sedan i en transaktion: antingen
+# sparas alla ändringar eller inga. Användare och händelser slås upp med en
+# fråga per batch istället för en per händelse.
+
+def _batch_span(spans: List[Tuple[datetime, Optional[datetime]]]) -> Tuple[datetime, Optional[datetime]]:
+    """Ett spann som täcker alla spann (slut = None om något saknar slut)"""
+    ends = [end for _, end in spans]
+    return min(start for start, _ in spans), None if None in ends else max(ends)
+
+def _users_by_id(db: Session, user_ids) -> dict:
+    """Slå upp användarna i en fråga. Kastar LookupError om någon saknas"""
+    wanted = set(user_ids)
+    users = {
+        user.id: user.name
+        for user in db.query(models.User.id, models.User.name).filter(models.User.id.in_(wanted))
+    }
+    missing = sorted(wanted - users.keys())
+    if missing:
+        raise LookupError(f"Okända användare: {', '.join(map(str, missing))}")
+    return users
+
+def _events_by_id(db: Session, event_ids: List[int]) -> dict:
+    """Hämta händelserna i en fråga. Kastar LookupError om någon saknas"""
+    events = {event.id: event for event in db.query(models.Event).filter(models.Event.id.in_(set(event_ids)))}
+    missing = sorted(set(event_ids) - events.keys())
+    if missing:
+        raise LookupError(f"Okända händelser: {', '.join(map(str, missing))}")
+    return events
+
+def _after_bulk_commit(spans: List[Tuple[datetime, Optional[datetime]]], reminders: List[Tuple[int, Optional[datetime]]]):
+    """
+    Invalidera cachen och schemalägg påminnelser efter commit
+
+    Ändringarna är redan sparade, så ett fel här får inte ge ett felsvar
+    (klienten skulle då försöka igen och skapa dubbletter). Då töms hela
+    cachen istället; påminnelserna plockas upp vid schemaläggarens nästa omläsning.
+    """
+    try:
+        event_windows.invalidate_span(*_batch_span(spans))
+        for event_id, next_reminder_at in reminders:
+            reminder_scheduler.schedule(event_id, next_reminder_at)
+    except Exception as e:
+        print(f"Fel efter bulk-commit, tömmer event-cachen: {e}")
+        event_windows.clear()
+
+def _check_times(index: int, start_time: datetime, end_time: datetime):
+    if end_time < start_time:
+        raise ValueError(f"Händelse {index}: end_time är före start_time")
+
+def create_events_bulk(
+    db: Session,
+    events: List[schemas.EventCreate],
+    uids: Optional[List[str]] = None,
+    notify: bool = True
+) -> List[int]:
+    """
+    Skapa många händelser i en transaktion
+
+    Raderna skrivs med en INSERT ... RETURNING (executemany) och en
+    sammanfattande notifikation läggs i outboxen i samma transaktion
+    (om inte notify=False, t.ex. när importen notifierar en gång på slutet).
+    uids anger iCalendar-UID per händelse för importerade händelser; en
+    händelse vars UID redan finns (t.ex. från en samtidig import av samma
+    fil) hoppas över med ON CONFLICT DO NOTHING.
+
+    Returns:
+        De nya ID:na i samma ordning som events (utan överhoppade händelser)
+    Raises:
+        LookupError om en användare saknas, ValueError om en händelse är ogiltig
+    """
+    if not events:
+        return []
+    users = _users_by_id(db, (event.user_id for event in events))
+
+    now = datetime.utcnow()
+    rows = []
+    spans = []
+    for index, event in enumerate(events):
+        data = _event_values(event)
+        _check_times(index, data["start_time"], data["end_time"])
+        # Bara för att räkna påminnelse och spann (billigare än ett ORM-objekt)
+        db_event = SimpleNamespace(**data)
+        rows.append({
+            **data,
+            "uid": uids[index] if uids is not None else None,
+            "next_reminder_at": compute_next_reminder(db_event, now),
+            "created_at": now,
+            "updated_at": now,
+        })
+        spans.append(_event_span(db_event))
+
+    # INSERT mot tabellen (Core): ORM:ens bulk-insert delar upp batchen
+    # varje gång en annan uppsättning kolumner är null
+    if uids is not None:
+        # UID:t identifierar raderna, så RETURNING behöver inte komma i ordning
+        # (en ordnad RETURNING skrivs rad för rad på SQLite). Överhoppade rader
+        # returneras inte alls.
+        statement = _insert_ignoring_uid_conflicts(db)
+        by_uid = dict(db.execute(statement.returning(models.Event.uid, models.Event.id), rows).all())
+        created = [index for index, uid in enumerate(uids) if uid in by_uid]
+        ids = [by_uid[uids[index]] for index in created]
+    else:
+        statement = insert(models.Event.__table__)
+        created = list(range(len(rows)))
+        ids = list(db.execute(
+            statement.returning(models.Event.id, sort_by_parameter_order=True),
+            rows
+        ).scalars())
+
+    if notify and created:
+        notifications.queue_events_created(db, Counter(users[events[index].user_id] for index in created))
+    db.commit()
+
+    _after_bulk_commit(spans, [(event_id, rows[index]["next_reminder_at"]) for event_id, index in zip(ids, created)])
+    return ids
+
+def _insert_ignoring_uid_conflicts(db: Session):
+    """INSERT som hoppar över rader vars uid redan finns (unika ix_events_uid)"""
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(models.Event.__table__).on_conflict_do_nothing(index_elements=["uid"])
+
+def get_existing_uids(db: Session, uids: List[str]) -> set:
+    """De av uids som redan finns på en händelse (en fråga)"""
+    return {uid for (uid,) in db.query(models.Event.uid).filter(models.Event.uid.in_(set(uids)))}
+
+def get_existing_event_ids(db: Session, event_ids: List[int]) -> set:
+    return {event_id for (event_id,) in db.query(models.Event.id).filter(models.Event.id.in_(set(event_ids)))}
+
+def update_events_bulk(db: Session, updates: List[schemas.EventBulkUpdateItem]) -> List[int]:
+    """
+    Uppdatera många händelser i en transaktion
+
+    Raises:
+        LookupError om en händelse eller användare saknas, ValueError om en
+        uppdatering ger en ogiltig händelse
+    """
+    if not updates:
+        return []
+    events = _events_by_id(db, [update.id for update in updates])
+    new_user_ids = {update.user_id for update in updates if update.user_id is not None}
+    if new_user_ids:
+        _users_by_id(db, new_user_ids)
+
+    now = datetime.utcnow()
+    spans = []
+    for index, update in enumerate(updates):
+        db_event = events[update.id]
+        spans.append(_event_span(db_event))
+        for field, value in _event_values(update, exclude_unset=True, exclude={"id"}).items():
+            setattr(db_event, field, value)
+        _check_times(index, db_event.start_time, db_event.end_time)
+        db_event.updated_at = now
+        db_event.next_reminder_at = compute_next_reminder(db_event, now)
+        spans.append(_event_span(db_event))
+
+    due = [(event_id, event.next_reminder_at) for event_id, event in events.items()]
+    db.commit()
+
+    _after_bulk_commit(spans, due)
+    return [update.id for update in updates]
+
+def delete_events_bulk(db: Session, event_ids: List[int]) -> List[int]:
+    """
+    Ta bort många händelser i en transaktion, med tombstones för synken
+
+    Raises:
+        LookupError om en händelse saknas (då tas inget bort)
+    """
+    if not event_ids:
+        return []
+    events = _events_by_id(db, event_ids)
+    spans = [_event_span(event) for event in events.values()]
+
+    now = datetime.utcnow()
+    db.execute(delete(models.Event).where(models.Event.id.in_(events.keys())))
+    db.execute(insert(models.EventDeletion), [{"event_id": event_id, "deleted_at": now} for event_id in events])
+    _prune_tombstones(db, now)
+    db.commit()
+
+    _after_bulk_commit(spans, [])
+    return list(dict.fromkeys(event_ids))
+
+# iCalendar-export
+def _export_filter(user_id: Optional[int]):
+    return models.Event.user_id == user_id if user_id is not None else true()
+
+def get_export_validator(db: Session, user_id: Optional[int] = None) -> Tuple[int, Optional[datetime]]:
+    """
+    Antal händelser och senaste ändring för ett export-flöde
+
+    Senaste ändringen tar även med borttagningar (tombstones), så att
+    Last-Modified flyttas fram när en händelse försvinner ur flödet.
+    """
+    count, last_updated = db.query(func.count(models.Event.id), func.max(models.Event.updated_at)).filter(
+        _export_filter(user_id)
+    ).one()
+    last_deleted = db.query(func.max(models.EventDeletion.deleted_at)).scalar()
+    return count, max(filter(None, [last_updated, last_deleted]), default=None)
+
+def iter_export_rows(db: Session, user_id: Optional[int] = None, batch_size: int = 500):
+    """
+    Alla sparade händelser (serier oexpanderade) som rader, i batcher
+
+    Med yield_per används en server-side cursor på Postgres, så bara en
+    batch i taget finns i minnet. Raderna är lätta Row-objekt, inga ORM-objekt.
+    """
+    query = (
+        select(
+            models.Event.id, models.Event.uid, models.Event.title, models.Event.description,
+            models.Event.start_time, models.Event.end_time, models.Event.all_day,
+            models.Event.reminder_enabled, models.Event.reminder_minutes,
+            models.Event.recurrence_type, models.Event.recurrence_interval, models.Event.recurrence_end_date,
+            models.Event.created_at, models.Event.updated_at,
+            models.User.name.label("owner_name"),
+        )
+        .join(models.User, models.Event.user_id == models.User.id)
+        .where(_export_filter(user_id))
+        .order_by(models.Event.id)
+        .execution_options(yield_per=batch_size)
+    )
+    yield from db.execute(query)
+
+# Inkrementell synk
+# Överlapp för transaktioner som committas strax efter att en synk-token
+# skapats; klienter applicerar ändringar idempotent så dubbletter är ofarliga
+SYNC_OVERLAP = timedelta(seconds=5)
+# Tombstones sparas så här länge; äldre tokens får en fullständig omsynk
+SYNC_TOMBSTONE_RETENTION = timedelta(days=int(os.getenv("SYNC_TOMBSTONE_RETENTION_DAYS", "30")))
+# Antal händelser per sida vid fullständig synk
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "1000"))
+
+def encode_sync_token(timestamp: datetime) -> str:
+    return base64.urlsafe_b64encode(timestamp.isoformat().encode("utf-8")).decode("ascii")
+
+def decode_sync_token(token: str) -> datetime:
+    """Tolka en token från encode_sync_token. Kastar ValueError om den är ogiltig"""
+    try:
+        return datetime.fromisoformat(base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8"))
+    except Exception:
+        raise ValueError("Ogiltig synk-token")
+
+def _prune_tombstones(db: Session, now: datetime):
+    """Ta bort tombstones äldre än SYNC_TOMBSTONE_RETENTION (använder ix_event_deletions_deleted_at)"""
+    db.query(models.EventDeletion).filter(
+        models.EventDeletion.deleted_at < now - SYNC_TOMBSTONE_RETENTION
+    ).delete(synchronize_session=False)
+
+def _full_sync_page(db: Session, started_at: datetime, after_id: int, reset: bool) -> dict:
+    """
+    En sida av en fullständig synk (alla händelser sorterade på id)
+
+    Cursorn bär synkens starttid, så next_token blir densamma på alla sidor
+    och nästa inkrementella synk fångar det som ändrats under sidhämtningen.
+    """
+    events = _event_query(db).filter(models.Event.id > after_id).order_by(
+        models.Event.id
+    ).limit(SYNC_PAGE_SIZE + 1).all()
+    next_cursor = None
+    if len(events) > SYNC_PAGE_SIZE:
+        events = events[:SYNC_PAGE_SIZE]
+        next_cursor = encode_cursor(started_at, events[-1].id)
+    return {
+        "created": events, "updated": [], "deleted": [],
+        "next_token": encode_sync_token(started_at), "next_cursor": next_cursor, "reset": reset,
+    }
+
+def get_event_changes(db: Session, since: Optional[str] = None, cursor: Optional[str] = None) -> dict:
+    """
+    Hämta ändringar sedan en synk-token
+
+    Utan token returneras alla händelser som skapade (första synken), en sida
+    i taget: så länge next_cursor är satt hämtas nästa sida med cursor. En
+    token som är äldre än SYNC_TOMBSTONE_RETENTION (borttagningar kan ha
+    rensats) ger också en fullständig synk, med reset satt på första sidan
+    så att klienten kastar sina lokala händelser.
+    Återkommande serier returneras som sparade rader, inte expanderade.
+
+    Returns:
+        Dict med fälten i schemas.EventChanges
+    """
+    if cursor is not None:
+        started_at, after_id = decode_cursor(cursor)
+        return _full_sync_page(db, started_at, after_id, reset=False)
+
+    # Nästa token sätts innan läsningen så att inget som ändras under tiden missas
+    now = datetime.utcnow()
+    next_token = encode_sync_token(now)
+
+    if since is None:
+        return _full_sync_page(db, now, 0, reset=False)
+
+    since_dt = decode_sync_token(since) - SYNC_OVERLAP
+    if since_dt < now - SYNC_TOMBSTONE_RETENTION:
+        return _full_sync_page(db, now, 0, reset=True)
+
+    changed = _event_query(db).filter(
+        models.Event.updated_at > since_dt
+    ).order_by(models.Event.updated_at, models.Event.id).all()
+    created = [event for event in changed if event.created_at > since_dt]
+    updated = [event for event in changed if event.created_at <= since_dt]
+
+    deleted = [
+        event_id for (event_id,) in db.query(models.EventDeletion.event_id).filter(
+            models.EventDeletion.deleted_at > since_dt
+        ).order_by(models.EventDeletion.id)
+    ]
+
+    return {
+        "created": created, "updated": updated, "deleted": deleted,
+        "next_token": next_token, "next_cursor": None, "reset": False,
+    }
@@ -0,0 +1,76 @@
+"""
+Async-versioner av crud-funktionerna för event-API:t
+
+Funktionerna tar en session från database.get_api_db (AsyncSession eller
+Session) och kör samma logik som crud via database.run_db, så cache,
+invalidering, påminnelser och tombstones fungerar likadant i båda lägena.
+
+Skrivande funktioner returnerar Pydantic-scheman istället för ORM-objekt,
+så att inga attribut behöver lazy-laddas efter att sessionen lämnats.
+"""
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from . import crud, schemas
+from .database import run_db
+
+
+def _event_schema(db_event) -> Optional[schemas.Event]:
+    return schemas.Event.model_validate(db_event) if db_event is not None else None
+
+
+async def get_user(db, user_id: int) -> Optional[schemas.User]:
+    def load(session: Session):
+        user = crud.get_user(session, user_id=user_id)
+        return schemas.User.model_validate(user) if user is not None else None
+    return await run_db(db, load)
+
+
+async def get_event(db, event_id: int) -> Optional[schemas.Event]:
+    return await run_db(db, lambda session: _event_schema(crud.get_event(session, event_id=event_id)))
+
+
+async def get_events_page(db, **kwargs):
+    return await run_db(db, crud.get_events_page, **kwargs)
+
+
+async def get_events_validator(db, start_date: datetime, end_date: datetime):
+    return await run_db(db, crud.get_events_validator, start_date, end_date)
+
+
+async def get_event_changes(db, since: Optional[str] = None, cursor: Optional[str] = None) -> schemas.EventChanges:
+    def load(session: Session):
+        return schemas.EventChanges(**crud.get_event_changes(session, since=since, cursor=cursor))
+    return await run_db(db, load)
+
+
+async def create_event(db, event: schemas.EventCreate) -> schemas.Event:
+    return await run_db(db, lambda session: _event_schema(crud.create_event(session, event=event)))
+
+
+async def update_event(db, event_id: int, event_update: schemas.EventUpdate) -> Optional[schemas.Event]:
+    return await run_db(
+        db, lambda session: _event_schema(crud.update_event(session, event_id=event_id, event_update=event_update))
+    )
+
+
+async def delete_event(db, event_id: int) -> bool:
+    return await run_db(db, crud.delete_event, event_id=event_id)
+
+
+async def get_export_validator(db, user_id: Optional[int] = None):
+    return await run_db(db, crud.get_export_validator, user_id)
+
+
+async def create_events_bulk(db, events: List[schemas.EventCreate]) -> List[int]:
+    return await run_db(db, crud.create_events_bulk, events)
+
+
+async def update_events_bulk(db, updates: List[schemas.EventBulkUpdateItem]) -> List[int]:
+    return await run_db(db, crud.update_events_bulk, updates)
+
+
+async def delete_events_bulk(db, event_ids: List[int]) -> List[int]:
+    return await run_db(db, crud.delete_events_bulk, event_ids)
@@ -0,0 +1,157 @@
+"""
+Dublettskydd för händelser som AI-assistenten skapar
+
+En bokning identifieras av (chatt-session, händelse-hash). create_event_tool
+reserverar nyckeln (claim) innan händelsen skapas, sparar event_id när den
+är skapad (complete) och släpper reservationen om skapandet misslyckas
+(release). Nycklar gäller i AI_DEDUP_TTL_SECONDS.
+
+Två backends, väljs med AI_DEDUP_BACKEND:
+- memory (standard): per process. Posterna ligger i en OrderedDict i
+  reservationsordning, vilket med en fast TTL också är utgångsordning, så
+  utgångna poster tas bort från början i O(1) amorterat. Antalet poster har
+  ett hårt tak (AI_DEDUP_MAX_ENTRIES).
+- database: tabellen ai_event_claims med unik nyckel (session_id, event_hash),
+  så skyddet gäller över alla uvicorn-workers.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+
+AI_DEDUP_BACKEND = os.getenv("AI_DEDUP_BACKEND", "memory").lower()
+AI_DEDUP_TTL_SECONDS = float(os.getenv("AI_DEDUP_TTL_SECONDS", "600"))
+AI_DEDUP_MAX_ENTRIES = int(os.getenv("AI_DEDUP_MAX_ENTRIES", "10000"))
+# Databas-backend: rensa utgångna rader var N:e reservation
+AI_DEDUP_CLEANUP_EVERY = 100
+
+
+class MemoryDedupStore:
+    """In-process store: OrderedDict i reservationsordning med TTL och storlekstak"""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (session_id, event_hash) -> (reserverad vid, event_id eller None)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Optional[int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        while self._entries:
+            claimed_at, _ = next(iter(self._entries.values()))
+            if now - claimed_at <= self.ttl:
+                break
+            self._entries.popitem(last=False)
+
+    def claim(self, db: Session, session_id: str, event_hash: str) -> Tuple[bool, Optional[int]]:
+        """
+        Reservera nyckeln
+
+        Returns:
+            (True, None) om nyckeln var ledig, annars (False, event_id) där
+            event_id är None om händelsen fortfarande skapas
+        """
+        key = (session_id, event_hash)
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            if key in self._entries:
+                return False, self._entries[key][1]
+            self._entries[key] = (now, None)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True, None
+
+    def complete(self, db: Session, session_id: str, event_hash: str, event_id: int):
+        key = (session_id, event_hash)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                # Ny tupel för samma nyckel behåller platsen i ordningen
+                self._entries[key] = (entry[0], event_id)
+
+    def release(self, db: Session, session_id: str, event_hash: str):
+        with self._lock:
+            self._entries.pop((session_id, event_hash), None)
+
+
+class DatabaseDedupStore:
+    """Store i tabellen ai_event_claims, delad mellan alla processer"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._claims = 0
+        self._lock = threading.Lock()
+
+    def _cutoff(self) -> datetime:
+        return datetime.utcnow() - timedelta(seconds=self.ttl)
+
+    def _cleanup_due(self) -> bool:
+        with self._lock:
+            self._claims += 1
+            return self._claims % AI_DEDUP_CLEANUP_EVERY == 1
+
+    def _query(self, db: Session, session_id: str, event_hash: str):
+        return db.query(models.AiEventClaim).filter(
+            models.AiEventClaim.session_id == session_id,
+            models.AiEventClaim.event_hash == event_hash,
+        )
+
+    def claim(self, db: Session, session_id: str, event_hash: str) -> Tuple[bool, Optional[int]]:
+        """Se MemoryDedupStore.claim. Den unika nyckeln avgör vem som vinner"""
+        cutoff = self._cutoff()
+        if self._cleanup_due():
+            db.query(models.AiEventClaim).filter(
+                models.AiEventClaim.created_at < cutoff
+            ).delete(synchronize_session=False)
+
+        # Andra försöket görs bara om en utgången rad tagits bort
+        for _ in range(2):
+            db.add(models.AiEventClaim(session_id=session_id, event_hash=event_hash))
+            try:
+                db.commit()
+                return True, None
+            except IntegrityError:
+                db.rollback()
+
+            existing = self._query(db, session_id, event_hash).first()
+            if existing is None:
+                # Släpptes under tiden
+                continue
+            if existing.created_at is not None and existing.created_at >= cutoff:
+                return False, existing.event_id
+            # Utgången rad: ta bort den (om ingen annan hunnit före) och försök igen
+            db.expunge(existing)
+            self._query(db, session_id, event_hash).filter(
+                models.AiEventClaim.created_at < cutoff
+            ).delete(synchronize_session=False)
+            db.commit()
+
+        return False, None
+
+    def complete(self, db: Session, session_id: str, event_hash: str, event_id: int):
+        self._query(db, session_id, event_hash).update({"event_id": event_id}, synchronize_session=False)
+        db.commit()
+
+    def release(self, db: Session, session_id: str, event_hash: str):
+        db.rollback()
+        self._query(db, session_id, event_hash).delete(synchronize_session=False)
+        db.commit()
+
+
+def _create_store():
+    if AI_DEDUP_BACKEND == "database":
+        return DatabaseDedupStore(ttl=AI_DEDUP_TTL_SECONDS)
+    if AI_DEDUP_BACKEND != "memory":
+        print(f"Okänd AI_DEDUP_BACKEND '{AI_DEDUP_BACKEND}', använder memory")
+    return MemoryDedupStore(ttl=AI_DEDUP_TTL_SECONDS, max_entries=AI_DEDUP_MAX_ENTRIES)
+
+
+store = _create_store()
@@ -0,0 +1,527 @@
+"""
+iCalendar (RFC 5545): export och import av kalendern
+
+Export: flödet byggs rad för rad från en server-side cursor
+(crud.iter_export_rows), så minnet är konstant oavsett hur lång historiken
+är. Återkommande serier skrivs som en VEVENT med RRULE istället för
+expanderade förekomster.
+
+Import: filen läses rad för rad (med unfolding) och VEVENTs samlas i
+batcher som skrivs med crud.create_events_bulk. Enkla RRULEs översätts
+till recurrence_type/recurrence_interval; övriga serier hoppas över.
+
+Tider lagras som naiva UTC-tider och skrivs med Z-suffix. Heldagshändelser
+och tider utan tidszon tolkas i ICAL_TIMEZONE (samma tidszon som frontend visar).
+"""
+import hashlib
+import io
+import os
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from . import crud, models, notifications, schemas
+from .database import SessionLocal
+from .recurrence import occurrence_start
+
+ICAL_TIMEZONE = ZoneInfo(os.getenv("ICAL_TIMEZONE", "Europe/Stockholm"))
+ICAL_UID_DOMAIN = os.getenv("ICAL_UID_DOMAIN", "familjekalender")
+# Antal händelser per INSERT/commit vid import
+ICAL_IMPORT_BATCH_SIZE = int(os.getenv("ICAL_IMPORT_BATCH_SIZE", "500"))
+PRODID = "-//Familjekalender//Familjekalender API//SV"
+
+# Max längd för en rad i oktetter, exklusive CRLF (RFC 5545 avsnitt 3.1)
+_MAX_LINE_OCTETS = 75
+
+# Antal VEVENTs per textbit som skickas till klienten
+_CHUNK_EVENTS = 200
+
+_FREQ = {"daily": "DAILY", "weekly": "WEEKLY", "monthly": "MONTHLY"}
+
+
+def escape_text(value: str) -> str:
+    """Escapa TEXT-värden (avsnitt 3.3.11)"""
+    return (
+        value.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+        .replace("\r", "\\n")
+    )
+
+
+def fold_line(line: str) -> str:
+    """Vik en rad till högst 75 oktetter per fysisk rad, utan att dela UTF-8-tecken"""
+    if len(line.encode("utf-8")) <= _MAX_LINE_OCTETS:
+        return line + "\r\n"
+    parts = []
+    current = []
+    size = 0
+    limit = _MAX_LINE_OCTETS
+    for char in line:
+        char_size = len(char.encode("utf-8"))
+        if size + char_size > limit:
+            parts.append("".join(current))
+            current = []
+            size = 0
+            # Fortsättningsrader börjar med ett mellanslag som räknas in i längden
+            limit = _MAX_LINE_OCTETS - 1
+        current.append(char)
+        size += char_size
+    parts.append("".join(current))
+    return "\r\n ".join(parts) + "\r\n"
+
+
+# Formateras för hand; strftime är den dyraste delen av en VEVENT
+def format_utc(value: datetime) -> str:
+    return (
+        f"{value.year:04d}{value.month:02d}{value.day:02d}"
+        f"T{value.hour:02d}{value.minute:02d}{value.second:02d}Z"
+    )
+
+
+def format_date(value: date) -> str:
+    return f"{value.year:04d}{value.month:02d}{value.day:02d}"
+
+
+def local_date(value: datetime) -> date:
+    """Datumet i ICAL_TIMEZONE för en naiv UTC-tid"""
+    return value.replace(tzinfo=timezone.utc).astimezone(ICAL_TIMEZONE).date()
+
+
+def all_day_dates(start_time: datetime, end_time: datetime):
+    """(DTSTART, DTEND) för en heldagshändelse; DTEND är exklusivt"""
+    start = local_date(start_time)
+    local_end = end_time.replace(tzinfo=timezone.utc).astimezone(ICAL_TIMEZONE)
+    end = local_end.date()
+    # Ett slut precis vid midnatt räknas som exklusivt redan, annars tas hela dagen med
+    if local_end.time() != time(0) or end <= start:
+        end += timedelta(days=1)
+    return start, end
+
+
+def rrule(recurrence_type: str, interval: Optional[int], start_time: datetime,
+          end_date: Optional[datetime], all_day: bool) -> Optional[str]:
+    """
+    RRULE för en serie, eller None för enstaka händelser och okända typer
+
+    Månadsserier som startar efter den 28:e klipps till månadens sista dag
+    i recurrence.py; det motsvaras av BYMONTHDAY=28..dag med BYSETPOS=-1
+    (den sista av de dagarna som finns i månaden). Dagen är DTSTART:s datum
+    i ICAL_TIMEZONE, inte UTC-datumet som sparas.
+    """
+    freq = _FREQ.get(recurrence_type)
+    if freq is None:
+        return None
+    parts = [f"FREQ={freq}", f"INTERVAL={max(1, interval or 1)}"]
+    day = local_date(start_time).day
+    if recurrence_type == "monthly" and day > 28:
+        parts.append("BYMONTHDAY=" + ",".join(str(d) for d in range(28, day + 1)))
+        parts.append("BYSETPOS=-1")
+    if end_date is not None:
+        # UNTIL måste ha samma värdetyp som DTSTART
+        parts.append("UNTIL=" + (format_date(local_date(end_date)) if all_day else format_utc(end_date)))
+    return "RRULE:" + ";".join(parts)
+
+
+def event_uid(event_id: int) -> str:
+    return f"event-{event_id}@{ICAL_UID_DOMAIN}"
+
+
+def vevent(row, include_owner: bool) -> str:
+    """En VEVENT för en rad från crud.iter_export_rows"""
+    summary = f"{row.owner_name}: {row.title}" if include_owner else row.title
+    modified = format_utc(row.updated_at)
+    lines: List[str] = [
+        "BEGIN:VEVENT",
+        f"UID:{escape_text(row.uid) if row.uid else event_uid(row.id)}",
+        f"DTSTAMP:{modified}",
+        f"CREATED:{format_utc(row.created_at)}",
+        f"LAST-MODIFIED:{modified}",
+    ]
+    if row.all_day:
+        start, end = all_day_dates(row.start_time, row.end_time)
+        lines.append(f"DTSTART;VALUE=DATE:{format_date(start)}")
+        lines.append(f"DTEND;VALUE=DATE:{format_date(end)}")
+    else:
+        lines.append(f"DTSTART:{format_utc(row.start_time)}")
+        lines.append(f"DTEND:{format_utc(row.end_time)}")
+    rule = rrule(row.recurrence_type, row.recurrence_interval, row.start_time, row.recurrence_end_date, row.all_day)
+    if rule:
+        lines.append(rule)
+    lines.append(f"SUMMARY:{escape_text(summary)}")
+    if row.description:
+        lines.append(f"DESCRIPTION:{escape_text(row.description)}")
+    lines.append(f"CATEGORIES:{escape_text(row.owner_name)}")
+    if row.reminder_enabled:
+        lines += [
+            "BEGIN:VALARM",
+            "ACTION:DISPLAY",
+            f"DESCRIPTION:{escape_text(row.title)}",
+            f"TRIGGER:-PT{row.reminder_minutes or 0}M",
+            "END:VALARM",
+        ]
+    lines.append("END:VEVENT")
+    return "".join(fold_line(line) for line in lines)
+
+
+def calendar_chunks(rows: Iterable, calendar_name: str, include_owner: bool) -> Iterator[str]:
+    """
+    Hela VCALENDAR-dokumentet som en ström av textbitar
+
+    rows ska vara en iterator som hämtar i batcher. Händelserna skickas i
+    bitar om _CHUNK_EVENTS, så antalet skrivningar till klienten hålls nere
+    utan att hela dokumentet buffras.
+    """
+    yield "".join(fold_line(line) for line in [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{escape_text(calendar_name)}",
+    ])
+    chunk: List[str] = []
+    for row in rows:
+        chunk.append(vevent(row, include_owner))
+        if len(chunk) >= _CHUNK_EVENTS:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+    yield fold_line("END:VCALENDAR")
+
+
+def stream_calendar(user_id: Optional[int], calendar_name: str) -> Iterator[str]:
+    """
+    Export-flödet för StreamingResponse
+
+    Generatorn har en egen session som lever lika länge som svaret; Starlette
+    itererar den i en trådpool så att databasläsningen inte blockerar event-loopen.
+    """
+    db = SessionLocal()
+    try:
+        rows = crud.iter_export_rows(db, user_id=user_id)
+        yield from calendar_chunks(rows, calendar_name, include_owner=user_id is None)
+    finally:
+        db.close()
+
+
+# Import
+
+def unfold_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Slå ihop vikta rader (fortsättningsrader börjar med mellanslag eller tab)"""
+    parts: List[str] = []
+    for raw in lines:
+        line = raw.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and parts:
+            parts.append(line[1:])
+            continue
+        if parts:
+            yield "".join(parts)
+        parts = [line] if line else []
+    if parts:
+        yield "".join(parts)
+
+
+def parse_content_line(line: str) -> Optional[Tuple[str, Dict[str, str], str]]:
+    """(NAMN, parametrar, värde) för en innehållsrad, eller None om raden är trasig"""
+    colon = line.find(":")
+    if colon < 0:
+        return None
+    if '"' in line[:colon]:
+        # Kolon inom citerade parametervärden (t.ex. TZID="a:b") räknas inte
+        in_quotes = False
+        for colon, char in enumerate(line):
+            if char == '"':
+                in_quotes = not in_quotes
+            elif char == ":" and not in_quotes:
+                break
+        else:
+            return None
+    name, *param_parts = line[:colon].split(";")
+    params = {}
+    for part in param_parts:
+        key, _, value = part.partition("=")
+        params[key.upper()] = value.strip('"')
+    return name.upper(), params, line[colon + 1:]
+
+
+def iter_vevents(lines: Iterable[str]) -> Iterator[Dict[str, Tuple[Dict[str, str], str]]]:
+    """
+    Egenskaperna för varje VEVENT som {NAMN: (parametrar, värde)}
+
+    Bara första förekomsten av en egenskap sparas. TRIGGER från den första
+    VALARM:en sparas som "VALARM-TRIGGER"; andra underkomponenter ignoreras.
+    """
+    current: Optional[Dict[str, Tuple[Dict[str, str], str]]] = None
+    nested: List[str] = []
+    for line in unfold_lines(lines):
+        parsed = parse_content_line(line)
+        if parsed is None:
+            continue
+        name, params, value = parsed
+        if name == "BEGIN":
+            if value.upper() == "VEVENT":
+                current, nested = {}, []
+            elif current is not None:
+                nested.append(value.upper())
+        elif name == "END":
+            if value.upper() == "VEVENT":
+                if current is not None:
+                    yield current
+                current = None
+            elif nested:
+                nested.pop()
+        elif current is not None:
+            if not nested:
+                current.setdefault(name, (params, value))
+            elif nested[-1] == "VALARM" and name == "TRIGGER":
+                current.setdefault("VALARM-TRIGGER", (params, value))
+
+
+def unescape_text(value: str) -> str:
+    """Motsatsen till escape_text"""
+    if "\\" not in value:
+        return value
+    return re.sub(r"\\([\\;,nN])", lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+
+
+@lru_cache(maxsize=64)
+def _zone(tzid: Optional[str]):
+    if not tzid:
+        return ICAL_TIMEZONE
+    try:
+        return ZoneInfo(tzid.lstrip("/"))
+    except (ZoneInfoNotFoundError, ValueError):
+        # T.ex. Windows-namn som "W. Europe Standard Time"
+        return ICAL_TIMEZONE
+
+
+def _to_utc(value: datetime, zone) -> datetime:
+    return value.replace(tzinfo=zone).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def parse_time(value: str, params: Dict[str, str]) -> Tuple[datetime, bool]:
+    """
+    (naiv UTC-tid, är datum) för ett DATE- eller DATE-TIME-värde
+
+    Datum tolkas som midnatt i ICAL_TIMEZONE. Kastar ValueError om värdet är trasigt.
+    """
+    value = value.strip()
+    day = date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return _to_utc(datetime.combine(day, time(0)), ICAL_TIMEZONE), True
+    if value[8] != "T":
+        raise ValueError(f"Ogiltig tid: {value}")
+    local = datetime(day.year, day.month, day.day, int(value[9:11]), int(value[11:13]), int(value[13:15]))
+    if value.endswith("Z"):
+        return local, False
+    return _to_utc(local, _zone(params.get("TZID"))), False
+
+
+_DURATION = re.compile(r"^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+
+
+def parse_duration(value: str) -> Optional[timedelta]:
+    match = _DURATION.match(value.strip())
+    if not match:
+        return None
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    duration = timedelta(
+        weeks=int(weeks or 0), days=int(days or 0),
+        hours=int(hours or 0), minutes=int(minutes or 0), seconds=int(seconds or 0)
+    )
+    return -duration if sign == "-" else duration
+
+
+_WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+# Regeldelar som inte ändrar vilka förekomster serien har (eller som kontrolleras nedan)
+_HANDLED_RULE_PARTS = {"FREQ", "INTERVAL", "UNTIL", "COUNT", "WKST", "BYDAY", "BYMONTHDAY", "BYSETPOS"}
+_RECURRENCE_TYPES = {"DAILY": "daily", "WEEKLY": "weekly", "MONTHLY": "monthly"}
+
+
+def map_rrule(value: str, start_time: datetime, all_day: bool) -> Optional[Tuple[str, int, Optional[datetime]]]:
+    """
+    (recurrence_type, recurrence_interval, recurrence_end_date) för en RRULE
+
+    Stöds: DAILY/WEEKLY/MONTHLY med INTERVAL, UNTIL eller COUNT, samt BYDAY
+    och BYMONTHDAY när de bara upprepar DTSTART:s veckodag respektive dag
+    (och månadsmönstret som export skriver för dagar efter den 28:e).
+    COUNT räknas om till ett slutdatum. Returnerar None för allt annat.
+    """
+    parts = dict(part.partition("=")[::2] for part in value.upper().split(";") if part)
+    recurrence_type = _RECURRENCE_TYPES.get(parts.get("FREQ", ""))
+    if recurrence_type is None or not parts.keys() <= _HANDLED_RULE_PARTS:
+        return None
+    try:
+        interval = max(1, int(parts.get("INTERVAL", "1")))
+    except ValueError:
+        return None
+
+    local_start = start_time.replace(tzinfo=timezone.utc).astimezone(ICAL_TIMEZONE)
+    if "BYDAY" in parts and (recurrence_type != "weekly" or parts["BYDAY"] != _WEEKDAYS[local_start.weekday()]):
+        return None
+    if "BYMONTHDAY" in parts or "BYSETPOS" in parts:
+        if recurrence_type != "monthly":
+            return None
+        clamped = ",".join(str(day) for day in range(28, local_start.day + 1))
+        same_day = parts.get("BYMONTHDAY") == str(local_start.day) and "BYSETPOS" not in parts
+        last_day_pattern = parts.get("BYMONTHDAY") == clamped and parts.get("BYSETPOS") == "-1"
+        if not (same_day or last_day_pattern):
+            return None
+
+    end_date = None
+    if "UNTIL" in parts:
+        try:
+            end_date, is_date = parse_time(parts["UNTIL"], {})
+        except (ValueError, IndexError):
+            return None
+        if is_date and not all_day:
+            # UNTIL som datum gäller hela dagen
+            end_date += timedelta(days=1, seconds=-1)
+    elif "COUNT" in parts:
+        try:
+            count = int(parts["COUNT"])
+        except ValueError:
+            return None
+        if count < 1:
+            return None
+        series = models.Event(start_time=start_time, recurrence_type=recurrence_type, recurrence_interval=interval)
+        end_date = occurrence_start(series, count - 1)
+    return recurrence_type, interval, end_date
+
+
+class UnsupportedEvent(Exception):
+    """En VEVENT som inte går att representera i kalendern"""
+
+
+def to_event(props: Dict[str, Tuple[Dict[str, str], str]], user_id: int) -> Tuple[schemas.EventCreate, str]:
+    """
+    (händelse, UID) för en VEVENT
+
+    Raises:
+        UnsupportedEvent för avbokade händelser, undantag från serier
+        (RECURRENCE-ID), regler som inte går att översätta och trasiga tider
+    """
+    if "RECURRENCE-ID" in props or "RDATE" in props:
+        raise UnsupportedEvent("Undantag från serie")
+    if props.get("STATUS", ({}, ""))[1].upper() == "CANCELLED":
+        raise UnsupportedEvent("Avbokad")
+    if "DTSTART" not in props:
+        raise UnsupportedEvent("DTSTART saknas")
+
+    try:
+        start_time, all_day = parse_time(props["DTSTART"][1], props["DTSTART"][0])
+        if "DTEND" in props:
+            end_time, _ = parse_time(props["DTEND"][1], props["DTEND"][0])
+        elif "DURATION" in props and parse_duration(props["DURATION"][1]) is not None:
+            end_time = start_time + parse_duration(props["DURATION"][1])
+        else:
+            end_time = start_time + timedelta(days=1) if all_day else start_time
+    except (ValueError, IndexError):
+        raise UnsupportedEvent("Ogiltig tid")
+    if all_day:
+        # DTEND är exklusivt; appen sparar heldagar till 23:59:59 sista dagen
+        end_time = max(start_time + timedelta(days=1), end_time) - timedelta(seconds=1)
+    end_time = max(end_time, start_time)
+
+    recurrence = ("none", 1, None)
+    if "RRULE" in props:
+        recurrence = map_rrule(props["RRULE"][1], start_time, all_day)
+        if recurrence is None:
+            raise UnsupportedEvent("RRULE stöds inte")
+
+    reminder_minutes = None
+    if "VALARM-TRIGGER" in props and props["VALARM-TRIGGER"][0].get("VALUE", "DURATION") == "DURATION":
+        trigger = parse_duration(props["VALARM-TRIGGER"][1])
+        if trigger is not None and trigger <= timedelta(0):
+            reminder_minutes = int(-trigger.total_seconds() // 60)
+
+    title = unescape_text(props.get("SUMMARY", ({}, ""))[1]).strip() or "(utan titel)"
+    description = unescape_text(props["DESCRIPTION"][1]) if "DESCRIPTION" in props else None
+    uid = props.get("UID", ({}, ""))[1].strip()
+    if not uid:
+        # Utan UID dedupliceras på innehållet istället
+        uid = "generated-" + hashlib.sha1(f"{title}|{start_time.isoformat()}".encode("utf-8")).hexdigest()
+
+    event = schemas.EventCreate(
+        title=title,
+        description=description,
+        start_time=start_time,
+        end_time=end_time,
+        all_day=all_day,
+        user_id=user_id,
+        reminder_enabled=reminder_minutes is not None,
+        reminder_minutes=reminder_minutes if reminder_minutes is not None else 30,
+        recurrence_type=recurrence[0],
+        recurrence_interval=recurrence[1],
+        recurrence_end_date=recurrence[2],
+    )
+    return event, uid
+
+
+_OWN_UID = re.compile(r"^event-(\d+)@" + re.escape(ICAL_UID_DOMAIN) + "$")
+
+
+def _insert_batch(db, batch: Dict[str, schemas.EventCreate], result: schemas.CalendarImportResult):
+    """Skriv en batch, utan händelser vars UID redan finns"""
+    existing = crud.get_existing_uids(db, list(batch))
+    # Händelser från vår egen export har UID:t event-<id>@domän men inget sparat uid
+    own_ids = {uid: int(match.group(1)) for uid in batch if (match := _OWN_UID.match(uid))}
+    if own_ids:
+        found = crud.get_existing_event_ids(db, list(own_ids.values()))
+        existing |= {uid for uid, event_id in own_ids.items() if event_id in found}
+
+    new = {uid: event for uid, event in batch.items() if uid not in existing}
+    result.duplicates += len(batch) - len(new)
+    if new:
+        # En samtidig import kan ha skrivit samma UID efter kontrollen ovan;
+        # de raderna hoppas över av INSERT:en och räknas också som dubbletter
+        created = len(crud.create_events_bulk(db, list(new.values()), uids=list(new), notify=False))
+        result.created += created
+        result.duplicates += len(new) - created
+
+
+def import_calendar(file: BinaryIO, user_id: int, user_name: str) -> schemas.CalendarImportResult:
+    """
+    Importera en .ics-fil till en användare
+
+    Filen läses rad för rad och händelserna skrivs i batcher om
+    ICAL_IMPORT_BATCH_SIZE, så minnet beror på batchstorleken och inte på
+    filens storlek. En batch som redan skrivits ligger kvar om en senare
+    misslyckas; eftersom UID:n dedupliceras kan samma fil bara importeras igen.
+    """
+    result = schemas.CalendarImportResult()
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace", newline="")
+    db = SessionLocal()
+    try:
+        batch: Dict[str, schemas.EventCreate] = {}
+        for props in iter_vevents(text):
+            try:
+                event, uid = to_event(props, user_id)
+            except UnsupportedEvent:
+                result.unsupported += 1
+                continue
+            if uid in batch:
+                result.duplicates += 1
+                continue
+            batch[uid] = event
+            if len(batch) >= ICAL_IMPORT_BATCH_SIZE:
+                _insert_batch(db, batch, result)
+                batch = {}
+        if batch:
+            _insert_batch(db, batch, result)
+
+        # En notifikation för hela importen
+        if result.created:
+            notifications.queue_events_created(db, {user_name: result.created})
+            db.commit()
+    finally:
+        db.close()
+        # Filen stängs av anroparen, inte av TextIOWrapper
+        text.detach()
+    return result
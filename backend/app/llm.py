@@ -0,0 +1,235 @@
+"""
+LLM- och transkriberingsleverantörer för AI-assistenten
+
+ai.py pratar bara med en provider:
+- complete(**kwargs): chat completion (async), samma argument och svarsform
+  som Groqs chat.completions.create, inklusive stream=True
+- transcribe(**kwargs): transkribering (blockerande), som Groqs
+  audio.transcriptions.create
+
+Providern väljs med AI_PROVIDER:
+- groq (standard): Groq-klienterna skapas först vid första anropet, så att
+  appen kan startas utan Groq-SDK:t eller en API-nyckel
+- fake: deterministisk lokal ersättare med konfigurerbar latens och
+  skriptade verktygsanrop, för benchmarks och lasttester utan nätverk
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+AI_PROVIDER = os.getenv("AI_PROVIDER", "groq").lower()
+# Fake-providern: latens per anrop, fördröjning per strömmad token och skript
+AI_FAKE_LATENCY_MS = float(os.getenv("AI_FAKE_LATENCY_MS", "300"))
+AI_FAKE_TOKEN_DELAY_MS = float(os.getenv("AI_FAKE_TOKEN_DELAY_MS", "5"))
+AI_FAKE_SCRIPT = os.getenv("AI_FAKE_SCRIPT")
+
+
+class LLMTimeoutError(Exception):
+    """Ett anrop till leverantören tog för lång tid"""
+
+
+class GroqProvider:
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    def _clients(self):
+        # Importeras och skapas först när de behövs
+        with self._lock:
+            if self._client is None:
+                from groq import AsyncGroq, Groq
+                api_key = os.getenv("GROQ_API_KEY")
+                self._client = Groq(api_key=api_key)
+                self._async_client = AsyncGroq(api_key=api_key, timeout=self.timeout, max_retries=1)
+            return self._client, self._async_client
+
+    async def complete(self, **kwargs):
+        from groq import APITimeoutError
+        _, async_client = self._clients()
+        try:
+            response = await async_client.chat.completions.create(**kwargs)
+        except APITimeoutError as e:
+            raise LLMTimeoutError(str(e)) from e
+        if kwargs.get("stream"):
+            return _GroqStream(response)
+        return response
+
+    def transcribe(self, **kwargs) -> str:
+        client, _ = self._clients()
+        return client.audio.transcriptions.create(**kwargs)
+
+
+class _GroqStream:
+    """Översätter Groqs timeout-fel under strömningen till LLMTimeoutError"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        from groq import APITimeoutError
+        try:
+            return await self._stream.__anext__()
+        except APITimeoutError as e:
+            raise LLMTimeoutError(str(e)) from e
+
+    async def close(self):
+        await self._stream.close()
+
+
+# Standardskript för fake-providern: första regeln vars match finns i
+# användarens meddelande (gemener) används, annars svaras med "reply".
+_DEFAULT_FAKE_SCRIPT: List[Dict[str, Any]] = [
+    {
+        "match": "boka",
+        "tool_calls": [{
+            "name": "create_event",
+            "arguments": {
+                "title": "{message}",
+                "start_time": "{tomorrow}T12:00:00",
+                "end_time": "{tomorrow}T13:00:00",
+                "user_id": 1
+            }
+        }]
+    },
+    {
+        "match": "",
+        "tool_calls": [
+            {"name": "get_users", "arguments": {}},
+            {"name": "get_events", "arguments": {"start_date": "{today}", "end_date": "{week}"}}
+        ]
+    },
+]
+
+
+class FakeProvider:
+    """
+    Deterministisk ersättare för Groq
+
+    Varje anrop väntar latency_ms (och token_delay_ms per strömmad token).
+    Första anropet i en tur svarar med verktygsanropen från skriptet; när
+    meddelandena slutar med verktygsresultat svarar den med en sammanfattning.
+    """
+
+    def __init__(self, latency_ms: float, token_delay_ms: float, script: Optional[List[Dict[str, Any]]] = None):
+        self.latency = latency_ms / 1000
+        self.token_delay = token_delay_ms / 1000
+        self.script = script or _DEFAULT_FAKE_SCRIPT
+
+    def _rule(self, message: str) -> Dict[str, Any]:
+        lowered = message.lower()
+        for rule in self.script:
+            if rule.get("match", "") in lowered:
+                return rule
+        return {"reply": "Okej!"}
+
+    @staticmethod
+    def _fill(value: Any, message: str) -> Any:
+        if isinstance(value, str):
+            today = datetime.now().date()
+            return value.format(
+                message=message[:40],
+                today=today.isoformat(),
+                tomorrow=(today + timedelta(days=1)).isoformat(),
+                week=(today + timedelta(days=7)).isoformat(),
+            )
+        if isinstance(value, dict):
+            return {key: FakeProvider._fill(item, message) for key, item in value.items()}
+        return value
+
+    def _answer(self, messages: List[Dict[str, Any]], tools: Optional[list]):
+        """(text, verktygsanrop) för den här punkten i konversationen"""
+        if messages[-1]["role"] == "tool":
+            results = [m for m in messages if m["role"] == "tool"]
+            summary = " ".join(str(m["content"]).splitlines()[0][:60] for m in results)
+            return f"Klart ({len(results)} verktyg): {summary}", []
+
+        message = str(messages[-1].get("content", ""))
+        rule = self._rule(message)
+        if tools and rule.get("tool_calls"):
+            calls = [
+                SimpleNamespace(
+                    id=f"call_{index}",
+                    type="function",
+                    function=SimpleNamespace(
+                        name=call["name"],
+                        arguments=json.dumps(self._fill(call.get("arguments", {}), message), ensure_ascii=False)
+                    )
+                )
+                for index, call in enumerate(rule["tool_calls"])
+            ]
+            return "", calls
+        return self._fill(rule.get("reply", "Okej!"), message), []
+
+    @staticmethod
+    def _usage(messages: List[Dict[str, Any]], text: str):
+        prompt_chars = sum(len(str(m.get("content") or "")) for m in messages)
+        return SimpleNamespace(prompt_tokens=prompt_chars // 4, completion_tokens=max(1, len(text) // 4))
+
+    async def complete(self, messages: List[Dict[str, Any]], tools: Optional[list] = None, stream: bool = False, **kwargs):
+        await asyncio.sleep(self.latency)
+        text, tool_calls = self._answer(messages, tools)
+        usage = self._usage(messages, text)
+        if stream:
+            return _FakeStream(text, tool_calls, usage, self.token_delay)
+        message = SimpleNamespace(content=text or None, tool_calls=tool_calls or None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    def transcribe(self, file, **kwargs) -> str:
+        time.sleep(self.latency)
+        _, audio_file = file
+        size = 0
+        while chunk := audio_file.read(64 * 1024):
+            size += len(chunk)
+        return f"Vad är bokat den här veckan? ({size} bytes)"
+
+
+class _FakeStream:
+    def __init__(self, text: str, tool_calls: list, usage, token_delay: float):
+        self._chunks = []
+        # Ungefär ett ord per token, som en riktig ström
+        for word in text.split(" ") if text else []:
+            self._chunks.append(SimpleNamespace(content=word + " ", tool_calls=None))
+        for index, call in enumerate(tool_calls):
+            self._chunks.append(SimpleNamespace(content=None, tool_calls=[
+                SimpleNamespace(index=index, id=call.id, function=call.function)
+            ]))
+        self._usage = usage
+        self._token_delay = token_delay
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._chunks:
+            raise StopAsyncIteration
+        await asyncio.sleep(self._token_delay)
+        delta = self._chunks.pop(0)
+        # Groq skickar förbrukningen i sista chunken
+        x_groq = SimpleNamespace(usage=self._usage) if not self._chunks else None
+        return SimpleNamespace(choices=[SimpleNamespace(delta=delta)], x_groq=x_groq)
+
+    async def close(self):
+        self._chunks = []
+
+
+def create_provider(timeout: float):
+    if AI_PROVIDER == "fake":
+        script = None
+        if AI_FAKE_SCRIPT:
+            with open(AI_FAKE_SCRIPT, encoding="utf-8") as f:
+                script = json.load(f)
+        print(f"AI_PROVIDER=fake (latens {AI_FAKE_LATENCY_MS:.0f} ms per anrop)")
+        return FakeProvider(AI_FAKE_LATENCY_MS, AI_FAKE_TOKEN_DELAY_MS, script)
+    if AI_PROVIDER != "groq":
+        print(f"Okänd AI_PROVIDER '{AI_PROVIDER}', använder groq")
+    return GroqProvider(timeout=timeout)
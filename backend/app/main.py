@@ -1,19 +1,55 @@
-from fastapi import FastAPI, Depends, HTTPException, Query, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, Query, UploadFile, File, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
 from typing import List, Optional
 from datetime import datetime
-import tempfile
+import asyncio
+import json
 import os
 
-from . import models, schemas, crud, notifications, ai
-from .database import engine, get_db
+from . import models, schemas, crud, crud_async, notifications, reminders, ai, serializers, conditional, pool, ical
+from .database import engine, async_engine, get_db, get_api_db, api_session
+from .uploads import UploadSizeLimitMiddleware
 
 # Databas-tabeller skapas via init_users.py
 # models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Familjekalender API")
+# Bakgrundsjobb som körs i API-processen (kan stängas av med env-variabler)
+NOTIFICATION_WORKER_ENABLED = os.getenv("NOTIFICATION_WORKER_ENABLED", "true").lower() == "true"
+REMINDER_SCHEDULER_ENABLED = os.getenv("REMINDER_SCHEDULER_ENABLED", "true").lower() == "true"
+# Max antal händelser per anrop till /api/events/bulk
+EVENTS_BULK_MAX = int(os.getenv("EVENTS_BULK_MAX", "5000"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = []
+    if NOTIFICATION_WORKER_ENABLED:
+        tasks.append(asyncio.create_task(notifications.run_outbox_worker()))
+    if REMINDER_SCHEDULER_ENABLED:
+        tasks.append(asyncio.create_task(reminders.scheduler.run()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+app = FastAPI(title="Familjekalender API", lifespan=lifespan)
+
+# Max storlek för ljudfiler (Groq Whisper tar max 25MB). Middlewaren räknar hela
+# multipart-bodyn (gränser och del-headers) och har därför lite marginal; den
+# exakta gränsen för själva filen kontrolleras i endpointen.
+# Läggs till före CORS så att CORS ligger ytterst och även 413-svaret får
+# Access-Control-headers (annars ser webbläsaren bara ett nätverksfel)
+TRANSCRIBE_MAX_BYTES = 25 * 1024 * 1024
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_bytes=TRANSCRIBE_MAX_BYTES + MULTIPART_OVERHEAD_BYTES,
+    paths=["/api/ai/transcribe"],
+)
 
 # CORS middleware för React frontend
 app.add_middleware(
@@ -22,6 +58,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified"],  # Paginering och villkorliga GET
 )
 
 # Servera React build i produktion
@@ -29,8 +66,16 @@ app.add_middleware(
 
 # User endpoints
 @app.get("/api/users", response_model=List[schemas.User])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_users(request: Request, response: Response, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    # Användare tas aldrig bort, så antal + senaste created_at räcker som validator
+    count, last_modified = crud.get_users_validator(db)
+    etag = conditional.make_etag("users", skip, limit, count, last_modified)
+    cached = conditional.not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+
     users = crud.get_users(db, skip=skip, limit=limit)
+    response.headers.update(conditional.validator_headers(etag, last_modified))
     return users
 
 @app.get("/api/users/{user_id}", response_model=schemas.User)
@@ -48,58 +93,212 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     return crud.create_user(db=db, user=user)
 
 # Event endpoints
+# Async endpoints: databasarbetet körs via crud_async (asyncpg om DB_ASYNC=true,
+# annars trådpoolen), så event-API:t inte begränsas av trådpoolens storlek
 @app.get("/api/events", response_model=List[schemas.Event])
-def read_events(
-    skip: int = 0,
-    limit: int = 1000,
+async def read_events(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1),
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None),
+    db = Depends(get_api_db)
 ):
+    """
+    Hämta events sorterade på (start_time, id)
+
+    Om det finns fler events än limit sätts headern X-Next-Cursor.
+    Skicka tillbaka värdet som cursor för att hämta nästa sida.
+
+    Svaret serialiseras direkt till JSON (serializers.dump_events_json)
+    utan Pydantic-validering per rad; formatet är detsamma som response_model.
+
+    Svaret har en ETag; med If-None-Match svarar endpointen 304 om inget
+    i fönstret har ändrats, utan att hämta eller serialisera några events.
+    """
     start_dt = datetime.fromisoformat(start_date) if start_date else None
     end_dt = datetime.fromisoformat(end_date) if end_date else None
+    start_dt, end_dt = crud.resolve_event_window(start_dt, end_dt)
+
+    count, last_modified = await crud_async.get_events_validator(db, start_dt, end_dt)
+    etag = conditional.make_etag(
+        "events", start_dt.isoformat(), end_dt.isoformat(), skip, limit, cursor, count, last_modified
+    )
+    # Borttagna events syns inte i Last-Modified, så bara ETag kan ge 304
+    cached = conditional.not_modified(request, etag, last_modified, use_if_modified_since=False)
+    if cached:
+        return cached
+
+    try:
+        events, next_cursor = await crud_async.get_events_page(
+            db, skip=skip, limit=limit, start_date=start_dt, end_date=end_dt, cursor=cursor,
+            validator=(count, last_modified)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = conditional.validator_headers(etag, last_modified)
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    # Serialiseringen är CPU-arbete och får inte blockera event-loopen
+    content = await run_in_threadpool(serializers.dump_events_json, events)
+    return Response(
+        content=content,
+        media_type="application/json",
+        headers=headers
+    )
+
+# Måste ligga före /api/events/{event_id}
+@app.get("/api/events/changes", response_model=schemas.EventChanges)
+async def read_event_changes(
+    since: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
+    db = Depends(get_api_db)
+):
+    """
+    Inkrementell synk: skapade, uppdaterade och borttagna händelser sedan en token
+
+    Första anropet görs utan since och returnerar alla händelser, en sida i
+    taget: skicka next_cursor som cursor tills den är null. Spara sedan
+    next_token och skicka den som since nästa gång för att bara få ändringarna.
+    Är token för gammal kommer en fullständig synk med reset satt.
+    """
+    try:
+        return await crud_async.get_event_changes(db, since=since, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Bulk-endpoints (måste också ligga före /api/events/{event_id})
+# Hela batchen valideras innan något skrivs och sparas i en transaktion
+def _check_bulk_size(count: int):
+    if count > EVENTS_BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"Max {EVENTS_BULK_MAX} händelser per anrop")
+
+async def _run_bulk(operation, db, items) -> schemas.EventBulkResult:
+    _check_bulk_size(len(items))
+    try:
+        ids = await operation(db, items)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return schemas.EventBulkResult(count=len(ids), ids=ids)
+
+@app.post("/api/events/bulk", response_model=schemas.EventBulkResult)
+async def create_events_bulk(batch: schemas.EventBulkCreate, db = Depends(get_api_db)):
+    """
+    Skapa många händelser på en gång (t.ex. ett terminsschema)
 
-    events = crud.get_events(db, skip=skip, limit=limit, start_date=start_dt, end_date=end_dt)
-    return events
+    Användarna kontrolleras med en fråga, raderna skrivs med en INSERT och
+    en sammanfattande notifikation skickas för hela batchen.
+    """
+    return await _run_bulk(crud_async.create_events_bulk, db, batch.events)
+
+@app.put("/api/events/bulk", response_model=schemas.EventBulkResult)
+async def update_events_bulk(batch: schemas.EventBulkUpdate, db = Depends(get_api_db)):
+    """Uppdatera många händelser; varje post anger id plus de fält som ändras"""
+    return await _run_bulk(crud_async.update_events_bulk, db, batch.events)
+
+@app.delete("/api/events/bulk", response_model=schemas.EventBulkResult)
+async def delete_events_bulk(batch: schemas.EventBulkDelete, db = Depends(get_api_db)):
+    """Ta bort många händelser; saknas någon tas ingen bort"""
+    return await _run_bulk(crud_async.delete_events_bulk, db, batch.ids)
+
+# Import av .ics-filer (t.ex. ett terminsschema eller en säsong från en förening)
+@app.post("/api/events/import", response_model=schemas.CalendarImportResult)
+async def import_calendar(
+    user_id: int = Query(...),
+    file: UploadFile = File(...),
+    db = Depends(get_api_db)
+):
+    """
+    Importera händelserna i en iCalendar-fil till en användare
+
+    Filen tolkas rad för rad och skrivs i batcher. Händelser vars UID redan
+    finns hoppas över, så samma flöde kan importeras igen för att få med
+    nya händelser. Serier med enkla RRULEs blir återkommande händelser.
+    """
+    user = await crud_async.get_user(db, user_id=user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    try:
+        # Tolkning och skrivning är blockerande och kan ta några sekunder
+        return await run_in_threadpool(ical.import_calendar, file.file, user_id, user.name)
+    finally:
+        await file.close()
 
 @app.get("/api/events/{event_id}", response_model=schemas.Event)
-def read_event(event_id: int, db: Session = Depends(get_db)):
-    db_event = crud.get_event(db, event_id=event_id)
+async def read_event(event_id: int, db = Depends(get_api_db)):
+    db_event = await crud_async.get_event(db, event_id=event_id)
     if db_event is None:
         raise HTTPException(status_code=404, detail="Event not found")
     return db_event
 
 @app.post("/api/events", response_model=schemas.Event)
-def create_event(event: schemas.EventCreate, db: Session = Depends(get_db)):
+async def create_event(event: schemas.EventCreate, db = Depends(get_api_db)):
     # Verifiera att användaren finns
-    user = crud.get_user(db, user_id=event.user_id)
+    user = await crud_async.get_user(db, user_id=event.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    db_event = crud.create_event(db=db, event=event)
-
-    # Skicka notifikation om ny händelse
-    notifications.send_event_created(
-        event_title=db_event.title,
+    # Notifikationen läggs i outboxen och committas i samma transaktion som
+    # händelsen; bakgrundsworkern skickar den så att requesten inte väntar på ntfy
+    notifications.queue_event_created(
+        db,
+        event_title=event.title,
         user_name=user.name
     )
 
-    return db_event
+    return await crud_async.create_event(db, event=event)
 
 @app.put("/api/events/{event_id}", response_model=schemas.Event)
-def update_event(event_id: int, event: schemas.EventUpdate, db: Session = Depends(get_db)):
-    db_event = crud.update_event(db, event_id=event_id, event_update=event)
+async def update_event(event_id: int, event: schemas.EventUpdate, db = Depends(get_api_db)):
+    db_event = await crud_async.update_event(db, event_id=event_id, event_update=event)
     if db_event is None:
         raise HTTPException(status_code=404, detail="Event not found")
     return db_event
 
 @app.delete("/api/events/{event_id}")
-def delete_event(event_id: int, db: Session = Depends(get_db)):
-    success = crud.delete_event(db, event_id=event_id)
+async def delete_event(event_id: int, db = Depends(get_api_db)):
+    success = await crud_async.delete_event(db, event_id=event_id)
     if not success:
         raise HTTPException(status_code=404, detail="Event not found")
     return {"message": "Event deleted successfully"}
 
+# iCalendar-flöde för prenumeration från mobilen och andra kalenderappar
+@app.get("/api/calendar.ics")
+async def calendar_feed(request: Request, user_id: Optional[int] = Query(None), db = Depends(get_api_db)):
+    """
+    Hela kalendern (eller en användares händelser) som iCalendar
+
+    Serier skickas som RRULE, inte som expanderade förekomster. Flödet
+    strömmas från en server-side cursor, så minnet är konstant oavsett
+    historikens längd. Med If-None-Match svarar endpointen 304 om inget
+    har ändrats sedan förra hämtningen.
+    """
+    calendar_name = "Familjekalender"
+    if user_id is not None:
+        user = await crud_async.get_user(db, user_id=user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        calendar_name = f"Familjekalender - {user.name}"
+
+    count, last_modified = await crud_async.get_export_validator(db, user_id=user_id)
+    etag = conditional.make_etag("ics", user_id, count, last_modified)
+    # Borttagna och flyttade events syns inte i Last-Modified, så bara ETag kan ge 304
+    cached = conditional.not_modified(request, etag, last_modified, use_if_modified_since=False)
+    if cached:
+        return cached
+
+    headers = conditional.validator_headers(etag, last_modified)
+    headers["Content-Disposition"] = 'inline; filename="familjekalender.ics"'
+    return StreamingResponse(
+        ical.stream_calendar(user_id, calendar_name),
+        media_type="text/calendar; charset=utf-8",
+        headers=headers
+    )
+
 # Webhook endpoint
 @app.post("/webhook")
 async def receive_webhook(data: dict):
@@ -107,7 +306,7 @@ async def receive_webhook(data: dict):
     Webhook endpoint för att ta emot externa notifikationer
     """
     # Här kan du lägga till logik för att hantera webhooks
-    # t.ex. från externa kalendersystem
+    # (.ics-filer från externa kalendersystem importeras via /api/events/import)
     return {"status": "ok", "received": data}
 
 # Health check
@@ -115,45 +314,131 @@ async def receive_webhook(data: dict):
 def health_check():
     return {"status": "healthy"}
 
+# Connection pool-status (för att dimensionera DB_POOL_SIZE/DB_MAX_OVERFLOW)
+@app.get("/admin/pool")
+def pool_metrics():
+    """
+    Utcheckade anslutningar, overflow, väntetider och timeouts per pool
+    Räknarna är per process och nollställs vid omstart
+    """
+    pools = {"sync": pool.pool_status(engine.pool)}
+    if async_engine is not None:
+        pools["async"] = pool.pool_status(async_engine.pool)
+    return pools
+
 # Migration endpoint (körs en gång för att uppdatera databas-schema)
+# Varje steg är idempotent (IF NOT EXISTS) så listan kan bara växa
+MIGRATION_STEPS = [
+    ("recurrence_type", """
+        ALTER TABLE events
+        ADD COLUMN IF NOT EXISTS recurrence_type VARCHAR DEFAULT 'none'
+    """),
+    ("recurrence_interval", """
+        ALTER TABLE events
+        ADD COLUMN IF NOT EXISTS recurrence_interval INTEGER DEFAULT 1
+    """),
+    ("recurrence_end_date", """
+        ALTER TABLE events
+        ADD COLUMN IF NOT EXISTS recurrence_end_date TIMESTAMP
+    """),
+    ("ix_events_start_end", """
+        CREATE INDEX IF NOT EXISTS ix_events_start_end
+        ON events (start_time, end_time)
+    """),
+    ("ix_events_recurrence", """
+        CREATE INDEX IF NOT EXISTS ix_events_recurrence
+        ON events (recurrence_type, recurrence_end_date)
+    """),
+    ("ix_events_updated_at", """
+        CREATE INDEX IF NOT EXISTS ix_events_updated_at
+        ON events (updated_at)
+    """),
+    ("event_deletions", """
+        CREATE TABLE IF NOT EXISTS event_deletions (
+            id SERIAL PRIMARY KEY,
+            event_id INTEGER NOT NULL,
+            deleted_at TIMESTAMP
+        )
+    """),
+    ("ix_event_deletions_deleted_at", """
+        CREATE INDEX IF NOT EXISTS ix_event_deletions_deleted_at
+        ON event_deletions (deleted_at)
+    """),
+    ("notification_outbox", """
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id SERIAL PRIMARY KEY,
+            title VARCHAR,
+            message TEXT,
+            priority VARCHAR DEFAULT 'default',
+            tags VARCHAR,
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at TIMESTAMP,
+            sent_at TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP
+        )
+    """),
+    ("ix_notification_outbox_pending", """
+        CREATE INDEX IF NOT EXISTS ix_notification_outbox_pending
+        ON notification_outbox (sent_at, next_attempt_at)
+    """),
+    ("next_reminder_at", """
+        ALTER TABLE events
+        ADD COLUMN IF NOT EXISTS next_reminder_at TIMESTAMP
+    """),
+    ("ix_events_next_reminder_at", """
+        CREATE INDEX IF NOT EXISTS ix_events_next_reminder_at
+        ON events (next_reminder_at)
+    """),
+    ("ai_event_claims", """
+        CREATE TABLE IF NOT EXISTS ai_event_claims (
+            id SERIAL PRIMARY KEY,
+            session_id VARCHAR NOT NULL,
+            event_hash VARCHAR NOT NULL,
+            event_id INTEGER,
+            created_at TIMESTAMP,
+            CONSTRAINT uq_ai_event_claims_session_hash UNIQUE (session_id, event_hash)
+        )
+    """),
+    ("ix_ai_event_claims_created_at", """
+        CREATE INDEX IF NOT EXISTS ix_ai_event_claims_created_at
+        ON ai_event_claims (created_at)
+    """),
+    ("events_uid", """
+        ALTER TABLE events
+        ADD COLUMN IF NOT EXISTS uid VARCHAR
+    """),
+    ("ix_events_uid", """
+        CREATE UNIQUE INDEX IF NOT EXISTS ix_events_uid
+        ON events (uid)
+    """),
+]
+
 @app.post("/admin/migrate")
 def run_migration(db: Session = Depends(get_db)):
     """
-    Kör databas-migration för att lägga till recurrence-kolumner
+    Kör databas-migration för att uppdatera schemat (kolumner och index)
     Säkert att köra flera gånger (IF NOT EXISTS)
     """
     from sqlalchemy import text
     results = []
 
-    try:
-        db.execute(text("""
-            ALTER TABLE events
-            ADD COLUMN IF NOT EXISTS recurrence_type VARCHAR DEFAULT 'none'
-        """))
-        db.commit()
-        results.append("✓ recurrence_type")
-    except Exception as e:
-        results.append(f"recurrence_type: {str(e)}")
-
-    try:
-        db.execute(text("""
-            ALTER TABLE events
-            ADD COLUMN IF NOT EXISTS recurrence_interval INTEGER DEFAULT 1
-        """))
-        db.commit()
-        results.append("✓ recurrence_interval")
-    except Exception as e:
-        results.append(f"recurrence_interval: {str(e)}")
+    for name, statement in MIGRATION_STEPS:
+        try:
+            db.execute(text(statement))
+            db.commit()
+            results.append(f"✓ {name}")
+        except Exception as e:
+            db.rollback()
+            results.append(f"{name}: {str(e)}")
 
+    # Fyll i next_reminder_at för befintliga händelser med påminnelse
     try:
-        db.execute(text("""
-            ALTER TABLE events
-            ADD COLUMN IF NOT EXISTS recurrence_end_date TIMESTAMP
-        """))
-        db.commit()
-        results.append("✓ recurrence_end_date")
+        count = reminders.backfill_next_reminders(db)
+        results.append(f"✓ next_reminder_at backfill ({count} händelser)")
     except Exception as e:
-        results.append(f"recurrence_end_date: {str(e)}")
+        db.rollback()
+        results.append(f"next_reminder_at backfill: {str(e)}")
 
     return {"status": "migration completed", "results": results}
 
@@ -164,14 +449,17 @@ async def transcribe_audio(audio: UploadFile = File(...)):
     Transkribera ljud till text med Groq Whisper API
 
     Stödjer format: mp3, mp4, mpeg, mpga, m4a, wav, webm, ogg
+
+    UploadSizeLimitMiddleware stoppar för stora uppladdningar medan de
+    strömmar in; den exakta gränsen (25MB) för själva filen kontrolleras här.
+    Filen ligger kvar i uppladdningens spool-fil (audio.file) och skickas
+    därifrån till Groq utan att kopieras.
     """
-    tmp_path = None
     try:
         # Validera filstorlek (max 25MB)
-        content = await audio.read()
-        file_size_mb = len(content) / (1024 * 1024)
+        file_size_mb = audio.size / (1024 * 1024)
 
-        if file_size_mb > 25:
+        if audio.size > TRANSCRIBE_MAX_BYTES:
             return {
                 "success": False,
                 "text": "",
@@ -189,13 +477,8 @@ async def transcribe_audio(audio: UploadFile = File(...)):
                 "error": f"Ogiltigt filformat: {file_ext}. Stödda format: {', '.join(valid_extensions)}"
             }
 
-        # Spara temporärt
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_file:
-            tmp_file.write(content)
-            tmp_path = tmp_file.name
-
-        # Transkribera med Groq Whisper
-        transcription = ai.transcribe_audio(tmp_path)
+        # Transkribera med Groq Whisper (blockerande anrop, körs i trådpoolen)
+        transcription = await run_in_threadpool(ai.transcribe_audio, audio.file, audio.filename)
 
         if not transcription or len(transcription.strip()) == 0:
             return {
@@ -222,16 +505,12 @@ async def transcribe_audio(audio: UploadFile = File(...)):
         }
 
     finally:
-        # Rensa temp-fil
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.unlink(tmp_path)
-            except:
-                pass
+        # Stäng spool-filen direkt istället för när requesten städas upp
+        await audio.close()
 
 # AI Chat endpoint
 @app.post("/api/ai/chat", response_model=schemas.ChatResponse)
-def chat_with_assistant(chat_request: schemas.ChatRequest, db: Session = Depends(get_db)):
+async def chat_with_assistant(chat_request: schemas.ChatRequest, db = Depends(get_api_db)):
     """
     Chat med AI-assistenten om kalenderhändelser
 
@@ -245,7 +524,7 @@ def chat_with_assistant(chat_request: schemas.ChatRequest, db: Session = Depends
     # Konvertera ChatMessage objekt till dict för AI-funktionen
     history = [{"role": msg.role, "content": msg.content} for msg in chat_request.conversation_history]
 
-    result = ai.chat_with_ai(
+    result = await ai.chat_with_ai(
         message=chat_request.message,
         db=db,
         session_id=chat_request.session_id,
@@ -263,6 +542,42 @@ def chat_with_assistant(chat_request: schemas.ChatRequest, db: Session = Depends
         error=result.get("error")
     )
 
+# AI Chat endpoint med streaming (Server-Sent Events)
+@app.post("/api/ai/chat/stream")
+async def chat_with_assistant_stream(chat_request: schemas.ChatRequest):
+    """
+    Som /api/ai/chat men svaret strömmas som Server-Sent Events
+
+    Händelser:
+    - status: {"message": "Kollar kalendern…"} när AI:n använder ett verktyg
+    - token: {"content": "..."} för varje textbit i svaret
+    - done: samma fält som ChatResponse (inkl. conversation_history)
+    """
+    history = [{"role": msg.role, "content": msg.content} for msg in chat_request.conversation_history]
+
+    async def event_stream():
+        # Egen session: den måste leva lika länge som strömmen, inte bara endpointen
+        async with api_session() as db:
+            async for event in ai.stream_chat_with_ai(
+                message=chat_request.message,
+                db=db,
+                session_id=chat_request.session_id,
+                conversation_history=history
+            ):
+                event_type = event.pop("type")
+                if event_type == "done":
+                    data = schemas.ChatResponse(**event).model_dump_json()
+                else:
+                    data = json.dumps(event, ensure_ascii=False)
+                yield f"event: {event_type}\ndata: {data}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Stäng av buffring i proxies så att tokens når klienten direkt
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Root endpoint
 @app.get("/")
 def read_root():
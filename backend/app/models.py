@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
@@ -15,6 +15,14 @@ class User(Base):
 
 class Event(Base):
     __tablename__ = "events"
+    __table_args__ = (
+        # Intervallfrågor i crud.get_events (enstaka händelser som överlappar fönstret)
+        Index("ix_events_start_end", "start_time", "end_time"),
+        # Återkommande serier som fortfarande är aktiva i fönstret
+        Index("ix_events_recurrence", "recurrence_type", "recurrence_end_date"),
+        # Inkrementell synk (/api/events/changes)
+        Index("ix_events_updated_at", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
@@ -25,13 +33,69 @@ class Event(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     reminder_enabled = Column(Boolean, default=False)
     reminder_minutes = Column(Integer, default=30)  # Påminnelse X minuter innan
+    # När nästa påminnelse ska skickas (nästa förekomst - reminder_minutes), null = ingen
+    next_reminder_at = Column(DateTime, nullable=True, index=True)
 
     # Återkommande händelser
     recurrence_type = Column(String, default="none")  # none, daily, weekly, monthly
     recurrence_interval = Column(Integer, default=1)  # Varje X dag/vecka/månad
     recurrence_end_date = Column(DateTime, nullable=True)  # När upprepningen slutar (null = oändlig)
 
+    # UID från en importerad iCalendar-fil (null för händelser skapade i appen)
+    uid = Column(String, nullable=True, unique=True, index=True)
+
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     owner = relationship("User", back_populates="events")
+
+class EventDeletion(Base):
+    """Tombstone för borttagna händelser, används av /api/events/changes"""
+    __tablename__ = "event_deletions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class NotificationOutbox(Base):
+    """
+    Notifikationer som väntar på att skickas till ntfy
+
+    Rader läggs till i samma transaktion som ändringen de gäller och töms
+    av bakgrundsworkern i notifications.py (med retries och backoff).
+    """
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        # Workern letar efter ej skickade rader som är redo för (nytt) försök
+        Index("ix_notification_outbox_pending", "sent_at", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    title = Column(String)
+    message = Column(Text)
+    priority = Column(String, default="default")
+    tags = Column(String, nullable=True)  # Kommaseparerade emoji-tags
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AiEventClaim(Base):
+    """
+    Dublettskydd för händelser som AI-assistenten skapar (se dedup.py)
+
+    En rad per (chatt-session, händelse-hash). Den unika nyckeln gör att
+    bara en worker kan skapa händelsen, även med flera uvicorn-processer.
+    event_id är NULL medan händelsen skapas.
+    """
+    __tablename__ = "ai_event_claims"
+    __table_args__ = (
+        UniqueConstraint("session_id", "event_hash", name="uq_ai_event_claims_session_hash"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String, nullable=False)
+    event_hash = Column(String, nullable=False)
+    event_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -1,49 +1,56 @@
-import requests
+import asyncio
 import os
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, List, Dict, Any
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
 
 NTFY_URL = os.getenv("NTFY_URL", "https://ntfy.sh")
 NTFY_TOPIC = os.getenv("NTFY_TOPIC", "familjekalender")
 
-def send_notification(
+# Inställningar för outbox-workern
+NTFY_TIMEOUT_SECONDS = float(os.getenv("NTFY_TIMEOUT_SECONDS", "5"))
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "20"))
+NOTIFY_POLL_SECONDS = float(os.getenv("NOTIFY_POLL_SECONDS", "30"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "8"))
+NOTIFY_BACKOFF_SECONDS = float(os.getenv("NOTIFY_BACKOFF_SECONDS", "5"))
+NOTIFY_MAX_BACKOFF_SECONDS = float(os.getenv("NOTIFY_MAX_BACKOFF_SECONDS", "900"))
+# Hur länge en claimad rad är reserverad för en worker innan den får tas igen
+NOTIFY_LEASE_SECONDS = float(os.getenv("NOTIFY_LEASE_SECONDS", "60"))
+# Skickade rader sparas så här länge (för felsökning) innan workern tar bort dem
+NOTIFY_RETENTION_HOURS = float(os.getenv("NOTIFY_RETENTION_HOURS", "168"))
+NOTIFY_PURGE_INTERVAL_SECONDS = 3600
+
+def queue_notification(
+    db: Session,
     title: str,
     message: str,
     priority: str = "default",
     tags: Optional[list] = None
 ):
     """
-    Skicka en notifikation via ntfy.sh
+    Lägg en notifikation i outboxen
 
-    Args:
-        title: Notifikationens titel
-        message: Notifikationens meddelande
-        priority: Prioritet (max, high, default, low, min)
-        tags: Lista med emoji-tags för notifikationen
+    Raden committas tillsammans med resten av sessionens ändringar, så
+    notifikationen skickas bara om ändringen faktiskt sparades. Workern
+    väcks direkt efter commit.
     """
-    try:
-        headers = {
-            "Title": title,
-            "Priority": priority,
-        }
-
-        if tags:
-            headers["Tags"] = ",".join(tags)
-
-        response = requests.post(
-            f"{NTFY_URL}/{NTFY_TOPIC}",
-            data=message.encode('utf-8'),
-            headers=headers
-        )
-
-        return response.status_code == 200
-    except Exception as e:
-        print(f"Fel vid skickning av notifikation: {e}")
-        return False
-
-def send_event_reminder(event_title: str, event_start: datetime, user_name: str):
+    db.add(models.NotificationOutbox(
+        title=title,
+        message=message,
+        priority=priority,
+        tags=",".join(tags) if tags else None,
+    ))
+    db.info["notifications_queued"] = True
+
+def queue_event_reminder(db: Session, event_title: str, event_start: datetime, user_name: str):
     """
-    Skicka påminnelse om en kommande händelse
+    Lägg en påminnelse om en kommande händelse i outboxen
     """
     time_until = event_start - datetime.utcnow()
 
@@ -56,22 +63,197 @@ def send_event_reminder(event_title: str, event_start: datetime, user_name: str)
     title = f"Påminnelse: {event_title}"
     message = f"{user_name} har en händelse om {time_str}"
 
-    return send_notification(
+    queue_notification(
+        db,
         title=title,
         message=message,
         priority="high",
         tags=["calendar", "alarm_clock"]
     )
 
-def send_event_created(event_title: str, user_name: str):
+def queue_event_created(db: Session, event_title: str, user_name: str):
     """
-    Skicka notifikation när en ny händelse skapas
+    Lägg en notifikation om en ny händelse i outboxen
     """
     title = "Ny händelse tillagd"
     message = f"{user_name}: {event_title}"
 
-    return send_notification(
+    queue_notification(
+        db,
         title=title,
         message=message,
         tags=["calendar", "white_check_mark"]
     )
+
+def queue_events_created(db: Session, counts_by_user: Dict[str, int]):
+    """
+    Lägg en sammanfattande notifikation om många nya händelser i outboxen
+    (en notifikation per bulk-import istället för en per händelse)
+
+    Args:
+        counts_by_user: Antal nya händelser per användarnamn
+    """
+    total = sum(counts_by_user.values())
+    title = f"{total} nya händelser tillagda"
+    message = ", ".join(f"{user_name}: {count}" for user_name, count in counts_by_user.items())
+
+    queue_notification(
+        db,
+        title=title,
+        message=message,
+        tags=["calendar", "white_check_mark"]
+    )
+
+
+# Outbox-worker
+# Körs som en asyncio-task i API-processen (se lifespan i main.py).
+# Rader claimas med SELECT ... FOR UPDATE SKIP LOCKED och en lease, så flera
+# processer kan köra workern utan att samma notifikation skickas två gånger.
+
+_wake_event: Optional[asyncio.Event] = None
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session: Session):
+    if session.info.pop("notifications_queued", False):
+        wake_worker()
+
+def wake_worker():
+    """Väck workern (trådsäkert, kan anropas från synkrona endpoints)"""
+    if _worker_loop is not None and _wake_event is not None:
+        _worker_loop.call_soon_threadsafe(_wake_event.set)
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(NOTIFY_BACKOFF_SECONDS * 2 ** (attempts - 1), NOTIFY_MAX_BACKOFF_SECONDS))
+
+def _claim_batch() -> List[Dict[str, Any]]:
+    """Reservera nästa batch notifikationer som är redo att skickas"""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        rows = db.query(models.NotificationOutbox).filter(
+            models.NotificationOutbox.sent_at.is_(None),
+            models.NotificationOutbox.next_attempt_at <= now,
+            models.NotificationOutbox.attempts < NOTIFY_MAX_ATTEMPTS,
+        ).order_by(
+            models.NotificationOutbox.next_attempt_at
+        ).limit(NOTIFY_BATCH_SIZE).with_for_update(skip_locked=True).all()
+
+        batch = []
+        for row in rows:
+            row.next_attempt_at = now + timedelta(seconds=NOTIFY_LEASE_SECONDS)
+            batch.append({
+                "id": row.id,
+                "title": row.title,
+                "message": row.message,
+                "priority": row.priority or "default",
+                "tags": row.tags,
+            })
+        db.commit()
+        return batch
+    finally:
+        db.close()
+
+def _record_results(results: List[Dict[str, Any]]):
+    """Markera skickade rader och schemalägg nya försök för misslyckade"""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        for result in results:
+            row = db.get(models.NotificationOutbox, result["id"])
+            if row is None:
+                continue
+            if result["error"] is None:
+                row.sent_at = now
+                row.last_error = None
+            else:
+                row.attempts = (row.attempts or 0) + 1
+                row.next_attempt_at = now + _backoff(row.attempts)
+                row.last_error = result["error"]
+        db.commit()
+    finally:
+        db.close()
+
+def purge_sent() -> int:
+    """Ta bort skickade rader äldre än NOTIFY_RETENTION_HOURS. Returnerar antal"""
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(hours=NOTIFY_RETENTION_HOURS)
+        # Använder ix_notification_outbox_pending (sent_at först)
+        deleted = db.query(models.NotificationOutbox).filter(
+            models.NotificationOutbox.sent_at < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+# ntfy:s prioriteter som heltal (för JSON-publicering)
+_NTFY_PRIORITIES = {"min": 1, "low": 2, "default": 3, "high": 4, "max": 5}
+
+async def _deliver(client: httpx.AsyncClient, notification: Dict[str, Any]) -> Dict[str, Any]:
+    # JSON-publicering istället för headers, så titlar med å/ä/ö och emojis fungerar
+    payload = {
+        "topic": NTFY_TOPIC,
+        "title": notification["title"],
+        "message": notification["message"] or "",
+        "priority": _NTFY_PRIORITIES.get(notification["priority"], 3),
+    }
+    if notification["tags"]:
+        payload["tags"] = notification["tags"].split(",")
+
+    try:
+        response = await client.post(NTFY_URL, json=payload)
+        error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+    except httpx.HTTPError as e:
+        error = f"{type(e).__name__}: {e}"
+    if error:
+        print(f"Fel vid skickning av notifikation {notification['id']}: {error}")
+    return {"id": notification["id"], "error": error}
+
+async def drain_outbox(client: httpx.AsyncClient) -> int:
+    """Skicka en batch från outboxen. Returnerar antal behandlade notifikationer"""
+    batch = await asyncio.to_thread(_claim_batch)
+    if not batch:
+        return 0
+    results = await asyncio.gather(*(_deliver(client, notification) for notification in batch))
+    await asyncio.to_thread(_record_results, results)
+    return len(batch)
+
+async def run_outbox_worker():
+    """
+    Töm outboxen tills tasken avbryts
+
+    Workern väcks direkt när en notifikation committas och pollar dessutom
+    var NOTIFY_POLL_SECONDS för retries och rader från andra processer.
+    Skickade rader rensas bort en gång i timmen (se purge_sent).
+    """
+    global _wake_event, _worker_loop
+    _wake_event = asyncio.Event()
+    _worker_loop = asyncio.get_running_loop()
+
+    timeout = httpx.Timeout(NTFY_TIMEOUT_SECONDS)
+    limits = httpx.Limits(max_connections=NOTIFY_BATCH_SIZE, max_keepalive_connections=5)
+    next_purge = 0.0
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        while True:
+            # Nollställs före tömningen så att en väckning under tiden inte tappas
+            _wake_event.clear()
+            try:
+                # Fortsätt direkt så länge batcharna är fulla
+                while await drain_outbox(client) >= NOTIFY_BATCH_SIZE:
+                    pass
+                if _worker_loop.time() >= next_purge:
+                    next_purge = _worker_loop.time() + NOTIFY_PURGE_INTERVAL_SECONDS
+                    deleted = await asyncio.to_thread(purge_sent)
+                    if deleted:
+                        print(f"Rensade {deleted} skickade notifikationer ur outboxen")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Fel i notifikations-workern: {e}")
+
+            try:
+                await asyncio.wait_for(_wake_event.wait(), timeout=NOTIFY_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
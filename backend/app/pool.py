@@ -0,0 +1,92 @@
+"""
+Connection pool med mätvärden
+
+MeteredQueuePool är SQLAlchemys QueuePool som dessutom räknar utcheckningar,
+väntetid på en ledig anslutning och timeouts. Värdena visas på /admin/pool
+tillsammans med poolens aktuella läge (utcheckade, overflow), så att
+DB_POOL_SIZE och DB_MAX_OVERFLOW kan dimensioneras efter verklig last.
+"""
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class PoolMetrics:
+    """Trådsäkra räknare för en pool (överlever pool.recreate() vid dispose)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        # Utcheckningar som fick vänta mer än 10 ms (poolen var full eller
+        # en ny anslutning behövde öppnas)
+        self.slow_checkouts = 0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if seconds > 0.01:
+                self.slow_checkouts += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "slow_checkouts": self.slow_checkouts,
+                "timeouts": self.timeouts,
+                "wait_ms_avg": round(self.wait_seconds_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(self.wait_seconds_max * 1000, 3),
+            }
+
+
+class _MeteredPool:
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        # Tiden inkluderar väntan på en ledig anslutning och ev. uppkoppling
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+
+class MeteredQueuePool(_MeteredPool, QueuePool):
+    metrics = PoolMetrics()
+
+
+class MeteredAsyncQueuePool(_MeteredPool, AsyncAdaptedQueuePool):
+    metrics = PoolMetrics()
+
+
+def pool_status(pool) -> Dict[str, Any]:
+    """Poolens aktuella läge plus ackumulerade mätvärden"""
+    status: Dict[str, Any] = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            # Negativt tills poolen har öppnat pool_size anslutningar
+            "overflow": pool.overflow(),
+            "max_overflow": pool._max_overflow,
+            "timeout_seconds": pool.timeout(),
+        })
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        status.update(metrics.snapshot())
+    return status
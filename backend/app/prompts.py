@@ -0,0 +1,197 @@
+"""
+Prompter och kompakt kodning av verktygsresultat för AI-assistenten
+
+Systemprompten byggs av en statisk del (regler, cachad som konstant), dagens
+datum och användarlistan från crud.get_users. Användarlistan cachas och byggs
+om bara när användarna ändras: direkt vid ändringar i den här processen (via
+SQLAlchemy-events) och annars när validatorn (antal, senaste created_at)
+ändras, vilket kontrolleras högst var PROMPT_USERS_CHECK_SECONDS.
+
+Händelser från get_events kodas som kompakt text grupperad per dag istället
+för JSON, med förkortade beskrivningar och en tokenbudget, så att det andra
+AI-anropet får färre prompt-tokens.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .database import run_db
+
+# Hur ofta användarlistans validator kontrolleras mot databasen
+PROMPT_USERS_CHECK_SECONDS = float(os.getenv("PROMPT_USERS_CHECK_SECONDS", "60"))
+# Ungefärlig tokenbudget för ett get_events-resultat
+TOOL_EVENTS_TOKEN_BUDGET = int(os.getenv("TOOL_EVENTS_TOKEN_BUDGET", "1500"))
+# Max antal tecken av en händelses beskrivning
+TOOL_DESCRIPTION_MAX_CHARS = 60
+
+_WEEKDAYS = ["mån", "tis", "ons", "tor", "fre", "lör", "sön"]
+
+_STATIC_RULES = """Du kan:
+1. Svara på frågor om vad som är bokat
+2. Skapa nya bokningar
+
+VIKTIGT REGLER FÖR BOKNINGAR:
+- När du skapar en bokning, anropa create_event ENDAST EN GÅNG
+- Om användaren säger "boka", skapa bara EN händelse
+- Bekräfta alltid vilken användare bokningen är för
+- Använd svenskt datumformat när du pratar med användaren
+- Var kortfattad och trevlig
+
+Dedupliceringssystem är aktivt - om du försöker skapa samma händelse flera gånger kommer den bara skapas en gång.
+
+get_events svarar med en rad per dag ("YYYY-MM-DD veckodag") följt av händelser som "HH:MM-HH:MM Titel [användare] - beskrivning"."""
+
+
+# Färgerna från init_users.py som ord; andra färger visas som hex-kod
+_COLOR_NAMES = {
+    "#039BE5": "blå",
+    "#D50000": "röd",
+    "#F6BF26": "gul",
+    "#7986CB": "lila",
+    "#33B679": "grön",
+}
+
+
+def _user_line(user: Any) -> str:
+    color = _COLOR_NAMES.get((user.color or "").upper(), user.color)
+    return f"- {user.name} (ID: {user.id}, {color})" if color else f"- {user.name} (ID: {user.id})"
+
+
+class _UsersBlock:
+    """Cachad användarlista för systemprompten"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.text: Optional[str] = None
+        self.validator = None
+        self.checked_at = 0.0
+        self.stale = True
+
+    def fresh(self) -> Optional[str]:
+        with self._lock:
+            if self.text is not None and not self.stale and time.monotonic() - self.checked_at < PROMPT_USERS_CHECK_SECONDS:
+                return self.text
+            return None
+
+    def refresh(self, db: Session) -> str:
+        """Kontrollera validatorn och bygg om listan om användarna ändrats"""
+        validator = tuple(crud.get_users_validator(db))
+        with self._lock:
+            if self.text is not None and validator == self.validator:
+                self.checked_at = time.monotonic()
+                self.stale = False
+                return self.text
+
+        users = crud.get_users(db, limit=100)
+        text = "\n".join(_user_line(user) for user in sorted(users, key=lambda u: u.id))
+        with self._lock:
+            self.text = text
+            self.validator = validator
+            self.checked_at = time.monotonic()
+            self.stale = False
+        return text
+
+    def invalidate(self):
+        with self._lock:
+            self.stale = True
+            # Validatorn fångar inte ändrade namn eller färger, så bygg om listan
+            self.validator = None
+
+
+_users_block = _UsersBlock()
+
+
+@event.listens_for(models.User, "after_insert")
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _users_changed(mapper, connection, target):
+    _users_block.invalidate()
+
+
+async def system_message(db) -> Dict[str, str]:
+    """Systemprompten (användarlistan hämtas bara från databasen när den kan ha ändrats)"""
+    users = _users_block.fresh()
+    if users is None:
+        users = await run_db(db, _users_block.refresh)
+
+    return {
+        "role": "system",
+        "content": (
+            "Du är en AI-assistent för familjekalender.\n"
+            f"Idag är {datetime.now().strftime('%Y-%m-%d')} ({_WEEKDAYS[datetime.now().weekday()]}).\n\n"
+            f"Användare i systemet:\n{users}\n\n"
+            f"{_STATIC_RULES}"
+        )
+    }
+
+
+def estimate_tokens(text: str) -> int:
+    """Grov uppskattning (ca 4 tecken per token) för budgetering innan anropet"""
+    return (len(text) + 3) // 4
+
+
+def _event_line(event: Any, with_description: bool) -> str:
+    if event.all_day:
+        time_part = "heldag"
+    elif event.end_time.date() != event.start_time.date():
+        time_part = f"{event.start_time:%H:%M}-{event.end_time:%m-%d %H:%M}"
+    else:
+        time_part = f"{event.start_time:%H:%M}-{event.end_time:%H:%M}"
+
+    line = f"{time_part} {event.title} [{event.owner.name if event.owner else event.user_id}]"
+    description = (event.description or "").strip().replace("\n", " ")
+    if description and with_description:
+        if len(description) > TOOL_DESCRIPTION_MAX_CHARS:
+            description = description[:TOOL_DESCRIPTION_MAX_CHARS - 1].rstrip() + "…"
+        line += f" - {description}"
+    return line
+
+
+def encode_events(events: List[Any], token_budget: int = TOOL_EVENTS_TOKEN_BUDGET) -> str:
+    """
+    Kompakt textkodning av händelser, grupperad per dag
+
+    Händelserna förväntas vara sorterade på starttid (som från crud.get_events).
+    När tokenbudgeten är slut avslutas listan med en rad om hur många som utelämnats.
+    """
+    if not events:
+        return "Inga händelser hittades för den valda tidsperioden."
+
+    lines: List[str] = []
+    used = 0
+    current_day = None
+    # Återkommande händelser visar beskrivningen bara första gången
+    described = set()
+    for count, ev in enumerate(events):
+        day = ev.start_time.date()
+        new_lines = []
+        if day != current_day:
+            new_lines.append(f"{day.isoformat()} {_WEEKDAYS[day.weekday()]}")
+        description_key = (ev.title, ev.description)
+        new_lines.append(" " + _event_line(ev, description_key not in described))
+
+        cost = sum(estimate_tokens(line) + 1 for line in new_lines)
+        if lines and used + cost > token_budget:
+            lines.append(f"… och {len(events) - count} händelser till (fråga om en kortare period)")
+            break
+        lines.extend(new_lines)
+        used += cost
+        described.add(description_key)
+        current_day = day
+
+    return "\n".join(lines)
+
+
+def log_token_usage(session_id: str, usage: Dict[str, int]):
+    """Logga tokenförbrukningen för en chattur"""
+    print(
+        f"AI-tur {session_id}: {usage.get('calls', 0)} anrop, "
+        f"{usage.get('prompt_tokens', 0)} prompt-tokens, "
+        f"{usage.get('completion_tokens', 0)} svar-tokens"
+    )
@@ -1,11 +1,130 @@
 """
 Logik för att hantera återkommande händelser
+
+Förekomsterna beräknas i sluten form: förekomst nummer k i en serie
+(0 = original händelsen) räknas fram direkt från seriens start, så det
+första fönstret går att hoppa till utan att stega igenom hela historiken.
 """
+import calendar
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import List, Iterator, Optional, Sequence, Tuple
+import numpy as np
 from . import models
 
-def generate_recurrence_instances(event: models.Event, start_date: datetime, end_date: datetime) -> List[Dict]:
+RECURRENCE_TYPES = ("daily", "weekly", "monthly")
+
+def _interval(event: models.Event) -> int:
+    """Intervallet för serien (skyddar mot 0/None som annars ger oändliga serier)"""
+    return max(1, event.recurrence_interval or 1)
+
+def _add_months(dt: datetime, months: int) -> datetime:
+    """
+    Lägg till ett antal månader till ett datum
+
+    Om dagen inte finns i den nya månaden (t.ex. 31 feb) används sista dagen
+    i månaden. Klippningen görs alltid från original-dagen, så en serie som
+    startar den 31:a hamnar på den 31:a igen i månader som har 31 dagar.
+    """
+    month_index = dt.year * 12 + (dt.month - 1) + months
+    year, month = divmod(month_index, 12)
+    month += 1
+    day = min(dt.day, calendar.monthrange(year, month)[1])
+    return dt.replace(year=year, month=month, day=day)
+
+def occurrence_start(event: models.Event, occurrence: int) -> datetime:
+    """Starttid för förekomst nummer occurrence i serien (0 = original händelsen)"""
+    if event.recurrence_type == "daily":
+        return event.start_time + timedelta(days=_interval(event) * occurrence)
+    if event.recurrence_type == "weekly":
+        return event.start_time + timedelta(weeks=_interval(event) * occurrence)
+    if event.recurrence_type == "monthly":
+        return _add_months(event.start_time, _interval(event) * occurrence)
+    raise ValueError(f"Okänd recurrence_type: {event.recurrence_type}")
+
+def first_occurrence_at_or_after(event: models.Event, start_date: datetime) -> int:
+    """
+    Index för den första förekomsten som startar vid eller efter start_date
+
+    Beräknas aritmetiskt, så kostnaden är konstant oavsett hur gammal serien är.
+    """
+    interval = _interval(event)
+
+    if event.recurrence_type == "monthly":
+        months = (start_date.year - event.start_time.year) * 12 + (start_date.month - event.start_time.month)
+        if months <= 0:
+            # Samma månad som seriens start: förekomst 0 kan ligga före start_date
+            return 0 if occurrence_start(event, 0) >= start_date else 1
+        # Första förekomsten i eller efter start_date:s månad
+        occurrence = -(-months // interval)
+        if occurrence_start(event, occurrence) < start_date:
+            occurrence += 1
+        return occurrence
+
+    if event.recurrence_type == "daily":
+        step = timedelta(days=interval)
+    elif event.recurrence_type == "weekly":
+        step = timedelta(weeks=interval)
+    else:
+        raise ValueError(f"Okänd recurrence_type: {event.recurrence_type}")
+
+    delta = start_date - event.start_time
+    if delta <= timedelta(0):
+        return 0
+    return -(-delta // step)
+
+def next_occurrence_at_or_after(event: models.Event, when: datetime) -> Optional[datetime]:
+    """
+    Starttid för första förekomsten (inklusive original händelsen) vid eller efter when
+
+    Returns:
+        Starttiden, eller None om serien (eller den enstaka händelsen) redan är slut
+    """
+    if event.recurrence_type not in RECURRENCE_TYPES:
+        return event.start_time if event.start_time >= when else None
+
+    start = occurrence_start(event, first_occurrence_at_or_after(event, when))
+    if event.recurrence_end_date and start > event.recurrence_end_date:
+        return None
+    return start
+
+class RecurrenceInstance:
+    """
+    En förekomst av en återkommande händelse
+
+    Lagrar bara referensen till original händelsen och den förskjutna start-
+    och sluttiden. Övriga fält (titel, beskrivning, ägare, ...) läses direkt
+    från original händelsen, så inga strängar dupliceras per förekomst.
+    Pydantic (from_attributes) läser fälten som från en vanlig ORM-rad.
+    """
+    __slots__ = ("parent", "occurrence", "start_time", "end_time")
+
+    is_recurring_instance = True
+
+    def __init__(self, parent: models.Event, occurrence: int, start_time: datetime, end_time: datetime):
+        self.parent = parent
+        self.occurrence = occurrence
+        self.start_time = start_time
+        self.end_time = end_time
+
+    @property
+    def id(self) -> int:
+        # Unikt och stabilt integer ID för recurring instance
+        return self.parent.id * 1000000 + self.occurrence
+
+    @property
+    def parent_event_id(self) -> int:
+        return self.parent.id
+
+    def __getattr__(self, name: str):
+        # Anropas bara för attribut som inte finns på instansen själv
+        if name in RecurrenceInstance.__slots__:
+            raise AttributeError(name)
+        return getattr(self.parent, name)
+
+    def __repr__(self) -> str:
+        return f"<RecurrenceInstance {self.id} {self.start_time.isoformat()}>"
+
+def generate_recurrence_instances(event: models.Event, start_date: datetime, end_date: datetime) -> List[RecurrenceInstance]:
     """
     Generera alla instanser av en återkommande händelse inom ett datumintervall
 
@@ -15,89 +134,189 @@ def generate_recurrence_instances(event: models.Event, start_date: datetime, end
         end_date: Slut för intervall att generera instanser för
 
     Returns:
-        Lista med dictionaries för varje händelse-instans
+        Lista med RecurrenceInstance för varje händelse-instans
+    """
+    return list(iter_recurrence_instances(event, start_date, end_date))
+
+def iter_recurrence_instances(event: models.Event, start_date: datetime, end_date: datetime) -> Iterator[RecurrenceInstance]:
     """
-    if event.recurrence_type == "none":
-        return []
+    Generera instanser av en återkommande händelse en i taget, sorterade på starttid
+
+    Första förekomsten i intervallet räknas fram direkt, så kostnaden är
+    proportionell mot antalet instanser i intervallet. Instansernas ID bygger
+    på vilken förekomst i serien de är (inte på positionen i fönstret), så
+    samma instans får samma ID oavsett vilket intervall som efterfrågas.
+    Det krävs för stabil paginering.
+
+    Args:
+        event: Händelsen med recurrence information
+        start_date: Start för intervall att generera instanser för
+        end_date: Slut för intervall att generera instanser för
 
-    instances = []
+    Returns:
+        Generator med RecurrenceInstance för varje händelse-instans
+    """
+    if event.recurrence_type not in RECURRENCE_TYPES:
+        return
 
     # Beräkna duration av original händelse
     duration = event.end_time - event.start_time
 
-    # Start från original händelsens start
-    current_start = event.start_time
-
     # Om händelsen har ett slut-datum för upprepning, använd det
-    # Annars generera upp till 1 år framåt
-    max_date = event.recurrence_end_date if event.recurrence_end_date else end_date
-
-    # Begränsa till max 1000 instanser för säkerhet
-    max_instances = 1000
-    instance_count = 0
-
-    while current_start <= max_date and current_start <= end_date and instance_count < max_instances:
-        # Hoppa över original händelsen (den finns redan i databasen)
-        if current_start != event.start_time:
-            # Kolla om denna instans är inom det begärda intervallet
-            if current_start >= start_date:
-                current_end = current_start + duration
-                instances.append({
-                    "id": event.id * 1000000 + instance_count,  # Unikt integer ID för recurring instance
-                    "title": event.title,
-                    "description": event.description,
-                    "start_time": current_start.isoformat(),
-                    "end_time": current_end.isoformat(),
-                    "all_day": event.all_day,
-                    "user_id": event.user_id,
-                    "reminder_enabled": event.reminder_enabled,
-                    "reminder_minutes": event.reminder_minutes,
-                    "recurrence_type": event.recurrence_type,
-                    "recurrence_interval": event.recurrence_interval,
-                    "recurrence_end_date": event.recurrence_end_date.isoformat() if event.recurrence_end_date else None,
-                    "created_at": event.created_at.isoformat(),
-                    "updated_at": event.updated_at.isoformat(),
-                    "owner": {
-                        "id": event.owner.id,
-                        "name": event.owner.name,
-                        "color": event.owner.color,
-                        "created_at": event.owner.created_at.isoformat()
-                    },
-                    "is_recurring_instance": True,
-                    "parent_event_id": event.id
-                })
-                instance_count += 1
-
-        # Beräkna nästa instans baserat på recurrence_type
-        if event.recurrence_type == "daily":
-            current_start += timedelta(days=event.recurrence_interval)
-        elif event.recurrence_type == "weekly":
-            current_start += timedelta(weeks=event.recurrence_interval)
-        elif event.recurrence_type == "monthly":
-            # För månadsvis upprepning, lägg till månader
-            month = current_start.month + event.recurrence_interval
-            year = current_start.year
-
-            while month > 12:
-                month -= 12
-                year += 1
-
-            # Hantera edge case om dagen inte finns i den nya månaden (t.ex. 31 feb)
-            try:
-                current_start = current_start.replace(year=year, month=month)
-            except ValueError:
-                # Om dagen inte finns (t.ex. 31 feb), använd sista dagen i månaden
-                if month == 12:
-                    next_month = 1
-                    next_year = year + 1
-                else:
-                    next_month = month + 1
-                    next_year = year
-                current_start = datetime(next_year, next_month, 1) - timedelta(days=1)
-                current_start = current_start.replace(
-                    hour=event.start_time.hour,
-                    minute=event.start_time.minute,
-                    second=event.start_time.second
-                )
-
-    return instances
+    last_start = end_date
+    if event.recurrence_end_date and event.recurrence_end_date < last_start:
+        last_start = event.recurrence_end_date
+
+    # Hoppa över original händelsen (den finns redan i databasen)
+    occurrence = max(1, first_occurrence_at_or_after(event, start_date))
+    current_start = occurrence_start(event, occurrence)
+
+    while current_start <= last_start:
+        yield RecurrenceInstance(event, occurrence, current_start, current_start + duration)
+        occurrence += 1
+        current_start = occurrence_start(event, occurrence)
+
+
+# Batch-expansion med NumPy
+# Alla serier i ett fönster expanderas i ett svep med datetime64-arrayer.
+# Instansobjekten byggs först när de konsumeras, så en sida med
+# paginering bygger bara de rader som faktiskt returneras.
+
+_US_PER_DAY = 86400 * 1000000
+
+def _ceil_div(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return -(-a // b)
+
+def _monthly_starts(
+    month0: np.ndarray, day0: np.ndarray, time_of_day: np.ndarray, months: np.ndarray
+) -> np.ndarray:
+    """Starttider (int64 µs) för månadsförekomster, klippta till sista dagen i månaden"""
+    month = (month0 + months).astype("datetime64[M]")
+    first_day = month.astype("datetime64[D]")
+    days_in_month = ((month + 1).astype("datetime64[D]") - first_day).astype(np.int64)
+    day = np.minimum(day0, days_in_month)
+    return (first_day.astype("datetime64[us]").astype(np.int64)
+            + (day - 1) * _US_PER_DAY + time_of_day)
+
+def expand_recurrences_batch(
+    events: Sequence[models.Event],
+    start_date: datetime,
+    end_date: datetime,
+    after: Optional[Tuple[datetime, int]] = None
+) -> Iterator[RecurrenceInstance]:
+    """
+    Generera instanser för många återkommande händelser på en gång
+
+    Alla förekomster i fönstret beräknas vektoriserat (samma regler som
+    occurrence_start/first_occurrence_at_or_after) och sorteras på
+    (start_time, id). Instansobjekten byggs först när generatorn konsumeras.
+
+    Args:
+        events: Återkommande händelser (recurrence_type != "none")
+        start_date: Start för intervall att generera instanser för
+        end_date: Slut för intervall att generera instanser för
+        after: Valfri (start_time, id); bara instanser efter denna nyckel returneras
+
+    Returns:
+        Generator med RecurrenceInstance för varje händelse-instans
+    """
+    series = [e for e in events if e.recurrence_type in RECURRENCE_TYPES]
+    if not series:
+        return
+
+    occ_starts, series_index, occurrences = _expand_occurrences(series, start_date, end_date)
+
+    ids = np.array([e.id for e in series], dtype=np.int64)[series_index] * 1000000 + occurrences
+    if after:
+        after_us = np.datetime64(after[0], "us").astype(np.int64)
+        keep = (occ_starts > after_us) | ((occ_starts == after_us) & (ids > after[1]))
+        occ_starts, series_index, occurrences, ids = (
+            occ_starts[keep], series_index[keep], occurrences[keep], ids[keep]
+        )
+
+    order = np.lexsort((ids, occ_starts))
+    starts = occ_starts[order].astype("datetime64[us]").tolist()
+    durations = [e.end_time - e.start_time for e in series]
+
+    for current_start, index, occurrence in zip(starts, series_index[order].tolist(), occurrences[order].tolist()):
+        yield RecurrenceInstance(series[index], occurrence, current_start, current_start + durations[index])
+
+def _expand_occurrences(
+    series: Sequence[models.Event], start_date: datetime, end_date: datetime
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Beräkna alla förekomster i fönstret för en lista serier
+
+    Returns:
+        (starttider som int64 µs, index i series, förekomstnummer) - osorterade
+    """
+    n = len(series)
+    start = np.array([e.start_time for e in series], dtype="datetime64[us]").astype(np.int64)
+    interval = np.array([_interval(e) for e in series], dtype=np.int64)
+    kind = np.array([e.recurrence_type for e in series])
+    window_start = np.datetime64(start_date, "us").astype(np.int64)
+    window_end = np.datetime64(end_date, "us").astype(np.int64)
+    limit = np.array(
+        [min(end_date, e.recurrence_end_date) if e.recurrence_end_date else end_date for e in series],
+        dtype="datetime64[us]"
+    ).astype(np.int64)
+    limit = np.minimum(limit, window_end)
+
+    first = np.zeros(n, dtype=np.int64)
+    last = np.full(n, -1, dtype=np.int64)
+
+    # Dagliga och veckovisa serier: fast steglängd
+    fixed = kind != "monthly"
+    if fixed.any():
+        step = interval[fixed] * np.where(kind[fixed] == "weekly", 7, 1) * _US_PER_DAY
+        delta = window_start - start[fixed]
+        first[fixed] = np.where(delta <= 0, 0, _ceil_div(delta, step))
+        last[fixed] = (limit[fixed] - start[fixed]) // step
+
+    # Månadsvisa serier: räkna i månader, justera ett steg för dag/tid
+    monthly = kind == "monthly"
+    if monthly.any():
+        m_start = start[monthly].astype("datetime64[us]")
+        month0 = m_start.astype("datetime64[M]").astype(np.int64)
+        day_start = m_start.astype("datetime64[D]")
+        day0 = (day_start - month0.astype("datetime64[M]").astype("datetime64[D]")).astype(np.int64) + 1
+        time_of_day = start[monthly] - day_start.astype("datetime64[us]").astype(np.int64)
+        m_interval = interval[monthly]
+
+        window_month = np.datetime64(start_date, "M").astype(np.int64)
+        months = window_month - month0
+        m_first = np.where(months <= 0, 0, _ceil_div(months, m_interval))
+        m_first += _monthly_starts(month0, day0, time_of_day, m_first * m_interval) < window_start
+
+        limit_month = limit[monthly].astype("datetime64[us]").astype("datetime64[M]").astype(np.int64)
+        m_last = (limit_month - month0) // m_interval
+        m_last -= _monthly_starts(month0, day0, time_of_day, m_last * m_interval) > limit[monthly]
+
+        first[monthly] = m_first
+        last[monthly] = m_last
+
+    # Original händelsen (förekomst 0) finns redan i databasen
+    first = np.maximum(first, 1)
+    counts = np.maximum(last - first + 1, 0)
+    total = int(counts.sum())
+
+    series_index = np.repeat(np.arange(n), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    occurrences = first[series_index] + offsets
+
+    occ_starts = np.empty(total, dtype=np.int64)
+    fixed_rows = fixed[series_index]
+    if fixed_rows.any():
+        idx = series_index[fixed_rows]
+        step = interval[idx] * np.where(kind[idx] == "weekly", 7, 1) * _US_PER_DAY
+        occ_starts[fixed_rows] = start[idx] + occurrences[fixed_rows] * step
+    monthly_rows = ~fixed_rows
+    if monthly_rows.any():
+        # Mappa serieindex till position bland de månadsvisa serierna
+        monthly_pos = np.cumsum(monthly) - 1
+        pos = monthly_pos[series_index[monthly_rows]]
+        occ_starts[monthly_rows] = _monthly_starts(
+            month0[pos], day0[pos], time_of_day[pos], occurrences[monthly_rows] * m_interval[pos]
+        )
+
+    return occ_starts, series_index, occurrences
@@ -0,0 +1,192 @@
+"""
+Schemaläggare för påminnelser
+
+Varje händelse med påminnelse har en förberäknad, indexerad kolumn
+next_reminder_at (nästa förekomst minus reminder_minutes). Schemaläggaren
+håller de närmast förestående påminnelserna i en heap och sover tills den
+första är due, istället för att polla alla händelser.
+
+När en påminnelse skickas flyttas next_reminder_at fram med en villkorlig
+UPDATE (compare-and-set på det gamla värdet) i samma transaktion som
+notifikationen läggs i outboxen. Bara en process kan vinna den uppdateringen,
+så påminnelser skickas inte dubbelt vid omstarter eller med flera workers.
+"""
+import asyncio
+import heapq
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from . import models, notifications
+from .database import SessionLocal
+from .recurrence import next_occurrence_at_or_after
+
+# Hur ofta heapen läses om från databasen (fångar ändringar från andra processer)
+REMINDER_RESYNC_SECONDS = float(os.getenv("REMINDER_RESYNC_SECONDS", "600"))
+# Påminnelser som missats med mer än så här (t.ex. under driftstopp) hoppas över
+REMINDER_GRACE_SECONDS = float(os.getenv("REMINDER_GRACE_SECONDS", "900"))
+
+
+def compute_next_reminder(event: models.Event, after: datetime) -> Optional[datetime]:
+    """
+    Tidpunkt för nästa påminnelse vid eller efter after
+
+    Returns:
+        next_reminder_at, eller None om påminnelse är avstängd eller serien är slut
+    """
+    if not event.reminder_enabled:
+        return None
+    lead = timedelta(minutes=event.reminder_minutes or 0)
+    occurrence = next_occurrence_at_or_after(event, after + lead)
+    return occurrence - lead if occurrence else None
+
+
+def backfill_next_reminders(db: Session) -> int:
+    """Beräkna next_reminder_at för alla händelser med påminnelse (används av /admin/migrate)"""
+    now = datetime.utcnow()
+    count = 0
+    for event in db.query(models.Event).filter(models.Event.reminder_enabled.is_(True)):
+        db.execute(
+            update(models.Event)
+            .where(models.Event.id == event.id)
+            # updated_at sätts till sig själv så att onupdate inte räknar det som en ändring
+            .values(next_reminder_at=compute_next_reminder(event, now), updated_at=models.Event.updated_at)
+        )
+        count += 1
+    db.commit()
+    return count
+
+
+class ReminderScheduler:
+    """
+    Min-heap med (next_reminder_at, event_id) för påminnelser som är due
+    före nästa omläsning. Inaktuella poster (ändrade eller borttagna händelser)
+    filtreras bort av compare-and-set när de avfyras.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int]] = []
+        self._lock = threading.Lock()
+        self._horizon = datetime.min
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def schedule(self, event_id: int, due: Optional[datetime]):
+        """Lägg till en påminnelse (trådsäkert, anropas från crud efter commit)"""
+        if due is None:
+            return
+        with self._lock:
+            if due > self._horizon:
+                # Plockas upp vid nästa omläsning
+                return
+            heapq.heappush(self._heap, (due, event_id))
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _load(self, now: datetime):
+        """Läs in alla påminnelser som är due före nästa omläsning (indexerad range scan)"""
+        horizon = now + timedelta(seconds=2 * REMINDER_RESYNC_SECONDS)
+        db = SessionLocal()
+        try:
+            rows = db.query(models.Event.next_reminder_at, models.Event.id).filter(
+                models.Event.next_reminder_at.isnot(None),
+                models.Event.next_reminder_at <= horizon,
+            ).all()
+        finally:
+            db.close()
+        heap = [(due, event_id) for due, event_id in rows]
+        heapq.heapify(heap)
+        with self._lock:
+            self._heap = heap
+            self._horizon = horizon
+
+    def _pop_due(self, now: datetime) -> List[Tuple[datetime, int]]:
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap))
+        return due
+
+    def _next_due(self) -> Optional[datetime]:
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def _fire(self, event_id: int, due: datetime) -> Optional[datetime]:
+        """
+        Skicka en påminnelse och flytta fram next_reminder_at
+
+        Returns:
+            Nästa påminnelse för händelsen, eller None om den inte ska schemaläggas
+        """
+        db = SessionLocal()
+        try:
+            event = db.get(models.Event, event_id)
+            if event is None or event.next_reminder_at != due:
+                # Borttagen eller ändrad sedan den lades i heapen
+                return None
+
+            # Räkna från nu om påminnelsen är sen (t.ex. efter ett driftstopp),
+            # så att missade förekomster inte avfyras en i taget
+            next_due = compute_next_reminder(event, max(due, datetime.utcnow()) + timedelta(microseconds=1))
+            if next_due is not None and next_due <= due:
+                # Får aldrig hända, men skulle annars avfyra samma påminnelse i en loop
+                print(f"Påminnelse för händelse {event_id} flyttades inte fram ({next_due}), stänger av den")
+                next_due = None
+            claimed = db.execute(
+                update(models.Event)
+                .where(models.Event.id == event_id, models.Event.next_reminder_at == due)
+                .values(next_reminder_at=next_due, updated_at=models.Event.updated_at)
+            ).rowcount == 1
+            if not claimed:
+                # En annan process hann före
+                db.rollback()
+                return None
+
+            if datetime.utcnow() - due <= timedelta(seconds=REMINDER_GRACE_SECONDS):
+                occurrence_start = due + timedelta(minutes=event.reminder_minutes or 0)
+                notifications.queue_event_reminder(
+                    db,
+                    event_title=event.title,
+                    event_start=occurrence_start,
+                    user_name=event.owner.name if event.owner else ""
+                )
+            db.commit()
+            return next_due
+        finally:
+            db.close()
+
+    async def run(self):
+        """Avfyra påminnelser tills tasken avbryts"""
+        self._wake = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        next_resync = datetime.min
+
+        while True:
+            self._wake.clear()
+            try:
+                now = datetime.utcnow()
+                if now >= next_resync:
+                    await asyncio.to_thread(self._load, now)
+                    next_resync = now + timedelta(seconds=REMINDER_RESYNC_SECONDS)
+
+                for due, event_id in self._pop_due(now):
+                    next_due = await asyncio.to_thread(self._fire, event_id, due)
+                    self.schedule(event_id, next_due)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Fel i påminnelse-schemaläggaren: {e}")
+
+            wake_at = min(filter(None, [self._next_due(), next_resync]))
+            sleep_seconds = max(0.0, (wake_at - datetime.utcnow()).total_seconds())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=sleep_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+
+scheduler = ReminderScheduler()
@@ -56,6 +56,39 @@ class Event(EventBase):
     class Config:
         from_attributes = True
 
+class EventChanges(BaseModel):
+    """Svar från /api/events/changes"""
+    created: list[Event]
+    updated: list[Event]
+    deleted: list[int]  # ID:n för borttagna händelser (tombstones)
+    next_token: str  # Skickas som since vid nästa synk (när next_cursor är None)
+    next_cursor: Optional[str] = None  # Nästa sida av en fullständig synk
+    reset: bool = False  # Fullständig omsynk: ersätt alla lokala händelser
+
+# Bulk-operationer (/api/events/bulk)
+class EventBulkCreate(BaseModel):
+    events: list[EventCreate]
+
+class EventBulkUpdateItem(EventUpdate):
+    id: int
+
+class EventBulkUpdate(BaseModel):
+    events: list[EventBulkUpdateItem]
+
+class EventBulkDelete(BaseModel):
+    ids: list[int]
+
+class EventBulkResult(BaseModel):
+    """Svar från bulk-endpoints: ID:n i samma ordning som i requesten"""
+    count: int
+    ids: list[int]
+
+class CalendarImportResult(BaseModel):
+    """Svar från /api/events/import"""
+    created: int = 0
+    duplicates: int = 0  # UID finns redan (i kalendern eller tidigare i filen)
+    unsupported: int = 0  # Avbokade, undantag från serier och RRULEs som inte stöds
+
 # AI Chat schemas
 class ChatMessage(BaseModel):
     role: str  # "user" or "assistant"
@@ -0,0 +1,107 @@
+"""
+Snabb JSON-serialisering av event-listor
+
+/api/events kan returnera tusentals events (inklusive återkommande
+instanser). I stället för att validera varje rad mot schemas.Event med
+Pydantic byggs JSON direkt från raderna. Allt som är gemensamt för en
+serie (titel, beskrivning, ägare, ...) serialiseras en gång per
+original händelse, och per instans skrivs bara start, slut och id.
+
+Utdata ska vara byte-identisk med List[schemas.Event] i FastAPI:
+samma fältordning, kompakta separatorer och Pydantics datumformat.
+"""
+import json
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from . import models
+
+
+def _json_str(value: Optional[str]) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _json_datetime(value: Optional[datetime]) -> str:
+    """Datum som Pydantic serialiserar dem (ISO 8601, UTC som 'Z')"""
+    if value is None:
+        return "null"
+    text = value.isoformat()
+    if text.endswith("+00:00"):
+        text = text[:-6] + "Z"
+    return f'"{text}"'
+
+
+def _json_bool(value: bool) -> str:
+    return "true" if value else "false"
+
+
+def _owner_fragment(owner: models.User) -> str:
+    """Ägaren enligt schemas.User"""
+    return (
+        f'{{"name":{_json_str(owner.name)},"color":{_json_str(owner.color)},'
+        f'"id":{owner.id},"created_at":{_json_datetime(owner.created_at)}}}'
+    )
+
+
+def _event_fragments(event: models.Event, owner_json: str) -> Tuple[str, str, str]:
+    """
+    De delar av en event-rad som inte beror på start/slut/id
+
+    Returns:
+        (före start_time, mellan end_time och id, efter id)
+    """
+    head = (
+        f'{{"title":{_json_str(event.title)},'
+        f'"description":{_json_str(event.description)},'
+        f'"start_time":'
+    )
+    middle = (
+        f',"all_day":{_json_bool(event.all_day)},'
+        f'"user_id":{event.user_id},'
+        f'"reminder_enabled":{_json_bool(event.reminder_enabled)},'
+        f'"reminder_minutes":{event.reminder_minutes},'
+        f'"recurrence_type":{_json_str(event.recurrence_type)},'
+        f'"recurrence_interval":{event.recurrence_interval},'
+        f'"recurrence_end_date":{_json_datetime(event.recurrence_end_date)},'
+        f'"id":'
+    )
+    tail = (
+        f',"created_at":{_json_datetime(event.created_at)},'
+        f'"updated_at":{_json_datetime(event.updated_at)},'
+        f'"owner":{owner_json}}}'
+    )
+    return head, middle, tail
+
+
+def dump_events_json(events: Iterable) -> bytes:
+    """
+    Serialisera events (ORM-rader och RecurrenceInstance) till en JSON-lista
+
+    Args:
+        events: Events i den ordning de ska returneras
+
+    Returns:
+        JSON som bytes, samma format som List[schemas.Event]
+    """
+    owners: Dict[int, str] = {}
+    fragments: Dict[int, Tuple[str, str, str]] = {}
+    parts = []
+
+    for event in events:
+        # Recurring-instanser delar fragment med sin original händelse
+        source = getattr(event, "parent", None) or event
+
+        cached = fragments.get(id(source))
+        if cached is None:
+            owner_json = owners.get(source.user_id)
+            if owner_json is None:
+                owner_json = owners[source.user_id] = _owner_fragment(source.owner)
+            cached = fragments[id(source)] = _event_fragments(source, owner_json)
+
+        head, middle, tail = cached
+        parts.append(
+            f'{head}{_json_datetime(event.start_time)},"end_time":{_json_datetime(event.end_time)}'
+            f'{middle}{event.id}{tail}'
+        )
+
+    return ("[" + ",".join(parts) + "]").encode("utf-8")
@@ -0,0 +1,108 @@
+"""
+Cache för transkriberingar, nycklad på ljudets innehåll
+
+Samma röstklipp skickas ofta igen (nytt försök efter ett fel i chatten).
+Nyckeln är sha256 av ljudets bytes plus modell och språk, så ett identiskt
+klipp ger samma text utan ett nytt anrop till Groq Whisper.
+
+Två nivåer:
+- minne: LRU med tak på antal poster (TRANSCRIPTION_CACHE_MAX_ENTRIES)
+- disk (valfri): en textfil per nyckel i TRANSCRIPTION_CACHE_DIR, så att
+  cachen överlever omstarter och delas mellan workers på samma maskin
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Optional
+
+TRANSCRIPTION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPTION_CACHE_MAX_ENTRIES", "256"))
+TRANSCRIPTION_CACHE_DIR = os.getenv("TRANSCRIPTION_CACHE_DIR")
+TRANSCRIPTION_CACHE_DISK_MAX_FILES = int(os.getenv("TRANSCRIPTION_CACHE_DISK_MAX_FILES", "5000"))
+
+_HASH_CHUNK_SIZE = 64 * 1024
+
+
+def transcription_key(audio_file: BinaryIO, model: str, language: str) -> str:
+    """sha256 av ljudet (läst i bitar) och parametrarna. Filen spolas tillbaka efteråt"""
+    digest = hashlib.sha256()
+    audio_file.seek(0)
+    while chunk := audio_file.read(_HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    audio_file.seek(0)
+    digest.update(f"|{model}|{language}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    def __init__(self, max_entries: int, directory: Optional[str] = None, disk_max_files: int = 5000):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.disk_max_files = disk_max_files
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.txt")
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+                return text
+
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                text = f.read()
+            # Uppdatera mtime så att rensningen tar de äldst använda först
+            os.utime(self._path(key))
+        except OSError:
+            return None
+        self._put_memory(key, text)
+        return text
+
+    def put(self, key: str, text: str):
+        self._put_memory(key, text)
+        if self.directory:
+            try:
+                self._put_disk(key, text)
+            except OSError as e:
+                print(f"Kunde inte spara transkribering i diskcachen: {e}")
+
+    def _put_memory(self, key: str, text: str):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _put_disk(self, key: str, text: str):
+        # Skriv till en temporär fil och byt namn, så att läsare aldrig ser en halv fil
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, self._path(key))
+
+        files = [name for name in os.listdir(self.directory) if name.endswith(".txt")]
+        if len(files) > self.disk_max_files:
+            paths = sorted((os.path.join(self.directory, name) for name in files), key=os.path.getmtime)
+            for path in paths[:len(files) - self.disk_max_files]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+transcription_cache = TranscriptionCache(
+    max_entries=TRANSCRIPTION_CACHE_MAX_ENTRIES,
+    directory=TRANSCRIPTION_CACHE_DIR,
+    disk_max_files=TRANSCRIPTION_CACHE_DISK_MAX_FILES,
+)
@@ -0,0 +1,72 @@
+"""
+Storleksgräns för uppladdningar som kontrolleras medan bodyn strömmar in
+
+UploadSizeLimitMiddleware räknar bytes för de angivna sökvägarna och svarar
+413 så fort gränsen passeras, istället för att först ta emot hela filen.
+Starlettes multipart-parser skriver redan filen till en SpooledTemporaryFile
+i bitar, så med gränsen här behöver endpointen aldrig läsa in filen i minnet.
+"""
+from typing import Iterable
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class _UploadTooLarge(Exception):
+    pass
+
+
+class UploadSizeLimitMiddleware:
+    def __init__(self, app: ASGIApp, max_bytes: int, paths: Iterable[str]):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = set(paths)
+
+    def _reject(self) -> JSONResponse:
+        max_mb = self.max_bytes / (1024 * 1024)
+        # Samma format som endpointens egna fel, så frontend visar felet
+        return JSONResponse(
+            {"success": False, "text": "", "error": f"Filen är för stor. Max {max_mb:.0f}MB tillåtet."},
+            status_code=413
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        # Avvisa direkt om klienten anger en för stor Content-Length
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                await self._reject()(scope, receive, send)
+                return
+
+        received = 0
+        rejected = False
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, rejected
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    if not rejected and not response_started:
+                        rejected = True
+                        await self._reject()(scope, receive, send)
+                    raise _UploadTooLarge()
+            return message
+
+        async def guarded_send(message: Message):
+            nonlocal response_started
+            # Appens eget svar (t.ex. ett parse-fel) skickas inte efter 413
+            if rejected:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _UploadTooLarge:
+            pass
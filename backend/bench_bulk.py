@@ -0,0 +1,67 @@
+"""
+Benchmark: 1000 händelser via POST /api/events en och en mot POST /api/events/bulk
+Kör: DATABASE_URL=sqlite:///bench.db python backend/bench_bulk.py [antal händelser]
+
+Appen körs i processen via httpx.ASGITransport. Notifikations-workern och
+påminnelserna startas inte (ingen lifespan), så bara API:t och databasen mäts.
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from app import crud, models, schemas
+from app.database import SessionLocal, engine
+from app.main import app
+
+COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+def ensure_users():
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        for name, color in [("albin", "#3b82f6"), ("maria", "#ef4444")]:
+            if not crud.get_user_by_name(db, name):
+                crud.create_user(db, schemas.UserCreate(name=name, color=color))
+        return [user.id for user in crud.get_users(db)]
+    finally:
+        db.close()
+
+def make_events(user_ids):
+    start = datetime(2030, 1, 7, 16, 0)
+    return [
+        {
+            "title": f"Träning {i}",
+            "start_time": (start + timedelta(days=i)).isoformat(),
+            "end_time": (start + timedelta(days=i, hours=1)).isoformat(),
+            "user_id": user_ids[i % len(user_ids)],
+        }
+        for i in range(COUNT)
+    ]
+
+async def main():
+    events = make_events(ensure_users())
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        started = time.perf_counter()
+        for event in events:
+            (await client.post("/api/events", json=event)).raise_for_status()
+        single = time.perf_counter() - started
+
+        started = time.perf_counter()
+        response = await client.post("/api/events/bulk", json={"events": events})
+        response.raise_for_status()
+        bulk = time.perf_counter() - started
+
+        # Städa upp så att databasen inte växer mellan körningarna
+        ids = response.json()["ids"]
+        (await client.request("DELETE", "/api/events/bulk", json={"ids": ids})).raise_for_status()
+
+    print(f"{COUNT} händelser")
+    print(f"en och en: {single * 1000:8.0f} ms")
+    print(f"bulk:      {bulk * 1000:8.0f} ms  ({single / bulk:.0f}x snabbare)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
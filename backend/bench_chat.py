@@ -0,0 +1,84 @@
+"""
+Benchmark: genomströmning för /api/ai/chat med fake-providern (inget nätverk)
+Kör: DATABASE_URL=sqlite:///bench.db python backend/bench_chat.py [antal turer per nivå] [latens ms]
+
+Appen körs i processen via httpx.ASGITransport med AI_PROVIDER=fake. Varje
+tur gör två modellanrop (verktyg + svar) med den angivna latensen, så
+"egen overhead" = latens per tur minus 2 x modellens latens: tiden i vår kod,
+databasen och verktygen.
+"""
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+TURNS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+LATENCY_MS = float(sys.argv[2]) if len(sys.argv) > 2 else 300
+
+os.environ["AI_PROVIDER"] = "fake"
+os.environ["AI_FAKE_LATENCY_MS"] = str(LATENCY_MS)
+os.environ.setdefault("AI_MAX_CONCURRENT_CHATS", "1000")
+
+import httpx
+
+from app import crud, models, schemas
+from app.database import SessionLocal, engine
+from app.main import app
+
+CONCURRENCY_LEVELS = [1, 10, 50]
+MODEL_CALLS_PER_TURN = 2
+
+def ensure_users():
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        for name, color in [("albin", "#3b82f6"), ("maria", "#ef4444")]:
+            if not crud.get_user_by_name(db, name):
+                crud.create_user(db, schemas.UserCreate(name=name, color=color))
+    finally:
+        db.close()
+
+def percentile(values: List[float], p: float) -> float:
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+async def run_level(client: httpx.AsyncClient, concurrency: int):
+    latencies: List[float] = []
+    remaining = [TURNS]
+
+    async def worker(worker_id: int):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            started = time.perf_counter()
+            response = await client.post("/api/ai/chat", json={
+                "message": "Vad är bokat den här veckan?",
+                "session_id": f"bench_{worker_id}",
+            })
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    model_ms = MODEL_CALLS_PER_TURN * LATENCY_MS
+    p50 = percentile(latencies, 50) * 1000
+    p95 = percentile(latencies, 95) * 1000
+    print(
+        f"{concurrency:>4} samtidiga: {len(latencies) / elapsed:7.1f} turer/s  "
+        f"p50 {p50:7.1f} ms  p95 {p95:7.1f} ms  "
+        f"egen overhead p50 {p50 - model_ms:6.1f} ms  p95 {p95 - model_ms:6.1f} ms"
+    )
+
+async def main():
+    ensure_users()
+    print(f"/api/ai/chat, {TURNS} turer per nivå, {LATENCY_MS:.0f} ms modellatens per anrop")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        for concurrency in CONCURRENCY_LEVELS:
+            await run_level(client, concurrency)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+"""
+Lastbenchmark mot en körande server
+Kör: python backend/bench_load.py [bas-URL] [antal requests per nivå]
+
+Skickar GET /api/events med 50 och 200 samtidiga klienter och skriver ut
+req/s och latens-percentiler. Jämför DB_ASYNC=false och DB_ASYNC=true
+genom att starta servern med respektive inställning.
+"""
+import asyncio
+import sys
+import time
+from typing import List
+
+import httpx
+
+CONCURRENCY_LEVELS = [50, 200]
+
+async def worker(client: httpx.AsyncClient, path: str, remaining: List[int], latencies: List[float], errors: List[int]):
+    while remaining[0] > 0:
+        remaining[0] -= 1
+        started = time.perf_counter()
+        try:
+            response = await client.get(path)
+            if response.status_code != 200:
+                errors[0] += 1
+        except httpx.HTTPError:
+            errors[0] += 1
+        latencies.append(time.perf_counter() - started)
+
+def percentile(values: List[float], p: float) -> float:
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+async def run_level(base_url: str, concurrency: int, total: int):
+    latencies: List[float] = []
+    errors = [0]
+    remaining = [total]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            worker(client, "/api/events", remaining, latencies, errors) for _ in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(
+        f"{concurrency:>4} samtidiga: {len(latencies) / elapsed:8.1f} req/s  "
+        f"p50 {percentile(latencies, 50) * 1000:7.1f} ms  "
+        f"p95 {percentile(latencies, 95) * 1000:7.1f} ms  "
+        f"p99 {percentile(latencies, 99) * 1000:7.1f} ms  "
+        f"fel {errors[0]}"
+    )
+
+async def main():
+    base_url = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:8000"
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    print(f"GET {base_url}/api/events, {total} requests per nivå")
+    for concurrency in CONCURRENCY_LEVELS:
+        await run_level(base_url, concurrency, total)
+
+if __name__ == "__main__":
+    asyncio.run(main())
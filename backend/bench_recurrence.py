@@ -0,0 +1,85 @@
+"""
+Benchmark: batch-expansion (NumPy) mot per-event-loopen för återkommande händelser
+Kör: python backend/bench_recurrence.py [antal serier]
+Ingen databas behövs, serierna byggs i minnet.
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.recurrence import (
+    generate_recurrence_instances, expand_recurrences_batch, _expand_occurrences,
+    first_occurrence_at_or_after, occurrence_start,
+)
+
+def build_series(count: int):
+    random.seed(42)
+    owner = SimpleNamespace(id=1, name="albin", color="#039BE5", created_at=datetime(2024, 1, 1))
+    series = []
+    for i in range(count):
+        start = datetime(2022, 1, 1, 8) + timedelta(days=random.randrange(0, 1000), minutes=15 * random.randrange(0, 40))
+        series.append(SimpleNamespace(
+            id=i + 1,
+            title=f"Serie {i}",
+            description=None,
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+            all_day=False,
+            user_id=1,
+            reminder_enabled=False,
+            reminder_minutes=30,
+            recurrence_type=random.choice(["daily", "weekly", "weekly", "monthly"]),
+            recurrence_interval=random.choice([1, 1, 2, 3]),
+            recurrence_end_date=None,
+            created_at=start,
+            updated_at=start,
+            owner=owner,
+        ))
+    return series
+
+def timed(label: str, fn):
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {elapsed * 1000:9.1f} ms  ({result} instanser)")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    series = build_series(count)
+    # Standardfönstret i get_events: 3 månader bakåt, 6 månader framåt
+    start_date = datetime(2025, 3, 1)
+    end_date = start_date + timedelta(days=270)
+
+    print(f"{count} serier, fönster {start_date.date()} - {end_date.date()}")
+
+    def loop_timestamps():
+        total = 0
+        for event in series:
+            occurrence = max(1, first_occurrence_at_or_after(event, start_date))
+            while occurrence_start(event, occurrence) <= end_date:
+                total += 1
+                occurrence += 1
+        return total
+    timed("per-event-loop (bara tidsstämplar)", loop_timestamps)
+    timed("batch (bara tidsstämplar)", lambda: len(_expand_occurrences(series, start_date, end_date)[0]))
+
+    timed("per-event-loop (alla instanser)", lambda: sum(
+        len(generate_recurrence_instances(event, start_date, end_date)) for event in series
+    ))
+    timed("per-event-loop (sorterat)", lambda: len(sorted(
+        (i for event in series for i in generate_recurrence_instances(event, start_date, end_date)),
+        key=lambda i: (i.start_time, i.id)
+    )))
+    timed("batch (alla instanser, sorterat)", lambda: sum(
+        1 for _ in expand_recurrences_batch(series, start_date, end_date)
+    ))
+
+    def first_page():
+        instances = expand_recurrences_batch(series, start_date, end_date)
+        return sum(1 for _, _ in zip(range(1000), instances))
+    timed("batch (första sidan, limit=1000)", first_page)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Benchmark: serializers.dump_events_json mot Pydantic-vägen (response_model)
+Kör: python backend/bench_serialization.py [antal serier]
+Ingen databas behövs, raderna byggs i minnet.
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from pydantic import TypeAdapter
+
+from app import schemas
+from app.recurrence import expand_recurrences_batch
+from app.serializers import dump_events_json
+from bench_recurrence import build_series
+
+def pydantic_path(events) -> bytes:
+    # Samma steg som FastAPI gör med response_model=List[schemas.Event]
+    adapter = TypeAdapter(List[schemas.Event])
+    return adapter.dump_json(adapter.validate_python(events, from_attributes=True))
+
+def timed(label: str, fn, events):
+    started = time.perf_counter()
+    result = fn(events)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<30} {elapsed * 1000:9.1f} ms  ({len(result) / 1024:.0f} kB)")
+    return result
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    series = build_series(count)
+    start_date = datetime(2025, 3, 1)
+    end_date = start_date + timedelta(days=270)
+    events = list(series) + list(expand_recurrences_batch(series, start_date, end_date))
+
+    print(f"{len(events)} events ({count} serier, fönster {start_date.date()} - {end_date.date()})")
+    slow = timed("pydantic (response_model)", pydantic_path, events)
+    fast = timed("dump_events_json", dump_events_json, events)
+    print("byte-identiskt:", slow == fast)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark: minnestopp per transkriberings-request, gammal mot ny uppladdningsväg
+Kör: python backend/bench_upload.py [storlek i MB]
+
+Båda vägarna börjar från en SpooledTemporaryFile som Starlettes multipart-parser
+lämnar efter sig. Groq-anropet simuleras: den gamla vägen skickade en Path
+(som Groq-klienten läser in helt med read_bytes), den nya skickar filobjektet
+som httpx läser i bitar på 64 kB. Mäts med tracemalloc.
+"""
+import os
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+# Samma gräns som Starlette använder innan spool-filen hamnar på disk
+SPOOL_MAX_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+def make_upload(size: int) -> tempfile.SpooledTemporaryFile:
+    upload = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    chunk = os.urandom(CHUNK_SIZE)
+    for _ in range(size // CHUNK_SIZE):
+        upload.write(chunk)
+    upload.seek(0)
+    return upload
+
+def old_path(upload) -> int:
+    # await audio.read() -> NamedTemporaryFile -> Path -> read_bytes()
+    content = upload.read()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as tmp_file:
+        tmp_file.write(content)
+        tmp_path = tmp_file.name
+    try:
+        body = Path(tmp_path).read_bytes()
+        return len(body)
+    finally:
+        os.unlink(tmp_path)
+
+def new_path(upload) -> int:
+    # audio.file skickas direkt och läses i bitar av HTTP-klienten
+    upload.seek(0)
+    sent = 0
+    while chunk := upload.read(CHUNK_SIZE):
+        sent += len(chunk)
+    return sent
+
+def measure(label: str, fn, size: int):
+    upload = make_upload(size)
+    tracemalloc.start()
+    sent = fn(upload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    upload.close()
+    print(f"{label:<12} toppminne {peak / (1024 * 1024):7.2f} MB  ({sent / (1024 * 1024):.0f} MB skickat)")
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    size = size_mb * 1024 * 1024
+    print(f"Ljudfil på {size_mb} MB")
+    measure("gammal väg", old_path, size)
+    measure("ny väg", new_path, size)
+
+if __name__ == "__main__":
+    main()
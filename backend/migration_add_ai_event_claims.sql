@@ -0,0 +1,14 @@
+-- Migration: Add cross-worker dedup table for events created by the AI assistant
+-- Run this in Supabase SQL Editor (or POST /admin/migrate)
+
+CREATE TABLE IF NOT EXISTS ai_event_claims (
+    id SERIAL PRIMARY KEY,
+    session_id VARCHAR NOT NULL,
+    event_hash VARCHAR NOT NULL,
+    event_id INTEGER,
+    created_at TIMESTAMP,
+    CONSTRAINT uq_ai_event_claims_session_hash UNIQUE (session_id, event_hash)
+);
+
+CREATE INDEX IF NOT EXISTS ix_ai_event_claims_created_at
+ON ai_event_claims (created_at);
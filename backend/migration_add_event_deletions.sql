@@ -0,0 +1,14 @@
+-- Migration: Add tombstones and index for incremental sync (/api/events/changes)
+-- Run this in Supabase SQL Editor (or POST /admin/migrate)
+
+CREATE INDEX IF NOT EXISTS ix_events_updated_at
+ON events (updated_at);
+
+CREATE TABLE IF NOT EXISTS event_deletions (
+    id SERIAL PRIMARY KEY,
+    event_id INTEGER NOT NULL,
+    deleted_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_event_deletions_deleted_at
+ON event_deletions (deleted_at);
@@ -0,0 +1,10 @@
+-- Migration: Add indexes for time-range event queries
+-- Run this in Supabase SQL Editor (or POST /admin/migrate)
+
+-- One-off events overlapping a window (crud.get_events)
+CREATE INDEX IF NOT EXISTS ix_events_start_end
+ON events (start_time, end_time);
+
+-- Recurring series still active in a window
+CREATE INDEX IF NOT EXISTS ix_events_recurrence
+ON events (recurrence_type, recurrence_end_date);
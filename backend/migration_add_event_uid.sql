@@ -0,0 +1,8 @@
+-- Migration: Add iCalendar UID to events (deduplication for .ics import)
+-- Run this in Supabase SQL Editor (or POST /admin/migrate)
+
+ALTER TABLE events
+ADD COLUMN IF NOT EXISTS uid VARCHAR;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_events_uid
+ON events (uid);
@@ -0,0 +1,9 @@
+-- Migration: Add precomputed next reminder time for the reminder scheduler
+-- Run this in Supabase SQL Editor, then POST /admin/migrate to backfill
+-- next_reminder_at for existing events (it needs the recurrence rules)
+
+ALTER TABLE events
+ADD COLUMN IF NOT EXISTS next_reminder_at TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS ix_events_next_reminder_at
+ON events (next_reminder_at);
@@ -0,0 +1,18 @@
+-- Migration: Add notification outbox drained by the background worker
+-- Run this in Supabase SQL Editor (or POST /admin/migrate)
+
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id SERIAL PRIMARY KEY,
+    title VARCHAR,
+    message TEXT,
+    priority VARCHAR DEFAULT 'default',
+    tags VARCHAR,
+    attempts INTEGER DEFAULT 0,
+    next_attempt_at TIMESTAMP,
+    sent_at TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_notification_outbox_pending
+ON notification_outbox (sent_at, next_attempt_at);
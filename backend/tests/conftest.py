@@ -0,0 +1,50 @@
+"""
+Gemensamma fixtures: appen körs mot en SQLite-fil utan bakgrundsworkers
+Kör: cd backend && python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix="familjekalender-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_dir}/test.db"
+os.environ["NOTIFICATION_WORKER_ENABLED"] = "false"
+os.environ["REMINDER_SCHEDULER_ENABLED"] = "false"
+os.environ["AI_PROVIDER"] = "fake"
+os.environ["AI_FAKE_LATENCY_MS"] = "0"
+os.environ["AI_FAKE_TOKEN_DELAY_MS"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from app import models, schemas, crud
+from app.cache import event_windows
+from app.database import SessionLocal, engine
+
+
+@pytest.fixture
+def db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    event_windows.clear()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def users(db):
+    return [
+        crud.create_user(db, schemas.UserCreate(name=name, color="#3b82f6"))
+        for name in ("albin", "maria")
+    ]
+
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    return TestClient(app)
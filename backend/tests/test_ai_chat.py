@@ -0,0 +1,24 @@
+import asyncio
+import time
+
+from app import ai, models
+
+
+def test_tool_writes_finish_when_the_chat_times_out(db, users, monkeypatch):
+    original = ai.create_event_tool
+
+    def slow_create_event_tool(*args, **kwargs):
+        time.sleep(0.3)
+        return original(*args, **kwargs)
+
+    # Verktyget tar längre tid än hela tidsgränsen för AI-anropen
+    monkeypatch.setattr(ai, "create_event_tool", slow_create_event_tool)
+    monkeypatch.setattr(ai, "AI_CHAT_TIMEOUT_SECONDS", 0.2)
+
+    result = asyncio.run(ai.chat_with_ai("Boka tandläkare", db, "session-1"))
+
+    # Andra AI-anropet hinner inte, men bokningen är klar och sparad
+    assert result["success"] is False
+    assert "Tidsgränsen" in result["error"]
+    db.expire_all()
+    assert db.query(models.Event).filter(models.Event.title == "Boka tandläkare").count() == 1
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+from app import ai, crud, schemas
+
+
+def _create(db, user_id: int, title: str, start: datetime, hours: int = 1, recurrence_type: str = "none"):
+    return crud.create_event(db, schemas.EventCreate(
+        title=title, start_time=start, end_time=start + timedelta(hours=hours),
+        user_id=user_id, recurrence_type=recurrence_type,
+    ))
+
+
+def _separate_calls(db, windows):
+    return [ai.get_events_tool(db, start.isoformat(), end.isoformat()) for start, end in windows]
+
+
+def test_shared_fetch_matches_separate_calls(db, users):
+    base = datetime(2030, 3, 4, 10)
+    _create(db, users[0].id, "Simskola", base, recurrence_type="weekly")
+    _create(db, users[1].id, "Konferens", base - timedelta(days=1), hours=72)
+    _create(db, users[0].id, "Middag", base + timedelta(days=8, hours=8))
+
+    # Andra fönstret börjar mitt i seriens första förekomst (originalet)
+    windows = [
+        (base - timedelta(days=2), base + timedelta(days=1)),
+        (base + timedelta(minutes=30), base + timedelta(days=9)),
+        (base + timedelta(days=6), base + timedelta(days=15)),
+    ]
+    assert ai.get_events_for_windows(db, windows) == _separate_calls(db, windows)
+
+
+def test_shared_fetch_is_not_truncated(db, users, monkeypatch):
+    monkeypatch.setattr(ai, "TOOL_EVENTS_BATCH_LIMIT", 3)
+    base = datetime(2030, 3, 4, 8)
+    for day in range(10):
+        _create(db, users[day % 2].id, f"Pass {day}", base + timedelta(days=day))
+
+    windows = [(base, base + timedelta(days=5)), (base + timedelta(days=4), base + timedelta(days=10))]
+    results = ai.get_events_for_windows(db, windows)
+    assert results == _separate_calls(db, windows)
+    assert "Pass 9" in results[1]
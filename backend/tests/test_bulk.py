@@ -0,0 +1,58 @@
+from app import models
+
+
+def _event(user_id: int, day: int, **extra):
+    return {
+        "title": f"Träning {day}",
+        "start_time": f"2030-03-{day:02d}T16:00:00.000Z",
+        "end_time": f"2030-03-{day:02d}T17:00:00.000Z",
+        "user_id": user_id,
+        **extra,
+    }
+
+
+def test_bulk_create_with_utc_suffixed_times(client, db, users):
+    # Fyll cachen för fönstret så att invalideringen körs mot en riktig post
+    client.get("/api/events", params={"start_date": "2030-03-01", "end_date": "2030-04-01"})
+
+    events = [
+        _event(users[0].id, 1, reminder_enabled=True, recurrence_type="weekly",
+               recurrence_end_date="2030-06-01T21:59:59.000Z"),
+        _event(users[1].id, 2),
+        {**_event(users[0].id, 3), "start_time": "2030-03-03T16:00:00"},  # blandat naivt/aware
+    ]
+    response = client.post("/api/events/bulk", json={"events": events})
+    assert response.status_code == 200, response.text
+    assert response.json()["count"] == 3
+
+    listed = client.get("/api/events", params={"start_date": "2030-03-01", "end_date": "2030-04-01"}).json()
+    assert {"Träning 1", "Träning 2", "Träning 3"} <= {event["title"] for event in listed}
+    assert db.query(models.Event).count() == 3
+
+
+def test_bulk_update_with_utc_suffixed_times(client, db, users):
+    ids = client.post("/api/events/bulk", json={"events": [_event(users[0].id, 5)]}).json()["ids"]
+    response = client.put("/api/events/bulk", json={"events": [
+        {"id": ids[0], "start_time": "2030-03-06T08:00:00Z", "end_time": "2030-03-06T09:00:00Z",
+         "reminder_enabled": True}
+    ]})
+    assert response.status_code == 200, response.text
+    assert client.get(f"/api/events/{ids[0]}").json()["start_time"].startswith("2030-03-06T08:00:00")
+
+
+def test_bulk_create_reports_end_before_start(client, users):
+    event = _event(users[0].id, 7, end_time="2030-03-07T15:00:00Z")
+    response = client.post("/api/events/bulk", json={"events": [event]})
+    assert response.status_code == 400
+
+
+def test_bulk_create_succeeds_when_cache_invalidation_fails(client, db, users, monkeypatch):
+    from app.cache import event_windows
+
+    def broken(*args):
+        raise TypeError("trasig invalidering")
+    monkeypatch.setattr(event_windows, "invalidate_span", broken)
+
+    response = client.post("/api/events/bulk", json={"events": [_event(users[0].id, 9)]})
+    assert response.status_code == 200, response.text
+    assert db.query(models.Event).count() == 1
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app import models
+
+WINDOW = {"start_date": "2030-01-01", "end_date": "2030-02-01"}
+
+
+def _create(client, user_id: int, title: str):
+    return client.post("/api/events", json={
+        "title": title, "start_time": "2030-01-10T10:00:00Z", "end_time": "2030-01-10T11:00:00Z",
+        "user_id": user_id,
+    }).json()["id"]
+
+
+def test_write_from_another_process_is_not_served_from_cache(client, db, users):
+    event_id = _create(client, users[0].id, "Gammal titel")
+    first = client.get("/api/events", params=WINDOW)
+    assert first.json()[0]["title"] == "Gammal titel"
+
+    # En annan worker ändrar raden; den här processens cache invalideras inte
+    db.execute(
+        update(models.Event).where(models.Event.id == event_id)
+        .values(title="Ny titel", updated_at=datetime.utcnow() + timedelta(seconds=1))
+    )
+    db.commit()
+
+    second = client.get("/api/events", params=WINDOW, headers={"If-None-Match": first.headers["etag"]})
+    assert second.status_code == 200
+    assert second.json()[0]["title"] == "Ny titel"
+    assert second.headers["etag"] != first.headers["etag"]
+
+    third = client.get("/api/events", params=WINDOW, headers={"If-None-Match": second.headers["etag"]})
+    assert third.status_code == 304
+
+
+def test_cache_entry_with_old_validator_is_a_miss(db, users):
+    from app import crud, schemas
+    start = datetime(2030, 1, 10, 10)
+    crud.create_event(db, schemas.EventCreate(
+        title="A", start_time=start, end_time=start + timedelta(hours=1), user_id=users[0].id
+    ))
+    window = (datetime(2030, 1, 1), datetime(2030, 2, 1))
+    old_validator = tuple(crud.get_events_validator(db, *window))
+
+    # En läsning som startade före en skrivning cachar sidan med den gamla validatorn
+    crud.create_event(db, schemas.EventCreate(
+        title="B", start_time=start, end_time=start + timedelta(hours=1), user_id=users[0].id
+    ))
+    crud.get_events_page(db, start_date=window[0], end_date=window[1], validator=old_validator)
+
+    events, _ = crud.get_events_page(db, start_date=window[0], end_date=window[1])
+    assert sorted(event.title for event in events) == ["A", "B"]
@@ -0,0 +1,78 @@
+from datetime import datetime
+
+from app import crud, models
+
+
+def test_all_day_monthly_round_trip_uses_local_day(client, db, users):
+    # 31 januari i Europe/Stockholm är 30 januari 23:00 i UTC
+    response = client.post("/api/events", json={
+        "title": "Hyra", "start_time": "2030-01-30T23:00:00Z", "end_time": "2030-01-31T23:00:00Z",
+        "all_day": True, "user_id": users[0].id, "recurrence_type": "monthly",
+    })
+    assert response.status_code == 200, response.text
+    event_id = response.json()["id"]
+
+    exported = client.get("/api/calendar.ics").text
+    assert "DTSTART;VALUE=DATE:20300131" in exported
+    assert "RRULE:FREQ=MONTHLY;INTERVAL=1;BYMONTHDAY=28,29,30,31;BYSETPOS=-1" in exported
+
+    # Exportens UID räknas som en dubblett så länge originalet finns kvar
+    assert client.delete(f"/api/events/{event_id}").status_code == 200
+    response = client.post(
+        "/api/events/import", params={"user_id": users[1].id},
+        files={"file": ("kalender.ics", exported.encode("utf-8"), "text/calendar")},
+    )
+    assert response.json() == {"created": 1, "duplicates": 0, "unsupported": 0}
+
+    imported = db.query(models.Event).filter(models.Event.user_id == users[1].id).one()
+    assert imported.all_day
+    assert imported.start_time == datetime(2030, 1, 30, 23)
+    assert (imported.recurrence_type, imported.recurrence_interval) == ("monthly", 1)
+
+
+def test_feed_ignores_if_modified_since_after_event_moves(client, users):
+    for title in ("Fotboll", "Simning"):
+        response = client.post("/api/events", json={
+            "title": title, "start_time": "2030-02-01T16:00:00Z", "end_time": "2030-02-01T17:00:00Z",
+            "user_id": users[0].id,
+        })
+        assert response.status_code == 200, response.text
+    moved_id = response.json()["id"]
+
+    feed = client.get("/api/calendar.ics", params={"user_id": users[0].id})
+    last_modified = feed.headers["last-modified"]
+
+    # Den senast ändrade händelsen flyttas: Last-Modified för flödet går bakåt
+    assert client.put(f"/api/events/{moved_id}", json={"user_id": users[1].id}).status_code == 200
+
+    response = client.get(
+        "/api/calendar.ics", params={"user_id": users[0].id}, headers={"If-Modified-Since": last_modified}
+    )
+    assert response.status_code == 200
+    assert "Simning" not in response.text
+
+
+def test_concurrent_import_of_same_uids_counts_duplicates(client, db, users, monkeypatch):
+    feed = "\r\n".join([
+        "BEGIN:VCALENDAR", "VERSION:2.0",
+        "BEGIN:VEVENT", "UID:extern-1@example.com", "DTSTART:20300301T080000Z", "DTEND:20300301T090000Z",
+        "SUMMARY:Skolstart", "END:VEVENT",
+        "BEGIN:VEVENT", "UID:extern-2@example.com", "DTSTART:20300302T080000Z", "DTEND:20300302T090000Z",
+        "SUMMARY:Utvecklingssamtal", "END:VEVENT",
+        "END:VCALENDAR", "",
+    ]).encode("utf-8")
+
+    def upload():
+        return client.post(
+            "/api/events/import", params={"user_id": users[0].id},
+            files={"file": ("skola.ics", feed, "text/calendar")},
+        )
+
+    assert upload().json() == {"created": 2, "duplicates": 0, "unsupported": 0}
+
+    # Som om den andra importen kontrollerade UID:n innan den första hann skriva
+    monkeypatch.setattr(crud, "get_existing_uids", lambda db, uids: set())
+    response = upload()
+    assert response.status_code == 200
+    assert response.json() == {"created": 0, "duplicates": 2, "unsupported": 0}
+    assert db.query(models.Event).count() == 2
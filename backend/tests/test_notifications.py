@@ -0,0 +1,18 @@
+from datetime import datetime, timedelta
+
+from app import models, notifications
+
+
+def test_purge_sent_removes_only_old_sent_rows(db):
+    now = datetime.utcnow()
+    retention = timedelta(hours=notifications.NOTIFY_RETENTION_HOURS)
+    db.add_all([
+        models.NotificationOutbox(title="gammal", sent_at=now - retention - timedelta(hours=1)),
+        models.NotificationOutbox(title="ny", sent_at=now - timedelta(hours=1)),
+        models.NotificationOutbox(title="väntar", sent_at=None, created_at=now - retention * 2),
+    ])
+    db.commit()
+
+    assert notifications.purge_sent() == 1
+    db.expire_all()
+    assert sorted(row.title for row in db.query(models.NotificationOutbox)) == ["ny", "väntar"]
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta
+
+
+def test_following_next_cursor_returns_all_events(client, users):
+    # Fler events än standardgränsen (1000) i standardfönstret
+    start = datetime.utcnow().replace(hour=8, minute=0, second=0, microsecond=0)
+    payload = [
+        {
+            "title": f"Pass {i}",
+            "start_time": (start + timedelta(minutes=i)).isoformat(),
+            "end_time": (start + timedelta(minutes=i + 30)).isoformat(),
+            "user_id": users[i % 2].id,
+        }
+        for i in range(1005)
+    ]
+    assert client.post("/api/events/bulk", json={"events": payload}).status_code == 200
+
+    # Samma loop som fetchAllEvents i App.jsx
+    ids, params = [], {}
+    while True:
+        response = client.get("/api/events", params=params)
+        assert response.status_code == 200
+        ids.extend(event["id"] for event in response.json())
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            break
+        params = {"cursor": cursor}
+
+    assert len(ids) == len(set(ids)) == 1005
@@ -0,0 +1,12 @@
+import asyncio
+
+from app import crud, prompts, schemas
+
+
+def test_system_prompt_lists_user_colors(db, users):
+    crud.create_user(db, schemas.UserCreate(name="ellen", color="#7986cb"))
+
+    content = asyncio.run(prompts.system_message(db))["content"]
+
+    assert f"- albin (ID: {users[0].id}, #3b82f6)" in content
+    assert "- ellen (ID: 3, lila)" in content
@@ -0,0 +1,54 @@
+import random
+from datetime import datetime, timedelta
+
+from app import models
+from app.recurrence import (
+    expand_recurrences_batch,
+    first_occurrence_at_or_after,
+    iter_recurrence_instances,
+    next_occurrence_at_or_after,
+    occurrence_start,
+)
+
+
+def _series(event_id: int, start: datetime, recurrence_type: str = "monthly", interval: int = 1, end=None):
+    return models.Event(
+        id=event_id, title=f"Serie {event_id}", start_time=start, end_time=start + timedelta(hours=1),
+        recurrence_type=recurrence_type, recurrence_interval=interval, recurrence_end_date=end,
+    )
+
+
+def _brute_first(event, start_date: datetime) -> int:
+    occurrence = 0
+    while occurrence_start(event, occurrence) < start_date:
+        occurrence += 1
+    return occurrence
+
+
+def test_monthly_same_month_after_start_skips_first_occurrence():
+    event = _series(1, datetime(2026, 3, 20, 9))
+    assert first_occurrence_at_or_after(event, datetime(2026, 3, 25)) == 1
+    assert next_occurrence_at_or_after(event, datetime(2026, 3, 25)) == datetime(2026, 4, 20, 9)
+    assert first_occurrence_at_or_after(event, datetime(2026, 3, 20, 9)) == 0
+    assert first_occurrence_at_or_after(event, datetime(2026, 2, 1)) == 0
+
+
+def test_scalar_matches_batch_and_brute_force():
+    rng = random.Random(4)
+    for event_id in range(1, 300):
+        recurrence_type = rng.choice(["daily", "weekly", "monthly", "monthly"])
+        start = datetime(2025, rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 23), rng.choice([0, 30]))
+        if recurrence_type == "monthly" and rng.random() < 0.3:
+            start = start.replace(month=rng.choice([1, 3, 5, 7, 8, 10, 12]), day=rng.choice([29, 30, 31]))
+        end = start + timedelta(days=rng.randint(20, 700)) if rng.random() < 0.5 else None
+        event = _series(event_id, start, recurrence_type, rng.randint(1, 3), end)
+
+        # Fönster som ofta börjar i samma månad som serien, efter startdagen
+        window_start = start + timedelta(days=rng.randint(-40, 400), hours=rng.randint(0, 23))
+        window_end = window_start + timedelta(days=rng.randint(1, 120))
+
+        assert first_occurrence_at_or_after(event, window_start) == _brute_first(event, window_start)
+
+        scalar = [(i.start_time, i.id) for i in iter_recurrence_instances(event, window_start, window_end)]
+        batch = [(i.start_time, i.id) for i in expand_recurrences_batch([event], window_start, window_end)]
+        assert scalar == batch
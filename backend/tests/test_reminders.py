@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+from app import crud, models, schemas
+from app.reminders import ReminderScheduler
+
+
+def _monthly_with_reminder(db, user_id: int):
+    # Påminnelsen (15 min innan) är 10 minuter sen, inom REMINDER_GRACE_SECONDS
+    start = datetime.utcnow().replace(microsecond=0) + timedelta(minutes=5)
+    return crud.create_event(db, schemas.EventCreate(
+        title="Pianolektion", start_time=start, end_time=start + timedelta(hours=1),
+        user_id=user_id, reminder_enabled=True, reminder_minutes=15, recurrence_type="monthly",
+    ))
+
+
+def test_monthly_reminder_fires_once_and_moves_forward(db, users):
+    event = _monthly_with_reminder(db, users[0].id)
+    # Som om den schemalagts innan förekomsten började närma sig
+    due = event.start_time - timedelta(minutes=15)
+    db.query(models.Event).filter(models.Event.id == event.id).update({"next_reminder_at": due})
+    db.commit()
+
+    scheduler = ReminderScheduler()
+    next_due = scheduler._fire(event.id, due)
+    assert next_due is not None and next_due > due
+    assert next_due.month != due.month
+
+    # Samma post igen (t.ex. från en omläsning) ska inte ge en ny notifikation
+    assert scheduler._fire(event.id, due) is None
+    assert db.query(models.NotificationOutbox).count() == 1
+
+
+def test_missed_reminders_catch_up_from_now(db, users):
+    start = datetime.utcnow().replace(microsecond=0) - timedelta(days=10)
+    event = crud.create_event(db, schemas.EventCreate(
+        title="Träning", start_time=start, end_time=start + timedelta(hours=1),
+        user_id=users[0].id, reminder_enabled=True, reminder_minutes=0, recurrence_type="daily",
+    ))
+    stale_due = start
+    db.query(models.Event).filter(models.Event.id == event.id).update({"next_reminder_at": stale_due})
+    db.commit()
+
+    next_due = ReminderScheduler()._fire(event.id, stale_due)
+    assert next_due > datetime.utcnow() - timedelta(seconds=1)
+    # Utanför REMINDER_GRACE_SECONDS: ingen notifikation för den missade påminnelsen
+    assert db.query(models.NotificationOutbox).count() == 0
+
+
+def test_create_and_update_with_utc_suffixed_times(client, users):
+    payload = {
+        "title": "Tandläkare",
+        "start_time": "2030-05-14T08:00:00.000Z",
+        "end_time": "2030-05-14T09:00:00.000Z",
+        "user_id": users[0].id,
+        "reminder_enabled": True,
+        "reminder_minutes": 30,
+        "recurrence_type": "monthly",
+        "recurrence_end_date": "2030-12-31T22:59:59.000Z",
+    }
+    response = client.post("/api/events", json=payload)
+    assert response.status_code == 200, response.text
+    event_id = response.json()["id"]
+
+    response = client.put(f"/api/events/{event_id}", json={
+        "start_time": "2030-05-15T08:00:00Z", "end_time": "2030-05-15T09:00:00+00:00"
+    })
+    assert response.status_code == 200, response.text
+    assert response.json()["start_time"].startswith("2030-05-15T08:00:00")
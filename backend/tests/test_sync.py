@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+from app import crud, models
+
+
+def _create(client, user_id: int, title: str):
+    response = client.post("/api/events", json={
+        "title": title, "start_time": "2030-04-01T10:00:00Z", "end_time": "2030-04-01T11:00:00Z",
+        "user_id": user_id,
+    })
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def test_initial_sync_is_paged(client, users, monkeypatch):
+    monkeypatch.setattr(crud, "SYNC_PAGE_SIZE", 2)
+    ids = [_create(client, users[0].id, f"Läxhjälp {i}") for i in range(5)]
+
+    seen, tokens, params = [], set(), {}
+    while True:
+        page = client.get("/api/events/changes", params=params).json()
+        assert len(page["created"]) <= 2 and not page["reset"]
+        seen.extend(event["id"] for event in page["created"])
+        tokens.add(page["next_token"])
+        if not page["next_cursor"]:
+            break
+        params = {"cursor": page["next_cursor"]}
+
+    assert seen == ids
+    # Alla sidor ger synkens starttid som token
+    assert len(tokens) == 1
+
+
+def test_old_token_gets_full_resync_and_tombstones_are_pruned(client, db, users):
+    kept = _create(client, users[0].id, "Kör")
+    removed = _create(client, users[0].id, "Gympa")
+    old = datetime.utcnow() - crud.SYNC_TOMBSTONE_RETENTION - timedelta(days=1)
+    db.add(models.EventDeletion(event_id=999, deleted_at=old))
+    db.commit()
+
+    assert client.delete(f"/api/events/{removed}").status_code == 200
+    db.expire_all()
+    assert [row.event_id for row in db.query(models.EventDeletion)] == [removed]
+
+    page = client.get("/api/events/changes", params={"since": crud.encode_sync_token(old)}).json()
+    assert page["reset"] is True
+    assert [event["id"] for event in page["created"]] == [kept]
+    assert page["deleted"] == []
@@ -0,0 +1,33 @@
+from app.main import MULTIPART_OVERHEAD_BYTES, TRANSCRIBE_MAX_BYTES
+
+ORIGIN = "http://localhost:5173"
+
+
+def test_too_large_transcription_gets_cors_headers(client):
+    response = client.post(
+        "/api/ai/transcribe",
+        files={"audio": ("röst.webm", b"\0" * (TRANSCRIBE_MAX_BYTES + MULTIPART_OVERHEAD_BYTES + 1), "audio/webm")},
+        headers={"Origin": ORIGIN},
+    )
+    assert response.status_code == 413
+    assert response.headers["access-control-allow-origin"] in ("*", ORIGIN)
+    assert response.json()["success"] is False
+
+
+
+def test_file_of_exactly_max_size_passes_the_size_checks(client):
+    # Fel filformat så att inget skickas till Groq; storlekskontrollerna kommer först
+    response = client.post(
+        "/api/ai/transcribe", files={"audio": ("röst.txt", b"\0" * TRANSCRIBE_MAX_BYTES, "text/plain")}
+    )
+    assert response.status_code == 200
+    assert response.json()["error"].startswith("Ogiltigt filformat")
+
+
+def test_file_just_over_max_size_is_rejected_by_the_endpoint(client):
+    response = client.post(
+        "/api/ai/transcribe", files={"audio": ("röst.webm", b"\0" * (TRANSCRIBE_MAX_BYTES + 1), "audio/webm")}
+    )
+    assert response.status_code == 200
+    assert response.json()["success"] is False
+    assert response.json()["error"].startswith("Filen är för stor")
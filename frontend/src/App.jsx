@@ -102,12 +102,27 @@ function App() {
     fetchUsersAndEvents()
   }, [])
 
+  // Hämta alla events: API:t returnerar en sida i taget och anger nästa
+  // sida i headern X-Next-Cursor, som följs tills den saknas
+  const fetchAllEvents = async () => {
+    const allEvents = []
+    let cursor = null
+    do {
+      const response = await axios.get(`${API_URL}/events`, {
+        params: cursor ? { cursor } : {}
+      })
+      allEvents.push(...response.data)
+      cursor = response.headers['x-next-cursor'] || null
+    } while (cursor)
+    return { data: allEvents }
+  }
+
   // Hämta användare och events parallellt
   const fetchUsersAndEvents = async () => {
     try {
       const [usersResponse, eventsResponse] = await Promise.all([
         axios.get(`${API_URL}/users`),
-        axios.get(`${API_URL}/events`)
+        fetchAllEvents()
       ])
 
       // Uppdatera users
@@ -154,7 +169,7 @@ function App() {
 
   const fetchEvents = async () => {
     try {
-      const response = await axios.get(`${API_URL}/events`)
+      const response = await fetchAllEvents()
       const formattedEvents = response.data.map(event => ({
         id: event.id,
         title: event.title,
@@ -9,6 +9,52 @@ const generateSessionId = () => {
   return `session_${Date.now()}_${Math.random().toString(36).substring(2, 9)}`
 }
 
+// Skicka ett meddelande till /ai/chat/stream och läs Server-Sent Events.
+// Returnerar done-händelsen (samma fält som svaret från /ai/chat).
+const streamChat = async (payload, { onStatus, onToken }) => {
+  const response = await fetch(`${API_URL}/ai/chat/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(payload)
+  })
+
+  if (!response.ok || !response.body) {
+    throw new Error(`HTTP ${response.status}`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+
+  while (true) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+
+    // Händelser separeras av en tom rad
+    let boundary
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary)
+      buffer = buffer.slice(boundary + 2)
+
+      let eventType = 'message'
+      let data = ''
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event: ')) eventType = line.slice(7)
+        else if (line.startsWith('data: ')) data += line.slice(6)
+      }
+      if (!data) continue
+
+      const parsed = JSON.parse(data)
+      if (eventType === 'status') onStatus(parsed.message)
+      else if (eventType === 'token') onToken(parsed.content)
+      else if (eventType === 'done') return parsed
+    }
+  }
+
+  throw new Error('Strömmen avbröts innan svaret var klart')
+}
+
 function AIChatBanner({ onEventCreated }) {
   const [isOpen, setIsOpen] = useState(false)
   const [message, setMessage] = useState('')
@@ -17,6 +63,8 @@ function AIChatBanner({ onEventCreated }) {
   const [sessionId] = useState(generateSessionId())
   const [isRecording, setIsRecording] = useState(false)
   const [isTranscribing, setIsTranscribing] = useState(false)
+  const [statusText, setStatusText] = useState('')
+  const [streamingText, setStreamingText] = useState('')
   const messagesEndRef = useRef(null)
   const inputRef = useRef(null)
   const mediaRecorderRef = useRef(null)
@@ -29,7 +77,7 @@ function AIChatBanner({ onEventCreated }) {
 
   useEffect(() => {
     scrollToBottom()
-  }, [conversationHistory])
+  }, [conversationHistory, streamingText])
 
   // Fokusera input när chatten öppnas
   useEffect(() => {
@@ -168,14 +216,24 @@ function AIChatBanner({ onEventCreated }) {
     setConversationHistory(newHistory)
 
     try {
-      const response = await axios.post(`${API_URL}/ai/chat`, {
+      // Strömmande svar: status och text visas medan AI:n arbetar
+      const result = await streamChat({
         message: userMessage,
         session_id: sessionId,
         conversation_history: conversationHistory
+      }, {
+        onStatus: (status) => {
+          setStatusText(status)
+          setStreamingText('')
+        },
+        onToken: (token) => {
+          setStatusText('')
+          setStreamingText(prev => prev + token)
+        }
       })
 
-      if (response.data.success) {
-        setConversationHistory(response.data.conversation_history)
+      if (result.success) {
+        setConversationHistory(result.conversation_history)
         if (onEventCreated) {
           onEventCreated()
         }
@@ -184,7 +242,7 @@ function AIChatBanner({ onEventCreated }) {
           ...newHistory,
           {
             role: 'assistant',
-            content: response.data.error || 'Ett fel uppstod. Försök igen.'
+            content: result.error || 'Ett fel uppstod. Försök igen.'
           }
         ])
       }
@@ -199,6 +257,8 @@ function AIChatBanner({ onEventCreated }) {
       ])
     } finally {
       setIsLoading(false)
+      setStatusText('')
+      setStreamingText('')
     }
   }
 
@@ -258,11 +318,18 @@ function AIChatBanner({ onEventCreated }) {
               <div className="ai-message assistant">
                 <div className="message-icon">🤖</div>
                 <div className="message-content">
-                  <div className="typing-indicator">
-                    <span></span>
-                    <span></span>
-                    <span></span>
-                  </div>
+                  {streamingText ? (
+                    streamingText
+                  ) : (
+                    <>
+                      {statusText && <div className="ai-status">{statusText}</div>}
+                      <div className="typing-indicator">
+                        <span></span>
+                        <span></span>
+                        <span></span>
+                      </div>
+                    </>
+                  )}
                 </div>
               </div>
             )}